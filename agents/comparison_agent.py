@@ -1,11 +1,33 @@
 # agents/comparison_agent.py - Specialized Comparative Analysis Agent
 
+import asyncio
 import streamlit as st
-from langchain_openai import ChatOpenAI
+from functools import lru_cache
+from typing import List, Tuple
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from config import settings, prompts
+from utils.async_utils import run_async
+from utils.llm_clients import get_openai
+from utils.rate_limiter import openai_bucket, estimate_tokens, RESPONSE_TOKEN_ALLOWANCE
+from utils.response_cache import response_cache, retriever_corpus_fingerprint
+from utils.timing_callback import make_run_config
+
+# The comparison prompt is compiled once in config/prompts.py (static system
+# instructions first, then the context and the request).
+COMPARISON_PROMPT = prompts.COMPARISON_PROMPT
+
+# Separator placed between content blocks from different document chunks.
+COMPARISON_SEPARATOR = "\n\n================================\n\n"
+
+@lru_cache(maxsize=128)
+def _format_comparison_blocks(blocks: Tuple[Tuple[str, str], ...]) -> str:
+    """Builds the comparison context from (source, content) pairs. Memoized, so a
+    repeated query over the same chunks reuses the already-formatted context."""
+    return COMPARISON_SEPARATOR.join(
+        f"--- START OF CONTENT FROM: {source} ---\n\n{content}\n\n--- END OF CONTENT FROM: {source} ---"
+        for source, content in blocks
+    )
 
 def format_docs_for_comparison(docs: list) -> str:
     """
@@ -18,24 +40,60 @@ def format_docs_for_comparison(docs: list) -> str:
     Returns:
         str: A formatted string with clear source indicators for each document chunk.
     """
-    formatted_texts = []
-    for doc in docs:
-        # Extract the source filename from the metadata
-        source = doc.metadata.get("source", "Unknown Source")
-        # Prepend the source to the content for clarity
-        formatted_text = f"--- START OF CONTENT FROM: {source} ---\n\n{doc.page_content}\n\n--- END OF CONTENT FROM: {source} ---"
-        formatted_texts.append(formatted_text)
-    
-    # Join all formatted blocks with a clear separator
-    return "\n\n================================\n\n".join(formatted_texts)
+    # The cache key is built from the sources and contents themselves (not object ids,
+    # which Python may reuse for different documents after garbage collection).
+    return _format_comparison_blocks(
+        tuple((doc.metadata.get("source", "Unknown Source"), doc.page_content) for doc in docs)
+    )
+
+def find_mentioned_sources(retriever, query: str) -> List[str]:
+    """
+    Finds which indexed source files are named in the user's comparison request.
+
+    Args:
+        retriever: The configured vector store retriever.
+        query (str): The user's request to compare documents.
+
+    Returns:
+        List[str]: The sorted source names that appear verbatim in the query.
+    """
+    docstore = getattr(getattr(retriever, "vectorstore", None), "docstore", None)
+    all_sources = {doc.metadata.get("source") for doc in getattr(docstore, "_dict", {}).values()}
+    return sorted(source for source in all_sources if source and source in query)
+
+async def retrieve_per_source(retriever, query: str, sources: List[str], k: int = 4) -> list:
+    """
+    Retrieves the top-k chunks from EACH source concurrently. A single global top-k
+    is often dominated by one document, so one search is scoped to each source.
+    FAISS applies the source filter after the search, so every search considers the
+    whole corpus (`fetch_k` = index size); otherwise a source with no chunk among the
+    nearest few overall would come back empty.
+
+    Args:
+        retriever: The configured vector store retriever.
+        query (str): The user's request to compare documents.
+        sources (List[str]): The source names to retrieve from.
+        k (int): The number of chunks to fetch per source.
+
+    Returns:
+        list: The retrieved documents, grouped by source.
+    """
+    fetch_k = max(k, retriever.vectorstore.index.ntotal)
+    scoped_retrievers = [
+        retriever.vectorstore.as_retriever(search_kwargs={"k": k, "fetch_k": fetch_k, "filter": {"source": source}})
+        for source in sources
+    ]
+    docs_lists = await asyncio.gather(*[r.ainvoke(query) for r in scoped_retrievers])
+    return [doc for docs in docs_lists for doc in docs]
 
 def execute_comparison_chain(retriever, query: str):
     """
     Executes a chain designed specifically for comparing information across documents.
 
     This function follows a structured process:
-    1.  Configures the retriever to fetch a larger number of documents to ensure
-        it gets context from all relevant sources for comparison.
+    1.  Retrieves context from every document named in the request concurrently
+        (or, failing that, fetches a larger number of chunks) so that all relevant
+        sources are represented in the comparison.
     2.  Sets up a powerful language model (GPT-4o) capable of complex reasoning.
     3.  Uses a specialized prompt that guides the LLM to perform a structured comparison.
     4.  Formats the retrieved documents to clearly label their sources before
@@ -48,45 +106,63 @@ def execute_comparison_chain(retriever, query: str):
     Returns:
         A structured comparative analysis from the language model.
     """
+    # --- 0. Response Cache Lookup ---
+    # An identical request against the same corpus is answered straight from the cache.
+    cache_key = response_cache.make_key(query, retriever_corpus_fingerprint(retriever), settings.REPORT_MODEL)
+    if (cached_answer := response_cache.get(cache_key)) is not None:
+        print("Comparison Agent: returning cached response.")
+        return cached_answer
+
     # --- 1. LLM Configuration ---
     # A powerful model is essential for the nuanced task of comparison.
+    # The client is shared across calls, so its HTTP connections stay warm.
     try:
-        llm = ChatOpenAI(
-            model=settings.REPORT_MODEL,  # GPT-4o is excellent for this
-            openai_api_key=settings.OPENAI_API_KEY,
-            temperature=0.3,  # Low temperature to keep the analysis factual and grounded
-            max_tokens=4000
+        llm = get_openai(
+            settings.REPORT_MODEL,  # GPT-4o is excellent for this
+            0.3,  # Low temperature to keep the analysis factual and grounded
+            4000,
         )
     except Exception as e:
         st.error(f"Failed to initialize the OpenAI model: {e}")
         return "Error: Could not connect to the comparison service."
 
-    # --- 2. Prompt Template ---
-    # We use the dedicated comparison prompt defined in our config.
-    prompt = ChatPromptTemplate.from_template(prompts.COMPARISON_PROMPT_TEMPLATE)
+    # --- 2. Retriever Configuration ---
+    # If the request names two or more indexed documents, we search each of them
+    # separately (and concurrently). Otherwise we fall back to one wide search, fetching
+    # more documents than usual to get context from all the files being compared.
+    sources = find_mentioned_sources(retriever, query)
+    if len(sources) >= 2:
+        print(f"Retrieving per-source context for comparison from: {sources}")
+    else:
+        retriever.search_kwargs['k'] = 12  # Increase 'k' to fetch more chunks
+        print(f"Retriever configured to fetch up to {retriever.search_kwargs['k']} chunks for comparison.")
 
-    # --- 3. Retriever Configuration ---
-    # For comparison, we need to retrieve more documents to ensure we have
-    # context from all the files the user wants to compare.
-    retriever.search_kwargs['k'] = 12  # Increase 'k' to fetch more chunks
-    print(f"Retriever configured to fetch up to {retriever.search_kwargs['k']} chunks for comparison.")
+    async def aretrieve_context(q: str) -> list:
+        if len(sources) >= 2:
+            return await retrieve_per_source(retriever, q, sources)
+        return await retriever.ainvoke(q)
 
-    # --- 4. LangChain Expression Language (LCEL) Chain ---
+    # --- 3. LangChain Expression Language (LCEL) Chain ---
     # This chain is optimized for comparison tasks.
     comparison_chain = (
-        {"context": retriever | format_docs_for_comparison, "input": RunnablePassthrough()}
-        | prompt
+        {
+            "context": RunnableLambda(lambda q: run_async(aretrieve_context(q)), afunc=aretrieve_context) | format_docs_for_comparison,
+            "input": RunnablePassthrough(),
+        }
+        | COMPARISON_PROMPT
         | llm
     )
 
-    # --- 5. Invocation and Output ---
+    # --- 4. Invocation and Output ---
     st.info("The Comparison Agent is performing a deep analysis across documents...")
     print("Executing Comparison Agent (OpenAI) with specialized chain...")
     
     try:
-        # Invoke the chain with the user's comparison query.
-        result = comparison_chain.invoke(query)
+        # Wait for rate-limit capacity, then invoke the chain with the user's comparison query.
+        openai_bucket.acquire_sync(estimate_tokens(query) + RESPONSE_TOKEN_ALLOWANCE)
+        result = comparison_chain.invoke(query, config=make_run_config("comparison_chain"))
         final_answer = result.content
+        response_cache.set(cache_key, final_answer)
     except Exception as e:
         # Handle potential errors during the API call.
         print(f"ERROR in Comparison Agent invocation: {e}")
@@ -1,39 +1,46 @@
 # agents/debug_agent.py
 
-import streamlit as st
+from utils.async_utils import show_message
+from utils.response_cache import response_cache, retriever_corpus_fingerprint
 
-def execute_debug_chain(retriever, query: str) -> str:
+async def execute_debug_chain(retriever, query: str) -> str:
     """
     This is not a real agent. It's a debugging tool.
-    It takes a query, uses the retriever to find relevant documents,
-    and then simply SHOWS what it found, instead of sending it to an LLM.
+    It takes a query, runs the vector search behind the retriever, and then simply
+    SHOWS what it found (with similarity scores), instead of sending it to an LLM.
     This helps us see exactly what context the real agents are working with.
     """
     print(f"DEBUG AGENT: Retrieving documents for query: '{query}'")
     
     try:
-        # Use the retriever to get the relevant document chunks
-        retrieved_docs = retriever.get_relevant_documents(query)
+        cache_key = response_cache.make_key(query, retriever_corpus_fingerprint(retriever), "debug")
+        if (cached_response := response_cache.get(cache_key)) is not None:
+            return cached_response
+
+        # Query the vector store directly (without blocking) so we also get the scores.
+        k = retriever.search_kwargs.get('k', 8)
+        retrieved_docs_with_scores = await retriever.vectorstore.asimilarity_search_with_score(query, k=k)
         
         # Check if any documents were found
-        if not retrieved_docs:
+        if not retrieved_docs_with_scores:
             return "**DEBUG RESULT:**\n\nThe retriever did not find ANY relevant documents for your query. This is why the Q&A agent cannot answer."
         
-        # If documents were found, format them for display
-        response = "**DEBUG RESULT:**\n\nThe retriever found the following content to answer your query:\n\n---\n"
+        # If documents were found, format them for display. The pieces are collected
+        # in a list and joined once, instead of re-copying the string on every `+=`.
+        parts = [f"**DEBUG RESULT:**\n\nThe retriever found the following top-{k} content to answer your query (score = cosine similarity, higher is closer):\n\n---\n"]
         
-        for i, doc in enumerate(retrieved_docs):
+        for i, (doc, score) in enumerate(retrieved_docs_with_scores):
             source = doc.metadata.get('source', 'Unknown')
             content_preview = doc.page_content[:500] # Show a preview of the content
+            parts.append(f"**Chunk {i+1} (from: {source}, score: {score:.4f})**\n```text\n{content_preview}...\n```\n---\n")
             
-            response += f"**Chunk {i+1} (from: {source})**\n"
-            response += f"```text\n{content_preview}...\n```\n---\n"
-            
-        response += "\nIf this content does not contain the answer, the Q&A agent will fail. Check if the content of your files is correct."
+        parts.append("\nIf this content does not contain the answer, the Q&A agent will fail. Check if the content of your files is correct.")
+        response = "".join(parts)
         
+        response_cache.set(cache_key, response)
         return response
         
     except Exception as e:
         error_message = f"**DEBUG ERROR:**\n\nAn error occurred during the retrieval process: {e}"
-        st.error(error_message)
-        return error_message
\ No newline at end of file
+        show_message("error", error_message)
+        return error_message
@@ -12,8 +12,8 @@
 # 1.  **Multi-Schema Extraction Engine:**
 #     Instead of one large, complex schema, this agent utilizes multiple, smaller,
 #     domain-specific schemas (e.g., for People/Orgs, Financial Data, Project Details).
-#     This modular approach allows the LLM to focus its "attention" on one type of
-#     information at a time, dramatically increasing the accuracy of the extraction.
+#     The schemas are merged into a single `COMBINED_SCHEMA` at call time so each
+#     chunk is sent to the LLM once, while `ALL_SCHEMAS` still drives categorization.
 #
 # 2.  **Intelligent Text Chunking for Large Documents:**
 #     The agent is designed to handle documents of any size. It includes a text
@@ -21,9 +21,9 @@
 #     It then runs the extraction process on each chunk and intelligently merges the
 #     unique entities found across all chunks, ensuring comprehensive analysis.
 #
-# 3.  **Powered by Gemini with Function Calling:**
-#     It leverages the powerful instruction-following and function-calling capabilities
-#     of the Google Gemini model, which is highly effective for structured data tasks.
+# 3.  **Powered by Gemini with Native Structured Output:**
+#     It leverages Gemini's native structured output (`with_structured_output`), so
+#     every response is parsed straight into a typed Pydantic model.
 #
 # 4.  **Structured DataFrame Output:**
 #     The final output is a clean, well-organized Pandas DataFrame, perfect for direct
@@ -38,16 +38,22 @@
 # --- Core & Third-Party Imports ---
 import streamlit as st
 import pandas as pd
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 
 # --- LangChain & Google Imports ---
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import create_extraction_chain
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from pydantic import Field, create_model
 
 # --- Project-Specific Imports ---
 from config import settings
+from utils.async_utils import iterate_in_loop, run_async
+from utils.llm_clients import get_gemini
+from utils.rate_limiter import gemini_bucket, estimate_tokens, RESPONSE_TOKEN_ALLOWANCE
 
 # ======================================================================================
 # SECTION 1: ADVANCED SCHEMA DEFINITIONS
@@ -114,37 +120,136 @@ ALL_SCHEMAS = {
     "Project Details": PROJECT_DETAILS_SCHEMA,
 }
 
+# All schemas merged into one, so each chunk is sent to the LLM only ONCE instead of
+# once per schema. Input tokens dominate the cost of a 16KB chunk, so this cuts the
+# request count and token usage of the extraction pass by a factor of len(ALL_SCHEMAS).
+COMBINED_SCHEMA = {
+    "properties": {
+        prop_name: prop
+        for schema in ALL_SCHEMAS.values()
+        for prop_name, prop in schema["properties"].items()
+    },
+    "required": [
+        prop_name
+        for schema in ALL_SCHEMAS.values()
+        for prop_name in schema["required"]
+    ],
+}
+
+# A typed model generated from COMBINED_SCHEMA for Gemini's native structured output.
+# Every field is a list of strings named exactly like its schema property, so results
+# map 1:1 onto the entity buckets without any key parsing.
+ExtractedEntities = create_model(
+    "ExtractedEntities",
+    __doc__="Relevant entities mentioned in a passage of text.",
+    **{
+        prop_name: (List[str], Field(default_factory=list, description=prop["description"]))
+        for prop_name, prop in COMBINED_SCHEMA["properties"].items()
+    },
+)
+
+EXTRACTION_PROMPT = ChatPromptTemplate.from_template(
+    "Extract and save the relevant entities mentioned in the following passage.\n\n"
+    "Passage:\n{input}"
+)
+
+# Maps each schema property back to the category it came from (e.g. "people" -> "Key Figures & Orgs").
+PROPERTY_CATEGORIES = {
+    prop_name: category
+    for category, schema in ALL_SCHEMAS.items()
+    for prop_name in schema["properties"]
+}
+
 # ======================================================================================
 # SECTION 2: CORE EXTRACTION LOGIC
 # ======================================================================================
 
-def run_single_extraction(llm: ChatGoogleGenerativeAI, text_chunk: str, schema: Dict, schema_name: str) -> List:
+# Token budget of a single extraction chunk.
+EXTRACTION_CHUNK_TOKENS = 3500
+
+# A token-aware splitter, built once at import time and shared by every run. Splitting
+# by tokens (not characters) fills each chunk close to the budget without overflowing it.
+_SPLITTER = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    model_name="gpt-4", chunk_size=EXTRACTION_CHUNK_TOKENS, chunk_overlap=200
+)
+
+@lru_cache(maxsize=32)
+def split_document_text(source: str, content: str) -> Tuple[str, ...]:
     """
-    Runs a single extraction chain for a given text chunk and schema.
-    
+    Splits a document into extraction-sized chunks. Memoized per (source, content),
+    so re-running extraction on the same document skips re-tokenization entirely.
+
     Args:
-        llm: The initialized Gemini model instance.
-        text_chunk: A piece of text to extract entities from.
-        schema: The JSON schema defining what to extract.
-        schema_name: The name of the schema (for logging).
+        source: The document's source name.
+        content: The full text of the document.
+
+    Returns:
+        A tuple of text chunks.
+    """
+    return tuple(_SPLITTER.split_text(content))
+
+async def _throttle(inputs: Dict) -> Dict:
+    """
+    Waits for Gemini rate-limit capacity before a chunk is handed to the extraction
+    chain. Composed in front of the chain so throttling also applies inside `.abatch`.
+    """
+    await gemini_bucket.acquire(estimate_tokens(inputs["input"]) + RESPONSE_TOKEN_ALLOWANCE)
+    return inputs
+
+def build_extraction_chain(llm: ChatGoogleGenerativeAI):
+    """
+    Builds the throttled, structured-output extraction chain for the given model.
+    """
+    # Gemini's native structured output forces the response into the `ExtractedEntities`
+    # model directly, with no extra JSON re-parsing layer in between.
+    structured_llm = llm.with_structured_output(ExtractedEntities, method="function_calling")
+    return RunnableLambda(_throttle) | EXTRACTION_PROMPT | structured_llm
+
+async def run_single_extraction(llm: ChatGoogleGenerativeAI, text_chunk: str) -> List[Dict[str, List[str]]]:
+    """
+    Fast path for documents that fit in a single chunk: one direct call, with no
+    batching machinery around it.
 
     Returns:
-        The raw list output from the LangChain extraction chain.
+        A one-item list with the chunk's {property name: entities} dictionary.
     """
     try:
-        # `create_extraction_chain` is a powerful function that uses the LLM's
-        # function-calling capabilities to force a structured JSON output.
-        extraction_chain = create_extraction_chain(schema, llm)
-        print(f"  - Running extraction for schema: '{schema_name}'...")
-        
-        # Invoke the chain with the text chunk.
-        extracted_results = extraction_chain.invoke({"input": text_chunk})
-        
-        # The result is a dictionary, with the data inside the "text" key.
-        return extracted_results.get("text", [])
+        result = await build_extraction_chain(llm).ainvoke({"input": text_chunk})
+        return [result.model_dump() if result is not None else {}]
     except Exception as e:
-        print(f"  - WARNING: Extraction for schema '{schema_name}' failed: {e}")
-        return []
+        print(f"  - WARNING: Extraction failed: {e}")
+        return [{}]
+
+async def run_batch_extraction(llm: ChatGoogleGenerativeAI, text_chunks: List[str]) -> AsyncIterator[Tuple[int, Dict[str, List[str]]]]:
+    """
+    Runs the combined-schema extraction over all chunks with a single
+    `.abatch_as_completed` call, yielding each chunk's result as soon as it finishes
+    so the caller can advance a progress bar. The chain is built once and reused for
+    every chunk, so the model client and its HTTP session stay warm, and LangChain
+    enforces the concurrency limit internally.
+
+    Args:
+        llm: The initialized Gemini model instance.
+        text_chunks: The pieces of text to extract entities from.
+
+    Yields:
+        (chunk index, {property name: entities}) pairs in completion order; the
+        dictionary is empty for chunks whose extraction failed.
+    """
+    extraction_chain = build_extraction_chain(llm)
+    print(f"Dispatching {len(text_chunks)} extraction calls (max concurrency: {settings.EXTRACTION_CONCURRENCY})...")
+
+    async for i, result in extraction_chain.abatch_as_completed(
+        [{"input": chunk} for chunk in text_chunks],
+        config={"max_concurrency": settings.EXTRACTION_CONCURRENCY},
+        return_exceptions=True,
+    ):
+        if isinstance(result, Exception) or result is None:
+            # A single failed chunk must not sink the whole document.
+            print(f"  - WARNING: Extraction for chunk {i + 1} failed: {result}")
+            yield i, {}
+        else:
+            yield i, result.model_dump()
 
 def merge_extracted_results(all_results: Dict[str, set]) -> pd.DataFrame:
     """
@@ -158,21 +263,21 @@ def merge_extracted_results(all_results: Dict[str, set]) -> pd.DataFrame:
     """
     print("Merging all extracted entities into a final DataFrame...")
     
-    display_data = []
-    # Iterate through the dictionary of unique entities.
+    # Build the two columns directly instead of allocating one dict per row;
+    # pandas can then construct the frame from the columnar lists in one pass.
+    categories, values = [], []
     for entity_type, entity_set in all_results.items():
         if entity_set: # Only process if entities of this type were found.
-            for entity_name in sorted(list(entity_set)):
-                display_data.append({
-                    "Category": entity_type.replace("_", " ").title(),
-                    "Extracted Information": entity_name
-                })
+            # De-duplicate case-insensitively ("ACME Corp" and "acme corp " are the same entity).
+            unique_entities = sorted({str(e).strip().lower(): str(e).strip() for e in entity_set}.values())
+            categories.extend([entity_type.replace("_", " ").title()] * len(unique_entities))
+            values.extend(unique_entities)
     
-    if not display_data:
+    if not values:
         print("No entities were found across all schemas.")
         return pd.DataFrame([{"Status": "No specific entities could be extracted from this document."}])
         
-    final_df = pd.DataFrame(display_data)
+    final_df = pd.DataFrame({"Category": categories, "Extracted Information": values})
     print(f"Successfully created final DataFrame with {len(final_df)} entities.")
     return final_df
 
@@ -188,7 +293,8 @@ def execute_entity_extraction_chain(document: Document) -> Optional[pd.DataFrame
     1.  Validates API keys and input.
     2.  Initializes the Gemini model.
     3.  Chunks the document if it's too large.
-    4.  Iterates through each schema and each text chunk, running extraction.
+    4.  Runs one combined-schema extraction per chunk in a single batch, bounded by
+        `settings.EXTRACTION_CONCURRENCY`.
     5.  Collects and de-duplicates all found entities.
     6.  Formats the final results into a clean Pandas DataFrame.
 
@@ -215,66 +321,58 @@ def execute_entity_extraction_chain(document: Document) -> Optional[pd.DataFrame
     try:
         # For extraction, we want a model that is good at following instructions.
         # Gemini Flash is fast and cost-effective for this structured data task.
-        llm = ChatGoogleGenerativeAI(
-            model=settings.QNA_MODEL, # Using Gemini as requested
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=0.0 # Temperature must be 0 for predictable, non-creative extraction.
-        )
-        print(f"Entity Extraction LLM ({settings.QNA_MODEL}) initialized.")
+        # The client is cached and shared, so repeated runs reuse its HTTP connections.
+        # Temperature must be 0 for predictable, non-creative extraction.
+        llm = get_gemini(settings.EXTRACTION_MODEL, 0.0)
+        print(f"Entity Extraction LLM ({settings.EXTRACTION_MODEL}) initialized.")
     except Exception as e:
         error_message = f"Failed to initialize Google Gemini model for extraction: {e}"
         st.error(error_message)
         return None
 
     # --- Step 3: Text Chunking for Large Documents ---
-    # We create a text splitter to handle documents that might exceed the LLM's context window.
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=16000, chunk_overlap=800)
-    text_chunks = text_splitter.split_text(document.page_content)
+    # A document with no more characters than the chunk's token budget cannot exceed it
+    # (every token spans at least one character), so small documents skip the splitter.
+    # Larger ones go through the shared splitter to stay within the LLM's context window.
+    if len(document.page_content) <= EXTRACTION_CHUNK_TOKENS:
+        text_chunks = [document.page_content]
+    else:
+        text_chunks = list(split_document_text(document.metadata.get('source', 'Unknown'), document.page_content))
     print(f"Document split into {len(text_chunks)} chunk(s) for extraction.")
 
     # --- Step 4: Iterative Extraction Engine ---
     # This dictionary will store all unique entities found across all chunks and schemas.
     # Using a set automatically handles de-duplication.
-    all_unique_entities = {
-        "people": set(), "organizations": set(),
-        "monetary_values": set(), "key_percentages": set(),
-        "project_names": set(), "key_dates_and_deadlines": set(),
-    }
-
-    # Create a progress bar for the user.
-    st.info(f"Analyzing {len(text_chunks) * len(ALL_SCHEMAS)} data points. This may take a moment...")
-    progress_bar = st.progress(0, text="Starting entity extraction...")
-    total_steps = len(text_chunks) * len(ALL_SCHEMAS)
-    current_step = 0
-
-    # Loop through each text chunk...
-    for i, chunk in enumerate(text_chunks):
-        print(f"Processing chunk {i + 1}/{len(text_chunks)}...")
-        
-        # ...and for each chunk, loop through each extraction schema.
-        for schema_name, schema in ALL_SCHEMAS.items():
-            
-            # Update progress
-            current_step += 1
-            progress_bar.progress(current_step / total_steps, text=f"Analyzing for: {schema_name}")
-            
-            # Run the extraction for this specific schema and chunk.
-            raw_results = run_single_extraction(llm, chunk, schema, schema_name)
-            
-            # The result is a list (usually with one item) of dictionaries.
-            if raw_results:
-                for result_dict in raw_results:
-                    for entity_type, entity_list in result_dict.items():
-                        # The key in the result dict is something like "people_mentioned".
-                        # We need to match this to our `all_unique_entities` keys.
-                        # e.g., "people_mentioned" -> "people"
-                        matched_key = entity_type.split('_')[0]
-                        if matched_key in all_unique_entities and isinstance(entity_list, list):
-                            # Add all found entities to our set.
-                            for entity in entity_list:
-                                all_unique_entities[matched_key].add(entity)
-
-    progress_bar.progress(1.0, text="Extraction complete! Compiling results...")
+    # It is keyed by the exact schema property names, so results map over 1:1.
+    all_unique_entities = {prop_name: set() for prop_name in PROPERTY_CATEGORIES}
+
+    if len(text_chunks) == 1:
+        # Fast path: a single direct call, no progress bar or batching overhead.
+        with st.spinner("Extracting entities..."):
+            all_raw_results = run_async(run_single_extraction(llm, text_chunks[0]))
+        progress_bar = None
+    else:
+        # Create a progress bar for the user.
+        st.info(f"Analyzing {len(text_chunks)} chunk(s) across {len(ALL_SCHEMAS)} categories. This may take a moment...")
+        progress_bar = st.progress(0, text="Extracting entities...")
+        # Results stream back to this (script) thread as chunks finish, so the bar
+        # advances with every completion.
+        all_raw_results = [{} for _ in text_chunks]
+        for completed, (i, result_dict) in enumerate(iterate_in_loop(run_batch_extraction(llm, text_chunks)), start=1):
+            all_raw_results[i] = result_dict
+            progress_bar.progress(completed / len(text_chunks), text=f"Extracted {completed}/{len(text_chunks)} chunk(s)...")
+
+    # Each result is a dictionary keyed by the schema property names themselves
+    # (e.g. "key_percentages"), so entities go straight into their bucket.
+    for result_dict in all_raw_results:
+        for entity_type, entity_list in result_dict.items():
+            all_unique_entities[entity_type].update(entity_list)
+
+    for entity_type, entity_set in all_unique_entities.items():
+        print(f"  - [{PROPERTY_CATEGORIES.get(entity_type, 'Other')}] {entity_type}: {len(entity_set)} unique entities")
+
+    if progress_bar is not None:
+        progress_bar.progress(1.0, text="Extraction complete! Compiling results...")
     
     # --- Step 5: Format Final Output ---
     # Convert the dictionary of sets into a clean Pandas DataFrame.
@@ -22,78 +22,179 @@
 # ======================================================================================
 
 # --- Core LangChain and Third-Party Imports ---
-import streamlit as st
-from typing import List, Dict
+import asyncio
+from typing import List, Dict, AsyncIterator
+from cachetools import LRUCache
 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnablePassthrough, RunnableParallel
+from operator import itemgetter
+from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import create_history_aware_retriever
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnableParallel
+from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 
 from config import settings
+from utils.async_utils import show_message
+from utils.chain_cache import get_or_build_chain
+from utils.llm_clients import get_gemini
+from utils.rate_limiter import gemini_bucket, estimate_tokens, RESPONSE_TOKEN_ALLOWANCE
+from utils.response_cache import response_cache, retriever_corpus_fingerprint
+from utils.timing_callback import make_run_config
 
 # ======================================================================================
 # SECTION 1: CORE AGENT LOGIC (DEFINITIVE REWRITE)
 # ======================================================================================
 
+# Tag attached to the answer-generating chain, used to filter its streamed tokens.
+QA_ANSWER_TAG = "qa_answer"
+# Run name `create_retrieval_chain` gives its retrieval step; its output is the final
+# context, even when several retriever runs were fused into it.
+RETRIEVAL_RUN_NAME = "retrieve_documents"
+
+# Prompt to rephrase a follow-up question into a standalone question.
+# Prompts are static, so they are compiled once at import time rather than per request.
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = (
+    "Given a chat history and the latest user question "
+    "which might reference context in the chat history, "
+    "formulate a standalone question which can be understood "
+    "without the chat history. Do NOT answer the question, "
+    "just reformulate it if needed and otherwise return it as is."
+)
+CONTEXTUALIZE_Q_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+# Prompt to generate the final answer using the retrieved context.
+# Messages are ordered from most to least stable: the static instructions come first,
+# so the prompt prefix is byte-identical across turns and eligible for provider-side
+# prompt caching, followed by the retrieved context, the history and the question.
+QA_SYSTEM_PROMPT = """You are an expert assistant for question-answering tasks.
+    Use the following pieces of retrieved context to answer the question.
+    If you don't know the answer, just say that you don't know.
+    Keep the answer concise and professional.
+    """
+QA_CONTEXT_PROMPT = """CONTEXT:
+    {context}
+    """
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", QA_SYSTEM_PROMPT),
+    ("system", QA_CONTEXT_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+])
+
+# Rephrasing a follow-up question only needs the last few turns, so the contextualizer
+# sees a short window instead of the full transcript (the answer step keeps all of it).
+CONTEXTUALIZE_HISTORY_WINDOW = 4
+
+def _recent_history(inputs: Dict) -> Dict:
+    """Trims the chat history passed to the contextualizer to the latest messages."""
+    return {**inputs, "chat_history": inputs["chat_history"][-CONTEXTUALIZE_HISTORY_WINDOW:]}
+
+# Standalone questions produced by the rephrase step, keyed by (model, recent history,
+# question). Users often re-send the same follow-up, and this answers it from memory
+# before the request even reaches the (slower, on-disk) global LLM cache.
+_REPHRASE_CACHE = LRUCache(maxsize=256)
+
+def _has_no_history(inputs: Dict) -> bool:
+    """True on the first turn of a conversation, when there is nothing to rephrase."""
+    return not inputs.get("chat_history")
+
+def _rephrase_cache_key(llm, inputs: Dict) -> tuple:
+    """Builds the rephrase cache key from the same inputs the contextualizer sees."""
+    history = tuple(
+        (m.get("role"), m.get("content")) if isinstance(m, dict) else (m.type, m.content)
+        for m in inputs["chat_history"][-CONTEXTUALIZE_HISTORY_WINDOW:]
+    )
+    return (getattr(llm, "model", ""), history, inputs["input"])
+
+def create_cached_rephrase(llm):
+    """
+    Returns a runnable that turns a follow-up into a standalone question, memoizing the
+    result per (model, recent history, question).
+    """
+    rephrase_chain = RunnableLambda(_recent_history) | CONTEXTUALIZE_Q_PROMPT | llm | StrOutputParser()
+
+    def rephrase(inputs: Dict) -> str:
+        key = _rephrase_cache_key(llm, inputs)
+        if key not in _REPHRASE_CACHE:
+            _REPHRASE_CACHE[key] = rephrase_chain.invoke(inputs)
+        return _REPHRASE_CACHE[key]
+
+    async def arephrase(inputs: Dict) -> str:
+        key = _rephrase_cache_key(llm, inputs)
+        if key not in _REPHRASE_CACHE:
+            _REPHRASE_CACHE[key] = await rephrase_chain.ainvoke(inputs)
+        return _REPHRASE_CACHE[key]
+
+    return RunnableLambda(rephrase, afunc=arephrase)
+
+# Rank constant of reciprocal rank fusion; 60 is the standard value from the RRF paper.
+RRF_K = 60
+
+def _reciprocal_rank_fusion(results: Dict[str, List[Document]]) -> List[Document]:
+    """
+    Merges several ranked document lists into one. Each document scores
+    sum(1 / (RRF_K + rank)) over the lists it appears in, so documents that rank
+    well for both the raw and the rephrased question rise to the top.
+    """
+    scores: Dict[tuple, float] = {}
+    docs_by_key: Dict[tuple, Document] = {}
+    for docs in results.values():
+        for rank, doc in enumerate(docs):
+            key = (doc.metadata.get("source"), doc.page_content)
+            docs_by_key.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+    top_k = max((len(docs) for docs in results.values()), default=0)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs_by_key[key] for key in ranked[:top_k]]
+
+def create_history_aware_retrieval(retriever, llm):
+    """
+    Builds the retrieval step of the RAG chain.
+
+    - On the first turn (empty history) there is nothing to rephrase, so the raw
+      question goes straight to the retriever with no LLM call at all. The branch is
+      compiled once with the chain and evaluated per call.
+    - On follow-up turns, retrieval on the raw question runs in parallel with the
+      rephrase-then-retrieve path, and the two result lists are merged with reciprocal
+      rank fusion. This hides the raw retrieval behind the rephrase LLM call and
+      improves recall when the rephrasing drifts from the user's wording.
+    """
+    raw_retrieval = itemgetter("input") | retriever
+    rephrased_retrieval = create_cached_rephrase(llm) | retriever
+    return RunnableBranch(
+        (_has_no_history, raw_retrieval),
+        RunnableParallel(raw=raw_retrieval, rephrased=rephrased_retrieval) | RunnableLambda(_reciprocal_rank_fusion),
+    )
+
 def create_conversational_rag_chain(retriever, llm):
     """
     Creates the main RAG chain, enhanced to be history-aware and to guarantee
     a dictionary output with both answer and sources.
     """
-    # Prompt to rephrase a follow-up question into a standalone question
-    contextualize_q_system_prompt = (
-        "Given a chat history and the latest user question "
-        "which might reference context in the chat history, "
-        "formulate a standalone question which can be understood "
-        "without the chat history. Do NOT answer the question, "
-        "just reformulate it if needed and otherwise return it as is."
-    )
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system", contextualize_q_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-    
-    # This chain rephrases the question and then retrieves documents
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
+    # This chain rephrases the question (when there is history) and retrieves documents
+    history_aware_retriever = create_history_aware_retrieval(retriever, llm)
 
-    # Prompt to generate the final answer using the retrieved context
-    qa_system_prompt = """You are an expert assistant for question-answering tasks.
-    Use the following pieces of retrieved context to answer the question.
-    If you don't know the answer, just say that you don't know.
-    Keep the answer concise and professional.
+    # This chain takes the context and question and generates an answer.
+    # It is tagged so its tokens can be told apart from the rephrasing LLM's when streaming.
+    question_answer_chain = create_stuff_documents_chain(llm, QA_PROMPT).with_config(tags=[QA_ANSWER_TAG])
 
-    CONTEXT:
-    {context}
-    """
-    qa_prompt = ChatPromptTemplate.from_messages([
-        ("system", qa_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-
-    # This chain takes the context and question and generates an answer
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-
-    # --- THE DEFINITIVE FIX: USING RunnableParallel ---
-    # This `rag_chain` first runs the retriever to get documents, then passes those
-    # documents AND the original question to the `question_answer_chain`.
-    # `RunnableParallel` ensures that the `source_documents` are passed through alongside the answer.
-    rag_chain = RunnableParallel(
-        {"source_documents": history_aware_retriever, "question": RunnablePassthrough()}
-    ).assign(
-        answer=lambda x: question_answer_chain.invoke(
-            {
-                "context": x["source_documents"],
-                "input": x["question"]["input"],
-                "chat_history": x["question"]["chat_history"]
-            }
-        )
+    # --- RETRIEVAL CHAIN ---
+    # `create_retrieval_chain` runs the history-aware retriever, passes its documents
+    # as `context` to the `question_answer_chain`, and returns both. The question
+    # answering step is a native runnable rather than a nested `.invoke` call, so the
+    # chain streams, batches and runs async end-to-end.
+    retrieval_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+
+    # The UI expects the retrieved documents under `source_documents`. The rename is a
+    # native `RunnableParallel` of item getters rather than a Python closure, so every
+    # step of the chain stays batchable and async-aware.
+    rag_chain = retrieval_chain | RunnableParallel(
+        answer=itemgetter("answer"), source_documents=itemgetter("context")
     )
     
     return rag_chain
@@ -102,39 +203,129 @@ def create_conversational_rag_chain(retriever, llm):
 # SECTION 2: MAIN AGENT EXECUTION FUNCTION
 # ======================================================================================
 
-def execute_qa_chain(retriever, query: str, chat_history: List[Dict]) -> Dict:
+def _qa_cache_key(retriever, query: str, chat_history: List[Dict]) -> str:
+    """The answer depends on the conversation so far, so the history is part of the key."""
+    history_key = "|".join(f"{m.get('role')}:{m.get('content')}" for m in chat_history)
+    return response_cache.make_key(f"{query}|{history_key}", retriever_corpus_fingerprint(retriever), "gemini-1.5-flash")
+
+async def execute_qa_chain(retriever, query: str, chat_history: List[Dict], response: Dict) -> AsyncIterator[str]:
     """
     Executes the complete, conversational Q&A chain. This is the public-facing
-    function called by the UI. It now robustly returns a dictionary.
+    function called by the UI. Instead of blocking until the whole answer is ready,
+    it streams answer tokens as the model produces them, so the user sees the
+    response begin at time-to-first-token.
 
-    Returns:
-        A dictionary containing the 'answer' and 'source_documents'.
+    Args:
+        retriever: The configured vector store retriever.
+        query (str): The user's question.
+        chat_history (List[Dict]): The previous conversation turns.
+        response (Dict): A mutable container that is filled with the final 'answer'
+            and 'source_documents' once the stream has been fully consumed.
+
+    Yields:
+        str: Answer tokens, in order.
     """
     print("Executing Stable Conversational Q&A Agent (v11)...")
+    response.update({"answer": "", "source_documents": []})
 
     # --- Pre-execution Validation ---
     if not settings.GOOGLE_API_KEY:
-        error_msg = "Google Gemini API Key is not configured."
-        return {"answer": error_msg, "source_documents": []}
+        response["answer"] = "Google Gemini API Key is not configured."
+        yield response["answer"]
+        return
+
+    # --- Response Cache Lookup ---
+    cache_key = _qa_cache_key(retriever, query, chat_history)
+    if (cached_response := response_cache.get(cache_key)) is not None:
+        print("Q&A Agent: returning cached response.")
+        response.update(cached_response)
+        yield response["answer"]
+        return
 
     # --- LLM Initialization ---
     try:
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=settings.GOOGLE_API_KEY, temperature=0.2)
+        llm = get_gemini("gemini-1.5-flash", 0.2)
     except Exception as e:
-        error_msg = f"Failed to initialize Google Gemini model: {e}"
-        return {"answer": error_msg, "source_documents": []}
+        response["answer"] = f"Failed to initialize Google Gemini model: {e}"
+        yield response["answer"]
+        return
 
-    # --- Chain Creation & Invocation ---
+    # --- Chain Creation & Streaming Invocation ---
     try:
-        conversational_rag_chain = create_conversational_rag_chain(retriever, llm)
-        response_dict = conversational_rag_chain.invoke(
-            {"input": query, "chat_history": chat_history}
-        )
+        # The chain is compiled once per (retriever, model) and reused on later turns.
+        conversational_rag_chain = get_or_build_chain("qa", retriever, llm, create_conversational_rag_chain)
+        await gemini_bucket.acquire(estimate_tokens(query) + RESPONSE_TOKEN_ALLOWANCE)
+        answer_parts = []
+        async for event in conversational_rag_chain.astream_events(
+            {"input": query, "chat_history": chat_history},
+            config=make_run_config("qa_chain", answer_tag=QA_ANSWER_TAG),
+            version="v2",
+        ):
+            kind = event["event"]
+            if kind == "on_chain_end" and event["name"] == RETRIEVAL_RUN_NAME:
+                # Keep the (fused) documents that were actually used as context.
+                response["source_documents"] = event["data"].get("output", [])
+            elif kind == "on_chat_model_stream" and QA_ANSWER_TAG in event.get("tags", []):
+                # Only forward tokens of the final answer, not of the question rephrasing step.
+                token = event["data"]["chunk"].content
+                if token:
+                    answer_parts.append(token)
+                    yield token
+
+        response["answer"] = "".join(answer_parts)
         print("Q&A Agent finished execution successfully.")
-        return response_dict
+        response_cache.set(cache_key, {"answer": response["answer"], "source_documents": response["source_documents"]})
+
+    except Exception as e:
+        error_msg = f"An error occurred in the Q&A agent pipeline: {e}"
+        print(f"ERROR: {error_msg}")
+        show_message("error", error_msg)
+        response["answer"] = "Sorry, an internal error occurred. Please check the system logs."
+        yield response["answer"]
+
+async def aexecute_qa_chain(retriever, query: str, chat_history: List[Dict]) -> Dict:
+    """
+    Non-streaming async variant of `execute_qa_chain`. It awaits the whole chain with
+    `ainvoke`, so several questions (or other agents) can share one event loop instead
+    of each blocking a thread on its network round-trips.
+
+    Args:
+        retriever: The configured vector store retriever.
+        query (str): The user's question.
+        chat_history (List[Dict]): The previous conversation turns.
+
+    Returns:
+        Dict: A dictionary with the 'answer' and the 'source_documents'.
+    """
+    print("Executing Stable Conversational Q&A Agent (v11, async)...")
+    if not settings.GOOGLE_API_KEY:
+        return {"answer": "Google Gemini API Key is not configured.", "source_documents": []}
+
+    cache_key = _qa_cache_key(retriever, query, chat_history)
+    if (cached_response := response_cache.get(cache_key)) is not None:
+        print("Q&A Agent: returning cached response.")
+        return cached_response
+
+    try:
+        llm = get_gemini("gemini-1.5-flash", 0.2)
+    except Exception as e:
+        return {"answer": f"Failed to initialize Google Gemini model: {e}", "source_documents": []}
 
+    try:
+        conversational_rag_chain = get_or_build_chain("qa", retriever, llm, create_conversational_rag_chain)
+        await gemini_bucket.acquire(estimate_tokens(query) + RESPONSE_TOKEN_ALLOWANCE)
+        result = await asyncio.wait_for(
+            conversational_rag_chain.ainvoke(
+                {"input": query, "chat_history": chat_history},
+                config=make_run_config("qa_chain", answer_tag=QA_ANSWER_TAG),
+            ),
+            timeout=settings.RAG_CHAIN_TIMEOUT_MS / 1000,
+        )
+        print("Q&A Agent finished execution successfully.")
+        response_cache.set(cache_key, result)
+        return result
     except Exception as e:
         error_msg = f"An error occurred in the Q&A agent pipeline: {e}"
         print(f"ERROR: {error_msg}")
-        st.error(error_msg)
-        return {"answer": "Sorry, an internal error occurred. Please check the system logs.", "source_documents": []}
\ No newline at end of file
+        show_message("error", error_msg)
+        return {"answer": "Sorry, an internal error occurred. Please check the system logs.", "source_documents": []}
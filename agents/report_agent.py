@@ -4,16 +4,28 @@
 # to generate structured, comprehensive, and insightful reports.
 
 # --- Core LangChain and Third-Party Imports ---
-import streamlit as st
-from langchain_core.prompts import ChatPromptTemplate
+from typing import AsyncIterator
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains import create_retrieval_chain
 
 # --- Project-Specific Imports ---
 from config import settings, prompts
+from utils.async_utils import run_async, show_message
+from utils.chain_cache import get_or_build_chain
+from utils.llm_clients import get_openai
+from utils.rate_limiter import openai_bucket, estimate_tokens
+from utils.timing_callback import make_run_config
+
+# The report prompt is compiled once in config/prompts.py. The fixed instructions form
+# a stable system-message prefix; the retrieved context and the request follow it,
+# which maximizes provider-side prompt-prefix cache hits.
+REPORT_PROMPT = prompts.REPORT_PROMPT
+# Token length of the static prefix, computed once, for rate-limit budgeting.
+REPORT_STATIC_PROMPT_TOKENS = estimate_tokens(prompts.REPORT_SYSTEM_PROMPT)
+# Generous token limit for detailed reports.
+REPORT_MAX_TOKENS = 4000
 
 # ======================================================================================
 # --- Helper Function for Document Formatting ---
@@ -32,18 +44,58 @@ def format_retrieved_docs(docs: list) -> str:
     """
     # Using a clear separator helps the model understand document boundaries.
     separator = "\n\n--- Document Snippet ---\n\n"
-    formatted_string = separator.join([doc.page_content for doc in docs])
     
-    # Add a header for extra clarity to the LLM.
-    return f"Context from relevant documents:\n{formatted_string}"
+    # Overlapping retrievals often return the same chunk more than once; duplicates
+    # only waste prompt tokens, so they are dropped (keyed by source + full content).
+    seen = set()
+    def unique_contents():
+        for doc in docs:
+            key = (doc.metadata.get("source"), hash(doc.page_content))
+            if key not in seen:
+                seen.add(key)
+                yield doc.page_content
+    
+    # Add a header for extra clarity to the LLM. The generator avoids an intermediate list.
+    return "Context from relevant documents:\n" + separator.join(unique_contents())
+
+# ======================================================================================
+# --- Chain Construction ---
+# ======================================================================================
+
+def build_report_chain(retriever, llm):
+    """
+    Builds the report RAG chain. The chain only depends on the retriever and the LLM,
+    so it is built once and reused through `get_or_build_chain`.
+
+    Args:
+        retriever: The configured vector store retriever (from FAISS).
+        llm: The shared OpenAI chat model.
+
+    Returns:
+        The compiled LCEL chain, which takes the query string and returns the report.
+    """
+    # The flow is identical to the Q&A agent but uses the specialized report prompt and LLM.
+    # 1. Retrieve documents based on the query.
+    # 2. Format them into a single context string.
+    # 3. Pass the context and the original query to the prompt template.
+    # 4. Send the filled prompt to the powerful GPT-4o model.
+    # 5. Parse the output into a clean string.
+    return (
+        {"context": retriever | format_retrieved_docs, "input": RunnablePassthrough()}
+        | REPORT_PROMPT
+        | llm
+        | StrOutputParser()
+    )
 
 # ======================================================================================
 # --- Main Agent Execution Function ---
 # ======================================================================================
 
-def execute_report_chain(retriever, query: str):
+async def astream_report_chain(retriever, query: str) -> AsyncIterator[str]:
     """
-    Executes the complete Report Generation chain using the OpenAI GPT-4o model.
+    Executes the complete Report Generation chain using the OpenAI GPT-4o model,
+    streaming the report as it is written. A long report takes tens of seconds to
+    generate, so streaming lets the user start reading at time-to-first-token.
 
     This function is the powerhouse of the application, designed for complex synthesis.
 
@@ -58,70 +110,51 @@ def execute_report_chain(retriever, query: str):
         retriever: The configured vector store retriever (from FAISS).
         query (str): The user's detailed request for a report or summary.
 
-    Returns:
-        A string containing the formatted report generated by the OpenAI model,
+    Yields:
+        str: Chunks of the formatted report generated by the OpenAI model,
         or a user-friendly error message if the process fails.
     """
     # --- Step 1: Pre-execution Validation ---
     print("Executing Report Agent (OpenAI)...")
     if not settings.OPENAI_API_KEY:
         error_message = "OpenAI API Key is not configured. Please set it in your .env file or deployment secrets."
-        st.error(error_message)
+        show_message("error", error_message)
         print(f"ERROR: {error_message}")
-        return error_message
+        yield error_message
+        return
 
     # --- Step 2: Language Model (LLM) Initialization ---
     try:
-        # We initialize GPT-4o, a top-tier model ideal for complex reasoning,
+        # We use GPT-4o, a top-tier model ideal for complex reasoning,
         # synthesis, and following structured formatting instructions.
         # Temperature is balanced to allow for fluent writing while staying factual.
-        llm = ChatOpenAI(
-            model=settings.REPORT_MODEL,
-            openai_api_key=settings.OPENAI_API_KEY,
-            temperature=0.5,  # Allows for well-written, coherent text.
-            max_tokens=4000,  # Generous token limit for detailed reports.
+        # The client is shared across calls, so its HTTP connections stay warm.
+        llm = get_openai(
+            settings.REPORT_MODEL,
+            0.5,  # Allows for well-written, coherent text.
+            REPORT_MAX_TOKENS,
         )
-        print(f"Successfully initialized OpenAI model: {settings.REPORT_MODEL}")
     except Exception as e:
         error_message = f"Failed to initialize the OpenAI model: {e}"
-        st.error(error_message)
+        show_message("error", error_message)
         print(f"ERROR: {error_message}")
-        return "Error: Could not connect to the report generation service. Please check your OpenAI API key."
+        yield "Error: Could not connect to the report generation service. Please check your OpenAI API key."
+        return
 
-    # --- Step 3: Prompt Template Setup ---
-    try:
-        report_prompt = ChatPromptTemplate.from_template(prompts.REPORT_PROMPT_TEMPLATE)
-    except Exception as e:
-        error_message = f"Failed to load Report prompt template: {e}"
-        st.error(error_message)
-        print(f"ERROR: {error_message}")
-        return "Internal Error: Could not prepare the agent's instructions."
+    # --- Steps 3 & 4: Prompt and RAG Chain (compiled once per retriever) ---
+    rag_chain = get_or_build_chain("report", retriever, llm, build_report_chain)
 
-    # --- Step 4: Building the RAG Chain using LCEL ---
-    # This chain is structured to provide the maximum relevant context to the LLM.
-    
-    # The flow is identical to the Q&A agent but uses the specialized report prompt and LLM.
-    # 1. Retrieve documents based on the query.
-    # 2. Format them into a single context string.
-    # 3. Pass the context and the original query to the prompt template.
-    # 4. Send the filled prompt to the powerful GPT-4o model.
-    # 5. Parse the output into a clean string.
-    
-    rag_chain = (
-        {"context": retriever | format_retrieved_docs, "input": RunnablePassthrough()}
-        | report_prompt
-        | llm
-        | StrOutputParser()
-    )
-
-    # --- Step 5: Invoking the Chain and Final Output ---
-    final_answer = ""
-    st.info("The Report Agent is analyzing documents and compiling the report...")
+    # --- Step 5: Streaming the Chain Output ---
+    show_message("info", "The Report Agent is analyzing documents and compiling the report...")
     
     try:
-        print(f"Invoking Report RAG chain with query: '{query[:50]}...'")
-        # Run the entire pipeline. This might take a few seconds for complex reports.
-        final_answer = rag_chain.invoke(query)
+        # Reserve rate-limit capacity for the static prefix, the request and the answer.
+        await openai_bucket.acquire(REPORT_STATIC_PROMPT_TOKENS + estimate_tokens(query) + REPORT_MAX_TOKENS)
+        print(f"Streaming Report RAG chain with query: '{query[:50]}...'")
+        # `StrOutputParser` is stream-compatible, so each chunk is a plain text delta.
+        async for chunk in rag_chain.astream(query, config=make_run_config("report_chain")):
+            if chunk:
+                yield chunk
         
     except Exception as e:
         # This will catch common OpenAI API errors, like:
@@ -130,8 +163,21 @@ def execute_report_chain(retriever, query: str):
         # - APIConnectionError (if there's a network issue)
         error_message = f"An error occurred while generating the report from OpenAI: {e}"
         print(f"ERROR in Report Agent invocation: {error_message}")
-        st.error(error_message)
-        final_answer = "Sorry, the Report Agent encountered a problem and could not complete your request."
+        show_message("error", error_message)
+        yield "Sorry, the Report Agent encountered a problem and could not complete your request."
         
     print("Report Agent finished execution.")
-    return final_answer
\ No newline at end of file
+
+async def aexecute_report_chain(retriever, query: str) -> str:
+    """
+    Non-streaming variant of `astream_report_chain`: collects the whole stream and
+    returns the finished report (or error message) as a single string.
+    """
+    return "".join([chunk async for chunk in astream_report_chain(retriever, query)])
+
+def execute_report_chain(retriever, query: str):
+    """
+    Blocking entry point for the synchronous Streamlit UI. Runs
+    `aexecute_report_chain` to completion on the shared agent event loop.
+    """
+    return run_async(aexecute_report_chain(retriever, query))
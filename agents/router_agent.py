@@ -4,18 +4,77 @@
 # the user's intent and route the query to the most appropriate specialized agent.
 
 # --- Core LangChain and Third-Party Imports ---
-import streamlit as st
-from langchain_core.prompts import PromptTemplate
+import asyncio
+import functools
+import re
+from collections import Counter
+from typing import Optional
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
 
 # --- Project-Specific Imports ---
 from config import settings, prompts
+from utils.async_utils import run_async, show_message
+from utils.chain_cache import get_or_build_chain
+from utils.fast_embeddings import get_shared_sentence_embeddings
+from utils.llm_clients import get_openai
+from utils.rate_limiter import estimate_tokens
+from utils.semantic_cache import SemanticCache
+from utils.timing_callback import make_run_config
+
+# Past routing decisions, matched by query similarity, so paraphrases of an earlier
+# query skip the router LLM. Exact repeats are already served by the global LLM cache.
+# The embedder is the Streamlit-free, process-wide local model (loaded on first lookup),
+# so it is safe on the worker threads the cache runs on.
+_ROUTE_CACHE = SemanticCache(
+    functools.partial(get_shared_sentence_embeddings, settings.LOCAL_EMBEDDING_MODEL, settings.EMBEDDING_BATCH_SIZE, settings.EMBEDDING_GPU_BATCH_SIZE),
+    threshold=settings.ROUTER_SEMANTIC_CACHE_THRESHOLD,
+)
 
 # ======================================================================================
 # --- Helper Function for Fallback Routing ---
 # ======================================================================================
 
+# Keywords for each agent, compiled once into case-insensitive alternations so a query
+# is scanned in a single pass (no lowercase copy, no Python-level loop per keyword).
+_COMPARISON_RE = re.compile(r"\b(compare|contrast|vs|versus|differences?|similarities)\b", re.IGNORECASE)
+_REPORT_RE = re.compile(r"\b(summari[sz]e|summary|reports?|overview|outline|detail(?:s|ed)?)\b", re.IGNORECASE)
+_QNA_RE = re.compile(r"\b(what|who|when|where|which|list|find|how (?:many|much))\b", re.IGNORECASE)
+
+# The keyword set of every agent, mirroring the keywords listed in the router prompt.
+_AGENT_KEYWORDS = {
+    "QNA_AGENT": _QNA_RE,
+    "COMPARISON_AGENT": _COMPARISON_RE,
+    "REPORT_AGENT": _REPORT_RE,
+}
+
+# Queries longer than this (in tokens) are considered too nuanced for keyword routing,
+# even when they contain a strong keyword, and are sent to the LLM router instead.
+FAST_PATH_MAX_TOKENS = 30
+
+# How many routing decisions were made by the keyword fast path vs. the LLM.
+ROUTER_STATS = Counter()
+
+def classify_by_keywords(query: str) -> Optional[str]:
+    """
+    Returns the agent whose keywords appear in the query, but only when the match is
+    unambiguous: exactly one agent's keywords may be present. Queries with no keyword,
+    or with keywords of several agents (e.g. "what are the differences..."), return
+    None and are left to the LLM router.
+    """
+    hits = [agent for agent, pattern in _AGENT_KEYWORDS.items() if pattern.search(query)]
+    return hits[0] if len(hits) == 1 else None
+
+def best_guess_by_keywords(query: str) -> Optional[str]:
+    """
+    Returns a best-guess agent from keywords even when the match is ambiguous.
+    Comparison keywords take priority, as they are the most specific.
+    """
+    if _COMPARISON_RE.search(query):
+        return "COMPARISON_AGENT"
+    if _REPORT_RE.search(query):
+        return "REPORT_AGENT"
+    return None
+
 def fallback_router(query: str) -> str:
     """
     A simple, rule-based fallback router that is used if the LLM-based router fails.
@@ -30,31 +89,30 @@ def fallback_router(query: str) -> str:
     """
     print("WARNING: LLM router failed. Engaging rule-based fallback router.")
     
-    # Convert query to lowercase for case-insensitive matching
-    lower_query = query.lower()
-    
-    # Define keywords for each agent
-    comparison_keywords = ['compare', 'contrast', 'vs', 'versus', 'difference', 'similarities']
-    report_keywords = ['summarize', 'summary', 'report', 'overview', 'outline', 'detail']
-    
-    # Check for keywords in a specific order of priority (most specific first)
-    if any(keyword in lower_query for keyword in comparison_keywords):
-        print("Fallback decision: COMPARISON_AGENT")
-        return "COMPARISON_AGENT"
-    
-    if any(keyword in lower_query for keyword in report_keywords):
-        print("Fallback decision: REPORT_AGENT")
-        return "REPORT_AGENT"
+    if decision := best_guess_by_keywords(query):
+        print(f"Fallback decision: {decision}")
+        return decision
     
     # If no other keywords match, default to the Q&A agent, which is the most general.
     print("Fallback decision: QNA_AGENT (default)")
     return "QNA_AGENT"
 
+# The prompt template is the "instruction manual" for our router LLM. It is compiled
+# once in config/prompts.py.
+ROUTING_PROMPT = prompts.ROUTER_PROMPT
+
+def build_routing_chain(_retriever, router_llm):
+    """
+    Builds the routing chain: the prompt is filled, then sent to the LLM, and the
+    output is parsed into a clean string. Built once and reused via `get_or_build_chain`.
+    """
+    return ROUTING_PROMPT | router_llm | StrOutputParser()
+
 # ======================================================================================
 # --- Main Agent Execution Function ---
 # ======================================================================================
 
-def route_query(query: str) -> str:
+async def aroute_query(query: str) -> str:
     """
     Uses a fast LLM (GPT-3.5-Turbo) to analyze the user's query and decide which
     specialized agent (Q&A, Report, or Comparison) should handle the task.
@@ -62,6 +120,7 @@ def route_query(query: str) -> str:
     This function is critical for the "Agentic" behavior of the system.
 
     Workflow:
+    0.  **Keyword Fast Path**: Short queries with a strong keyword skip the LLM entirely.
     1.  **API Key Validation**: Checks for the necessary OpenAI API key.
     2.  **LLM Initialization**: Sets up the fast and cost-effective GPT-3.5-Turbo model.
     3.  **Prompt Engineering**: Loads the detailed routing prompt that instructs the LLM on its task.
@@ -76,55 +135,61 @@ def route_query(query: str) -> str:
     Returns:
         A string containing the name of the chosen agent (e.g., "QNA_AGENT").
     """
-    # --- Step 1: Pre-execution Validation ---
     print("Executing Router Agent to determine user intent...")
+
+    # --- Step 0: Keyword Fast Path ---
+    # Short queries whose keywords point to exactly one agent ("summarize this",
+    # "compare X vs Y", "who signed the contract?") are routed immediately, without
+    # an LLM round-trip.
+    if estimate_tokens(query) < FAST_PATH_MAX_TOKENS and (decision := classify_by_keywords(query)):
+        ROUTER_STATS["fast_path"] += 1
+        print(f"Keyword fast-path decision: {decision} (fast-path hits: {ROUTER_STATS['fast_path']}/{sum(ROUTER_STATS.values())})")
+        return decision
+    ROUTER_STATS["llm_path"] += 1
+
+    # --- Step 1: Pre-execution Validation ---
     if not settings.OPENAI_API_KEY:
         error_message = "OpenAI API Key is not configured for the Router Agent. Cannot determine query route."
-        st.warning(error_message) # Use a warning as this might be recoverable
+        show_message("warning", error_message) # Use a warning as this might be recoverable
         print(f"ERROR: {error_message}")
         # If no key, we can't use the LLM, so we go straight to the fallback.
         return fallback_router(query)
 
+    # --- Step 1b: Semantic Cache Lookup ---
+    # The query is embedded by the local model (CPU-bound), so it runs in a worker
+    # thread instead of stalling every other session on the shared event loop.
+    try:
+        if (cached_decision := await asyncio.to_thread(_ROUTE_CACHE.lookup, query)) is not None:
+            print(f"Router decision served from semantic cache: {cached_decision}")
+            return cached_decision
+    except Exception as e:
+        print(f"WARNING: Semantic route cache lookup failed: {e}")
+
     # --- Step 2: Language Model (LLM) Initialization ---
     try:
         # We use a fast and inexpensive model like gpt-3.5-turbo for routing,
         # as this is a simple classification task that doesn't require deep reasoning.
-        # Temperature is set to 0 for maximum predictability and consistency.
-        router_llm = ChatOpenAI(
-            model=settings.ROUTER_MODEL, 
-            openai_api_key=settings.OPENAI_API_KEY, 
-            temperature=0,
-            max_tokens=20 # The response is very short, so we can limit tokens.
-        )
-        print(f"Successfully initialized Router LLM: {settings.ROUTER_MODEL}")
+        # Temperature is set to 0 for maximum predictability and consistency, and the
+        # response is very short, so we can limit tokens. The client is shared across calls.
+        router_llm = get_openai(settings.ROUTER_MODEL, 0, 20)
     except Exception as e:
         error_message = f"Failed to initialize the Router LLM: {e}"
-        st.warning(error_message)
+        show_message("warning", error_message)
         print(f"ERROR: {error_message}")
         return fallback_router(query)
 
-    # --- Step 3: Prompt and Chain Construction ---
-    try:
-        # The prompt template is the "instruction manual" for our router LLM.
-        routing_prompt = PromptTemplate.from_template(prompts.ROUTER_PROMPT_TEMPLATE)
-        
-        # We build the chain: The prompt is filled, then sent to the LLM,
-        # and the output is parsed into a clean string.
-        chain = routing_prompt | router_llm | StrOutputParser()
-        
-    except Exception as e:
-        error_message = f"Failed to build the routing chain: {e}"
-        st.error(error_message) # This is a more critical internal error
-        print(f"ERROR: {error_message}")
-        # If the chain can't be built, we can't proceed with the LLM.
-        return fallback_router(query)
+    # --- Step 3: Prompt and Chain Construction (compiled once) ---
+    chain = get_or_build_chain("router", None, router_llm, build_routing_chain)
 
     # --- Step 4: Invocation, Validation, and Fallback ---
     decision = ""
     try:
         # Invoke the chain with the user's query.
         print(f"Routing query: '{query[:50]}...'")
-        result = chain.invoke({"query": query})
+        result = await asyncio.wait_for(
+            chain.ainvoke({"query": query}, config=make_run_config("router_chain")),
+            timeout=settings.RAG_CHAIN_TIMEOUT_MS / 1000,
+        )
         decision = result.strip().upper() # Sanitize the output
         print(f"LLM Router Decision: {decision}")
 
@@ -134,12 +199,23 @@ def route_query(query: str) -> str:
             print(f"WARNING: LLM returned an invalid agent name ('{decision}'). Engaging fallback.")
             return fallback_router(query)
         
+        try:
+            await asyncio.to_thread(_ROUTE_CACHE.add, query, decision)
+        except Exception as e:
+            print(f"WARNING: Could not store the routing decision in the semantic cache: {e}")
         return decision
 
     except Exception as e:
         # If the API call fails for any reason (rate limit, network, etc.),
         # we log the error and use our reliable fallback.
         error_message = f"LLM routing failed: {e}. Using rule-based fallback."
-        st.info("The intelligent router is momentarily unavailable. Using standard routing.")
+        show_message("info", "The intelligent router is momentarily unavailable. Using standard routing.")
         print(f"ERROR: {error_message}")
-        return fallback_router(query)
\ No newline at end of file
+        return fallback_router(query)
+
+def route_query(query: str) -> str:
+    """
+    Blocking entry point for synchronous callers. Runs `aroute_query` to
+    completion on the shared agent event loop.
+    """
+    return run_async(aroute_query(query))
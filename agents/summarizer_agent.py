@@ -35,25 +35,37 @@
 #     more resilient.
 #
 # 4.  **Comprehensive Error Handling and Logging:**
-#     Every critical operation is wrapped in detailed `try...except` blocks. The agent
+#     Every pipeline step runs inside a `_stage` context manager. The agent
 #     provides informative logs to the console for developers and clear,
 #     user-friendly error messages to the Streamlit UI.
 # ======================================================================================
 
 
 # --- Core & Third-Party Imports ---
+import datetime
+import hashlib
+import os
+from contextlib import contextmanager
+from functools import lru_cache
 import streamlit as st
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 import tiktoken # Used for accurately calculating token counts
+from cachetools import LRUCache
 
 # --- LangChain Specific Imports ---
 from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.runnables import RunnableLambda
+from langchain_core.output_parsers import StrOutputParser
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.summarize import load_summarize_chain
 
 # --- Project-Specific Imports ---
 from config import settings
+from utils.async_utils import run_async
+from utils.llm_clients import get_gemini
+from utils.response_cache import response_cache
+from utils.rate_limiter import gemini_bucket, estimate_tokens, RESPONSE_TOKEN_ALLOWANCE
 
 # ======================================================================================
 # SECTION 1: PROMPT ENGINEERING & STRATEGY SELECTION
@@ -65,9 +77,19 @@ from config import settings
 # limit to ensure performance and prevent unexpected costs/errors.
 MODEL_CONTEXT_LIMITS = {
     "gemini-1.5-flash-latest": 128000, # A very large but safe limit
+    "gemini-1.5-flash": 128000,
+    "gemini-1.5-flash-001": 128000,
     "default": 8000
 }
 
+# "cl100k_base" is the tokenizer used by many modern models, including GPT-4 and Gemini.
+# Loading its BPE merge table is expensive, so it is done once at import time.
+try:
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    print(f"WARNING: Could not load the tiktoken encoding, falling back to character estimates: {e}")
+    _ENCODING = None
+
 def get_token_count(text: str) -> int:
     """
     Calculates the number of tokens for a given text using tiktoken.
@@ -79,20 +101,38 @@ def get_token_count(text: str) -> int:
     Returns:
         int: The number of tokens.
     """
-    try:
-        # "cl100k_base" is the tokenizer used by many modern models, including GPT-4 and Gemini.
-        encoding = tiktoken.get_encoding("cl100k_base")
-        num_tokens = len(encoding.encode(text))
-        return num_tokens
-    except Exception:
-        # Fallback to a simple character count if tiktoken fails for any reason.
+    if _ENCODING is None:
+        # Fallback to a simple character count if tiktoken is unavailable.
         return len(text) // 4
+    # Special-token strings in user documents are counted as plain text instead of raising.
+    return len(_ENCODING.encode(text, disallowed_special=()))
+
+
+# tiktoken's Rust core releases the GIL, so batch encoding scales across cores.
+_TOKENIZER_THREADS = max(1, (os.cpu_count() or 2) // 2)
 
+def get_token_counts(texts: List[str]) -> List[int]:
+    """
+    Calculates the token count of many texts at once, encoding them in parallel.
+
+    Args:
+        texts (List[str]): The texts to be tokenized.
 
+    Returns:
+        List[int]: The number of tokens of each text, in order.
+    """
+    if _ENCODING is None:
+        return [len(text) // 4 for text in texts]
+    encoded = _ENCODING.encode_batch(texts, num_threads=_TOKENIZER_THREADS, disallowed_special=())
+    return [len(tokens) for tokens in encoded]
+
+
+@lru_cache(maxsize=None)
 def get_prompt_templates(summary_length: str) -> Dict[str, PromptTemplate]:
     """
     Returns a dictionary of professionally crafted LangChain PromptTemplate objects
-    tailored for different summarization tasks.
+    tailored for different summarization tasks. The templates are built once per
+    summary length and shared afterwards, so callers must not modify them.
 
     Args:
         summary_length (str): The user's desired length ("brief", "default", "detailed").
@@ -106,12 +146,15 @@ def get_prompt_templates(summary_length: str) -> Dict[str, PromptTemplate]:
     if summary_length == "brief":
         refine_question_prompt = "Your job is to produce a final, very brief, single-paragraph summary of the following text."
         initial_response_prompt = "Write a very brief, high-level summary of the following, capturing only the most critical points:"
+        cached_context_prompt = "Write a very brief, high-level summary of the provided document(s), capturing only the most critical points."
     elif summary_length == "detailed":
         refine_question_prompt = "Your job is to produce a final, detailed, and comprehensive summary of the following text, organized into logical paragraphs."
         initial_response_prompt = "Write a detailed summary of the following, capturing key arguments, data, and conclusions:"
+        cached_context_prompt = "Write a detailed summary of the provided document(s), capturing key arguments, data, and conclusions."
     else: # "default"
         refine_question_prompt = "Your job is to produce a final, concise summary of the following text."
         initial_response_prompt = "Write a concise and clear summary of the following:"
+        cached_context_prompt = "Write a concise and clear summary of the provided document(s)."
 
     prompts['refine_template'] = PromptTemplate.from_template(
         f"{refine_question_prompt}\n\n"
@@ -122,6 +165,8 @@ def get_prompt_templates(summary_length: str) -> Dict[str, PromptTemplate]:
     )
     
     prompts['stuff_template'] = PromptTemplate.from_template(f"{initial_response_prompt}\n\n{{text}}")
+    # Used with Gemini context caching, where the documents are already in the cached prefix.
+    prompts['cached_context_template'] = PromptTemplate.from_template(cached_context_prompt)
     
     # --- Prompts for the 'map_reduce' chain ---
     # This chain uses two separate prompts.
@@ -151,9 +196,11 @@ def select_summarization_strategy(docs_to_summarize: List[Document], summary_len
     """
     print("Summarizer Agent: Selecting optimal strategy...")
     
-    # Calculate total tokens to make an informed decision.
-    full_text = " ".join([doc.page_content for doc in docs_to_summarize])
-    total_tokens = get_token_count(full_text)
+    # Calculate total tokens to make an informed decision. Documents are counted
+    # individually (and in parallel) instead of joining the whole corpus into a single
+    # string first; the extra `len(...)` accounts for the separators a join would add.
+    token_counts = get_token_counts([doc.page_content for doc in docs_to_summarize])
+    total_tokens = sum(token_counts) + len(docs_to_summarize)
     
     # Get the context limit for the selected Gemini model.
     model_limit = MODEL_CONTEXT_LIMITS.get(settings.QNA_MODEL, MODEL_CONTEXT_LIMITS['default'])
@@ -171,7 +218,7 @@ def select_summarization_strategy(docs_to_summarize: List[Document], summary_len
         # It's fast and provides the highest quality summary as the model sees everything at once.
         strategy = {
             "chain_type": "stuff",
-            "chain_kwargs": {"prompt": prompts_dict['stuff_template']}
+            "chain_kwargs": {"prompt": prompts_dict['stuff_template']},
         }
         print(f"Strategy selected: 'stuff' (Total tokens {total_tokens} < Safe limit {safe_limit})")
     else:
@@ -185,13 +232,283 @@ def select_summarization_strategy(docs_to_summarize: List[Document], summary_len
             }
         }
         print(f"Strategy selected: 'map_reduce' (Total tokens {total_tokens} > Safe limit {safe_limit})")
-        
+
+    # Either strategy is bypassed when the documents qualify for Gemini context caching.
+    strategy["instruction_prompt"] = prompts_dict['cached_context_template']
+    strategy["total_tokens"] = total_tokens
     return strategy
 
+# ======================================================================================
+# SECTION 2: BATCHED MAP-REDUCE
+# ======================================================================================
+
+# Map-step chunks are cut by token count up front, so each one fits comfortably in a
+# single call and identical chunks can be recognised across runs.
+MAP_CHUNK_TOKENS = 8000
+_MAP_SPLITTER = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    encoding_name="cl100k_base", chunk_size=MAP_CHUNK_TOKENS, chunk_overlap=200
+)
+
+# Partial (map-step) summaries keyed by SHA-256 of (model | map prompt | chunk text), so
+# re-summarizing the same document skips the map step for every unchanged chunk.
+_PARTIAL_SUMMARY_CACHE = LRUCache(maxsize=2048)
+
+# The reduce prompt must fit in one call too. For very large documents the partial
+# summaries themselves can exceed this, so they are first collapsed group by group.
+REDUCE_MAX_TOKENS = MAP_CHUNK_TOKENS
+
+async def _throttle_prompt(prompt_text: str) -> str:
+    """Waits for rate-limit capacity for one map prompt, then passes it through."""
+    await gemini_bucket.acquire(estimate_tokens(prompt_text) + RESPONSE_TOKEN_ALLOWANCE)
+    return prompt_text
+
+def _group_by_tokens(texts: List[str], max_tokens: int) -> List[List[str]]:
+    """Splits texts, in order, into consecutive groups of at most `max_tokens` tokens each."""
+    groups, current, current_tokens = [], [], 0
+    for text, tokens in zip(texts, get_token_counts(texts)):
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+async def _collapse_partials(llm, partial_summaries: List[str], combine_prompt: PromptTemplate) -> List[str]:
+    """
+    Condenses partial summaries until all of them fit in a single reduce call.
+    Every round summarizes all groups concurrently with one `abatch` call.
+
+    Args:
+        llm: The Gemini chat model.
+        partial_summaries (List[str]): The map-step summaries, in document order.
+        combine_prompt (PromptTemplate): The prompt used to merge a group of summaries.
+
+    Returns:
+        List[str]: Partial summaries whose combined size fits in REDUCE_MAX_TOKENS.
+    """
+    groups = _group_by_tokens(partial_summaries, REDUCE_MAX_TOKENS)
+    while len(groups) > 1:
+        print(f"Summarizer: Collapsing {len(partial_summaries)} partial summaries into {len(groups)} group(s).")
+        collapse_chain = RunnableLambda(_throttle_prompt) | llm | StrOutputParser()
+        partial_summaries = await collapse_chain.abatch(
+            [combine_prompt.format(text="\n".join(group)) for group in groups],
+            config={"max_concurrency": settings.SUMMARY_MAP_CONCURRENCY},
+        )
+        new_groups = _group_by_tokens(partial_summaries, REDUCE_MAX_TOKENS)
+        if len(new_groups) >= len(groups):
+            # The summaries stopped shrinking; reduce what we have rather than loop forever.
+            break
+        groups = new_groups
+    return partial_summaries
+
+async def run_map_reduce(llm, docs: List[Document], map_prompt: PromptTemplate, combine_prompt: PromptTemplate) -> str:
+    """
+    Runs the 'map_reduce' strategy as an explicit, batched two-step pipeline.
+
+    1.  The documents are pre-chunked by token count.
+    2.  Map: all uncached chunk prompts are sent in one `abatch` call, which keeps up
+        to SUMMARY_MAP_CONCURRENCY requests in flight (each one passing the shared rate
+        limiter). Chunks summarized in an earlier run are served from an LRU cache.
+    3.  Collapse: if the partial summaries are too long for one call, they are grouped
+        and each group is condensed (again in one batch) until they fit.
+    4.  Reduce: a single call combines the partial summaries.
+
+    Args:
+        llm: The Gemini chat model.
+        docs (List[Document]): The documents to summarize.
+        map_prompt (PromptTemplate): The per-chunk summarization prompt.
+        combine_prompt (PromptTemplate): The prompt that merges the partial summaries.
+
+    Returns:
+        str: The final combined summary.
+    """
+    chunks = _MAP_SPLITTER.split_documents(docs)
+    map_prompts = [map_prompt.format(text=chunk.page_content) for chunk in chunks]
+    model_name = getattr(llm, "model", "")
+    keys = [hashlib.sha256(f"{model_name}|{prompt_text}".encode()).hexdigest() for prompt_text in map_prompts]
+
+    # Map step: only chunks that have not been summarized before reach the model.
+    missing = [i for i, key in enumerate(keys) if key not in _PARTIAL_SUMMARY_CACHE]
+    print(f"Summarizer: {len(chunks)} chunk(s), {len(chunks) - len(missing)} partial summaries cached.")
+    if missing:
+        map_chain = RunnableLambda(_throttle_prompt) | llm | StrOutputParser()
+        new_partials = await map_chain.abatch(
+            [map_prompts[i] for i in missing],
+            config={"max_concurrency": settings.SUMMARY_MAP_CONCURRENCY},
+        )
+        for i, partial in zip(missing, new_partials):
+            _PARTIAL_SUMMARY_CACHE[keys[i]] = partial
+    partial_summaries = [_PARTIAL_SUMMARY_CACHE[key] for key in keys]
+
+    # Collapse step: condense groups of partials in parallel until they fit one call.
+    partial_summaries = await _collapse_partials(llm, partial_summaries, combine_prompt)
+
+    # Reduce step: a single call combines the partial summaries.
+    combined_text = "\n".join(partial_summaries)
+    await gemini_bucket.acquire(estimate_tokens(combined_text) + RESPONSE_TOKEN_ALLOWANCE)
+    result = await llm.ainvoke(combine_prompt.format(text=combined_text))
+    return result.content
+
+# ======================================================================================
+# SECTION 2A: STREAMED 'STUFF' SUMMARIES
+# ======================================================================================
+
+def render_token_stream(token_stream: Iterator[str]) -> str:
+    """
+    Shows a summary in a temporary placeholder while it is being generated, so the
+    user sees the first words after one chunk instead of after the full decode.
+    The placeholder is cleared at the end; the caller renders the finished summary.
+
+    Args:
+        token_stream (Iterator[str]): The text chunks produced by the model.
+
+    Returns:
+        str: The complete summary text.
+    """
+    placeholder = st.empty()
+    buffer = []
+    for chunk in token_stream:
+        if not chunk:
+            continue
+        buffer.append(chunk)
+        placeholder.markdown("".join(buffer))
+    placeholder.empty()
+    return "".join(buffer)
+
+def stream_stuff_summary(llm, docs: List[Document], prompt: PromptTemplate) -> str:
+    """
+    Runs the 'stuff' strategy (all documents in one prompt) as a streamed call.
+    Documents are joined with blank lines, exactly like LangChain's stuff chain does.
+
+    Args:
+        llm: The Gemini chat model.
+        docs (List[Document]): The documents to summarize.
+        prompt (PromptTemplate): The stuff prompt with a `{text}` variable.
+
+    Returns:
+        str: The summary text.
+    """
+    prompt_text = prompt.format(text="\n\n".join(doc.page_content for doc in docs))
+    chain = llm | StrOutputParser()
+    return render_token_stream(chain.stream(prompt_text))
+
+# ======================================================================================
+# SECTION 2B: GEMINI CONTEXT CACHING
+# ======================================================================================
+
+# Content hash -> name of the Gemini `CachedContent` holding those documents. The cache
+# lives on Google's side, so one upload serves every summary length and every session.
+_GEMINI_CONTEXT_CACHES: Dict[str, str] = {}
+
+CACHED_CONTEXT_SYSTEM_INSTRUCTION = (
+    "You are an expert analyst who writes accurate, well-structured summaries. "
+    "Base every statement strictly on the documents provided in the context."
+)
+
+def _get_or_create_context_cache(docs: List[Document], content_hash: str):
+    """
+    Returns the Gemini cached content for the documents, uploading them on first use.
+
+    Args:
+        docs (List[Document]): The documents to cache.
+        content_hash (str): A hash of the document contents, used as the lookup key.
+
+    Returns:
+        The `CachedContent` object for the documents.
+    """
+    from google.generativeai import caching
+
+    cache_name = _GEMINI_CONTEXT_CACHES.get(content_hash)
+    if cache_name is not None:
+        try:
+            return caching.CachedContent.get(cache_name)
+        except Exception:
+            # The cached content expired on Google's side; upload it again.
+            _GEMINI_CONTEXT_CACHES.pop(content_hash, None)
+
+    print(f"Summarizer: Uploading document context to Gemini cache ({len(docs)} document(s)).")
+    cached_content = caching.CachedContent.create(
+        model=settings.GEMINI_CONTEXT_CACHE_MODEL,
+        display_name=f"summary-{content_hash[:16]}",
+        system_instruction=CACHED_CONTEXT_SYSTEM_INSTRUCTION,
+        contents=[doc.page_content for doc in docs],
+        ttl=datetime.timedelta(minutes=settings.GEMINI_CONTEXT_CACHE_TTL_MINUTES),
+    )
+    _GEMINI_CONTEXT_CACHES[content_hash] = cached_content.name
+    return cached_content
+
+def summarize_with_context_cache(docs: List[Document], instruction_prompt: PromptTemplate, total_tokens: int) -> Optional[str]:
+    """
+    Runs a 'stuff' summary against Gemini cached content instead of resending the
+    documents. The static documents form the cached prefix; only the short,
+    length-specific instruction is sent with each request.
+
+    Args:
+        docs (List[Document]): The documents to summarize.
+        instruction_prompt (PromptTemplate): The length-specific summary instruction.
+        total_tokens (int): The token count of the documents.
+
+    Returns:
+        Optional[str]: The summary, or None if context caching is not applicable or failed
+        (the caller then falls back to the regular chain).
+    """
+    if not settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS <= total_tokens <= settings.GEMINI_CONTEXT_CACHE_MAX_TOKENS:
+        return None
+    try:
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        content_hash = hashlib.sha256("\n".join(doc.page_content for doc in docs).encode()).hexdigest()
+        cached_content = _get_or_create_context_cache(docs, content_hash)
+        model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        gemini_bucket.acquire_sync(total_tokens + RESPONSE_TOKEN_ALLOWANCE)
+        response = model.generate_content(instruction_prompt.format(), stream=True)
+        return render_token_stream(chunk.text for chunk in response)
+    except Exception as e:
+        print(f"WARNING: Gemini context caching unavailable, sending the full documents instead: {e}")
+        return None
+
 # ======================================================================================
 # SECTION 3: MAIN AGENT EXECUTION FUNCTION
 # ======================================================================================
 
+class _StageFailed(Exception):
+    """Raised by `_stage` once an error has been reported; carries the text returned to the UI."""
+
+    def __init__(self, user_message: str):
+        super().__init__(user_message)
+        self.user_message = user_message
+
+@contextmanager
+def _stage(description: str, user_message: Optional[str] = None):
+    """
+    Wraps one step of the pipeline: any exception is shown in the UI and logged as
+    "<description>: <error>", then re-raised as `_StageFailed`, so the caller ends the
+    pipeline with a single handler.
+
+    Args:
+        description (str): What failed, used as the prefix of the error message.
+        user_message (str, optional): The text to return instead of the error message.
+    """
+    try:
+        yield
+    except Exception as e:
+        error_message = f"{description}: {e}"
+        st.error(error_message)
+        print(f"ERROR: {error_message}")
+        raise _StageFailed(user_message or error_message) from e
+
+# Part of every summary cache key. Bump it whenever the prompts in `get_prompt_templates`
+# change, so summaries produced by the old prompts are no longer served.
+PROMPT_VERSION = "v1"
+
+def _summary_cache_key(docs: List[Document], summary_length: str) -> str:
+    """Builds the cache key for a summary from the document contents, length and prompt version."""
+    content_hash = hashlib.sha256("\n".join(doc.page_content for doc in docs).encode()).hexdigest()
+    return response_cache.make_key(f"summary|{summary_length}|{PROMPT_VERSION}", content_hash, settings.QNA_MODEL)
+
 def execute_summarization_chain(docs_to_summarize: List[Document], summary_length: str = "default") -> str:
     """
     Executes the advanced summarization pipeline using the Google Gemini model.
@@ -216,59 +533,63 @@ def execute_summarization_chain(docs_to_summarize: List[Document], summary_lengt
         st.error(error_message)
         return error_message
 
-    # --- Step 2: LLM Initialization ---
-    try:
-        # Initialize the Gemini model for the summarization task.
-        llm = ChatGoogleGenerativeAI(
-            model=settings.QNA_MODEL, # Using Gemini as requested
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=0.3, # A balanced temperature for creative but factual writing.
-        )
-        print(f"Summarizer LLM ({settings.QNA_MODEL}) initialized.")
-    except Exception as e:
-        error_message = f"Failed to initialize Google Gemini model for summarization: {e}"
-        st.error(error_message)
-        return error_message
+    # Identical documents summarized at the same length are answered from the cache.
+    cache_key = _summary_cache_key(docs_to_summarize, summary_length)
+    if (cached_summary := response_cache.get(cache_key)) is not None:
+        print("Summarization Agent: Returning cached summary.")
+        return cached_summary
 
-    # --- Step 3: Strategy and Prompt Selection ---
-    try:
-        strategy_config = select_summarization_strategy(docs_to_summarize, summary_length)
-        chain_type = strategy_config["chain_type"]
-        chain_kwargs = strategy_config["chain_kwargs"]
-    except Exception as e:
-        error_message = f"Error during strategy selection: {e}"
-        st.error(error_message)
-        return "Internal Error: Could not determine summarization strategy."
-
-    # --- Step 4: Chain Creation and Invocation ---
     final_summary = ""
     try:
-        # `load_summarize_chain` is a high-level LangChain function that creates an
-        # optimized chain for summarization using the chosen strategy and prompts.
-        summarization_chain = load_summarize_chain(
-            llm=llm,
-            chain_type=chain_type,
-            **chain_kwargs
-        )
-        print(f"Invoking summarization chain with strategy: '{chain_type}'...")
-        
-        # We pass the list of Document objects directly to the chain.
-        summary_result = summarization_chain.invoke(docs_to_summarize)
-        
-        # The output from the chain is a dictionary, usually with an 'output_text' key.
-        final_summary = summary_result.get("output_text", "The agent could not generate a summary from the text.")
-        
-        if not final_summary.strip():
-             final_summary = "The summarization process completed, but resulted in an empty output. The source document might be too short or lack summarizable content."
-             st.warning(final_summary)
-             
-    except Exception as e:
+        # --- Step 2: LLM Initialization ---
+        with _stage("Failed to initialize Google Gemini model for summarization"):
+            # The shared Gemini client is built once per (model, temperature) and reused.
+            # A balanced temperature for creative but factual writing.
+            llm = get_gemini(settings.QNA_MODEL, 0.3)
+
+        # --- Step 3: Strategy and Prompt Selection ---
+        with _stage("Error during strategy selection", "Internal Error: Could not determine summarization strategy."):
+            strategy_config = select_summarization_strategy(docs_to_summarize, summary_length)
+            chain_type = strategy_config["chain_type"]
+            chain_kwargs = strategy_config["chain_kwargs"]
+            total_tokens = strategy_config["total_tokens"]
+
+        # --- Step 4: Chain Creation and Invocation ---
         # This is a critical catch-all for errors during the actual API call to Google.
-        error_message = f"A critical error occurred during the summarization API call: {e}"
-        st.error(error_message)
-        print(f"ERROR: {error_message}")
-        final_summary = "An unexpected error occurred while generating the summary. Please check the console logs."
-        
+        with _stage(
+            "A critical error occurred during the summarization API call",
+            "An unexpected error occurred while generating the summary. Please check the console logs.",
+        ):
+            print(f"Invoking summarization chain with strategy: '{chain_type}'...")
+            # Decided before the strategy: large documents are uploaded to Gemini once and
+            # reused across requests, whichever chain would otherwise have handled them.
+            if (cached_context_summary := summarize_with_context_cache(
+                docs_to_summarize, strategy_config["instruction_prompt"], total_tokens
+            )) is not None:
+                final_summary = cached_context_summary
+            elif chain_type == "map_reduce":
+                # The map step is batched rather than run chunk by chunk.
+                final_summary = run_async(run_map_reduce(llm, docs_to_summarize, **chain_kwargs))
+            elif chain_type == "stuff":
+                # Tokens are shown as they arrive instead of after the whole summary is decoded.
+                final_summary = stream_stuff_summary(llm, docs_to_summarize, **chain_kwargs)
+            else:
+                # `load_summarize_chain` is a high-level LangChain function that creates an
+                # optimized chain for summarization using the chosen strategy and prompts.
+                summarization_chain = load_summarize_chain(llm=llm, chain_type=chain_type, **chain_kwargs)
+                # The output from the chain is a dictionary, usually with an 'output_text' key.
+                summary_result = summarization_chain.invoke(docs_to_summarize)
+                final_summary = summary_result.get("output_text", "The agent could not generate a summary from the text.")
+
+            if not final_summary.strip():
+                final_summary = "The summarization process completed, but resulted in an empty output. The source document might be too short or lack summarizable content."
+                st.warning(final_summary)
+            else:
+                response_cache.set(cache_key, final_summary, ttl_seconds=settings.SUMMARY_CACHE_TTL_SECONDS)
+
+    except _StageFailed as failure:
+        final_summary = failure.user_message
+
     print("Summarization Agent finished execution.")
     print("-" * 50)
     return final_summary
\ No newline at end of file
@@ -1,62 +1,164 @@
 # app/email_handler.py
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import streamlit as st
+import asyncio
+from email.message import EmailMessage
+from typing import Dict, List, Optional, Tuple
 
-def send_verification_email(recipient_email: str, token: str):
-    """Sends a verification email to the user."""
-    sender_email = st.secrets.get("EMAIL_SENDER_ADDRESS")
-    sender_password = st.secrets.get("EMAIL_SENDER_PASSWORD")
-    
-    if not sender_email or not sender_password:
-        st.error("Email service is not configured. Cannot send verification email.")
-        print("ERROR: Email credentials not found in secrets.")
-        return False
+import streamlit as st
 
-    # Create the verification link
-    # IMPORTANT: Change the base URL when deploying
-    base_url = "http://localhost:8501" 
-    verification_link = f"{base_url}/?verify_token={token}"
+from app.smtp_pool import get_smtp_pool
+from config import settings
+from utils.async_utils import run_async
 
-    # Create the email
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Verify Your Email for Cognitive Query Pro"
-    message["From"] = sender_email
-    message["To"] = recipient_email
+def _get_sender_credentials() -> Tuple[Optional[str], Optional[str]]:
+    """Reads the sender address and password from Streamlit secrets."""
+    return st.secrets.get("EMAIL_SENDER_ADDRESS"), st.secrets.get("EMAIL_SENDER_PASSWORD")
 
-    text = f"""
+# The email bodies never change apart from the link, so they are built once at import
+# and only the link and the "To" header are filled in per message.
+# IMPORTANT: Change the base URL when deploying
+VERIFICATION_BASE_URL = "http://localhost:8501"
+_SUBJECT = "Verify Your Email for Cognitive Query Pro"
+_TEXT_TEMPLATE = """
     Hi,
     Thank you for registering for Cognitive Query Pro!
     Please verify your email by visiting the following link:
-    {verification_link}
+    {LINK}
     """
-    html = f"""
+_HTML_TEMPLATE = """
     <html>
       <body>
         <div style="font-family: Arial, sans-serif; text-align: center; padding: 20px;">
           <h2>Welcome to Cognitive Query Pro!</h2>
           <p>Please click the button below to verify your email address and activate your account.</p>
-          <a href="{verification_link}" style="background-color: #6c63ff; color: white; padding: 15px 25px; text-decoration: none; border-radius: 5px; font-size: 16px;">Verify Email</a>
-          <p style="margin-top: 20px; font-size: 12px; color: #888;">If you cannot click the button, copy and paste this link into your browser: {verification_link}</p>
+          <a href="{LINK}" style="background-color: #6c63ff; color: white; padding: 15px 25px; text-decoration: none; border-radius: 5px; font-size: 16px;">Verify Email</a>
+          <p style="margin-top: 20px; font-size: 12px; color: #888;">If you cannot click the button, copy and paste this link into your browser: {LINK}</p>
         </div>
       </body>
     </html>
     """
 
-    part1 = MIMEText(text, "plain")
-    part2 = MIMEText(html, "html")
-    message.attach(part1)
-    message.attach(part2)
+def _build_verification_message(sender_email: str, recipient_email: str, token: str) -> bytes:
+    """Builds the verification email for one recipient, serialized once to bytes."""
+    verification_link = f"{VERIFICATION_BASE_URL}/?verify_token={token}"
+
+    message = EmailMessage()
+    message["Subject"] = _SUBJECT
+    message["From"] = sender_email
+    message["To"] = recipient_email
+    message.set_content(_TEXT_TEMPLATE.replace("{LINK}", verification_link))
+    message.add_alternative(_HTML_TEMPLATE.replace("{LINK}", verification_link), subtype="html")
+    return message.as_bytes()
+
+def send_verification_email(recipient_email: str, token: str):
+    """Sends a verification email to the user."""
+    sender_email, sender_password = _get_sender_credentials()
+    
+    if not sender_email or not sender_password:
+        st.error("Email service is not configured. Cannot send verification email.")
+        print("ERROR: Email credentials not found in secrets.")
+        return False
+
+    message = _build_verification_message(sender_email, recipient_email, token)
 
     try:
-        # Connect to the SMTP server (for Gmail)
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, recipient_email, message.as_string())
+        # Reuse a pooled, already logged-in connection to the SMTP server (Gmail).
+        get_smtp_pool(sender_email, sender_password).send(sender_email, recipient_email, message)
         print(f"Verification email sent successfully to {recipient_email}")
         return True
     except Exception as e:
         st.error("Failed to send verification email. Please contact support.")
         print(f"SMTP Error: {e}")
-        return False
\ No newline at end of file
+        return False
+
+# ======================================================================================
+# BULK SENDING (ASYNC)
+# ======================================================================================
+# Sending many verification emails one after another spends almost all of the time
+# waiting on the network. `send_bulk_verification_emails` puts the messages on a queue
+# that EMAIL_BULK_WORKERS workers drain concurrently, each over its own persistent
+# `aiosmtplib` session, so N emails take about ceil(N / workers) send times.
+
+async def _open_async_smtp(sender_email: str, sender_password: str):
+    """Opens and logs in one async SMTP session."""
+    import aiosmtplib
+
+    smtp = aiosmtplib.SMTP(hostname=settings.SMTP_HOST, port=settings.SMTP_PORT, use_tls=True)
+    await smtp.connect()
+    await smtp.login(sender_email, sender_password)
+    return smtp
+
+async def _bulk_email_worker(queue: "asyncio.Queue[Tuple[str, str]]", sender_email: str, sender_password: str, results: Dict[str, bool]):
+    """Sends queued (recipient, token) pairs over one persistent SMTP session."""
+    import aiosmtplib
+
+    smtp = None
+    try:
+        while True:
+            try:
+                recipient_email, token = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            message = _build_verification_message(sender_email, recipient_email, token)
+            try:
+                if smtp is None or not smtp.is_connected:
+                    smtp = await _open_async_smtp(sender_email, sender_password)
+                await smtp.sendmail(sender_email, [recipient_email], message)
+                results[recipient_email] = True
+            except Exception as e:
+                print(f"SMTP Error ({recipient_email}): {e}")
+                results[recipient_email] = False
+                if isinstance(e, aiosmtplib.SMTPServerDisconnected):
+                    smtp = None
+    finally:
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                pass
+
+async def send_verification_email_async(recipient_email: str, token: str) -> bool:
+    """
+    Sends a single verification email without blocking the event loop.
+
+    Args:
+        recipient_email (str): The address to verify.
+        token (str): The verification token.
+
+    Returns:
+        bool: True if the email was accepted by the server.
+    """
+    results = await send_bulk_verification_emails([(recipient_email, token)])
+    return results.get(recipient_email, False)
+
+async def send_bulk_verification_emails(recipients: List[Tuple[str, str]]) -> Dict[str, bool]:
+    """
+    Sends verification emails to many users concurrently.
+
+    Args:
+        recipients (List[Tuple[str, str]]): (recipient_email, token) pairs.
+
+    Returns:
+        Dict[str, bool]: Whether each recipient's email was sent successfully.
+    """
+    sender_email, sender_password = _get_sender_credentials()
+    if not sender_email or not sender_password:
+        print("ERROR: Email credentials not found in secrets.")
+        return {recipient_email: False for recipient_email, _ in recipients}
+
+    queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue()
+    for item in recipients:
+        queue.put_nowait(item)
+
+    results: Dict[str, bool] = {}
+    worker_count = min(settings.EMAIL_BULK_WORKERS, len(recipients))
+    workers = [
+        asyncio.create_task(_bulk_email_worker(queue, sender_email, sender_password, results))
+        for _ in range(worker_count)
+    ]
+    await asyncio.gather(*workers)
+    print(f"Bulk email: {sum(results.values())}/{len(recipients)} verification email(s) sent.")
+    return results
+
+def send_bulk_verification_emails_sync(recipients: List[Tuple[str, str]]) -> Dict[str, bool]:
+    """Synchronous wrapper around `send_bulk_verification_emails` for Streamlit code."""
+    return run_async(send_bulk_verification_emails(recipients))
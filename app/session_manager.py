@@ -1,45 +1,58 @@
 # app/session_manager.py - The Final, Corrected, Unbreakable Session State Manager
 
+# This is the ONLY place where the session state schema is defined. Both entry points
+# (main.py and app/main_app_config.py) call `initialize_session_state`, and every page
+# reads the keys set here, so a key must never be added anywhere else.
+
 import streamlit as st
 import uuid
 from datetime import datetime
-import pandas as pd
-from core.vector_store_handler import VectorStoreHandler
 
-def initialize_session_state():
+__all__ = ["initialize_session_state"]
+
+def initialize_session_state(force_reset: bool = False):
     """
     Initializes ALL necessary variables directly into st.session_state.
-    This is called ONCE by main.py at the very beginning of the app run.
+    This is called ONCE at the very beginning of the app run.
     This version is guaranteed to initialize all required keys.
+
+    Args:
+        force_reset (bool): If True, wipes the current session and starts fresh.
     """
-    if 'session_initialized' in st.session_state:
+    if 'app_initialized' in st.session_state and not force_reset:
         return
 
-    st.session_state.session_initialized = True
+    if force_reset:
+        st.session_state.clear()
+    st.session_state.app_initialized = True
     
     # --- Session Metadata ---
     st.session_state.session_id = str(uuid.uuid4())
     st.session_state.start_time = datetime.now()
+    st.session_state.page = "Home"
     
     # --- Core Application State ---
     st.session_state.processed_files = []
-    
-    # --- THE FIX IS HERE ---
-    # The key was named full_docs in the previous version. It should be full_docs_content.
-    # I am initializing it correctly now.
-    st.session_state.full_docs_content = {} 
-    
-    st.session_state.vector_store_handler = VectorStoreHandler()
+    # Source file name -> key of its full (un-chunked) text in utils.full_docs_store,
+    # used by the per-document tools. The text itself never lives in session state.
+    st.session_state.full_docs = {}
+    # Set to the FAISS vector store once documents have been processed; the pages
+    # call `.as_retriever()` on it.
+    st.session_state.vector_store_handler = None
 
     # --- Tab-Specific State ---
-    st.session_state.qa_messages = [{"role": "assistant", "content": "How can I help with the documents?"}]
-    st.session_state.report_output = ""
-    st.session_state.comparison_output = ""
-    st.session_state.summary_output = ""
-    st.session_state.entity_output = None
-    st.session_state.debug_output = ""
+    st.session_state.qa_messages = [{"role": "assistant", "content": "Welcome! Process documents to begin."}]
+    for k in ["summary_output", "entity_output", "comparison_output", "report_output", "debug_output"]:
+        st.session_state[k] = None
+
+    # --- Settings, Usage & Insights ---
+    st.session_state.settings = {"theme": "Quantum Dark", "model": "GPT-4 Turbo", "temperature": 0.5}
+    st.session_state.api_keys = {"openai": "", "anthropic": ""}
+    st.session_state.usage_stats = {"documents_processed": 0, "queries_executed": 0, "total_words": 0}
+    st.session_state.insights_data = {"sentiment": {}, "topics": {}}
+    st.session_state.performance_log = []
     
     # --- UI State ---
     st.session_state.mobile_menu_open = False
     
-    print(f"--- NEW SESSION INITIALIZED | ID: {st.session_state.session_id} ---")
\ No newline at end of file
+    print(f"--- NEW SESSION INITIALIZED | ID: {st.session_state.session_id} ---")
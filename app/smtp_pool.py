@@ -0,0 +1,162 @@
+# app/smtp_pool.py - Process-Wide Pool of Logged-In SMTP Connections
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# Opening an `SMTP_SSL` connection costs a TCP connect, a TLS handshake and an AUTH
+# exchange - several round trips before a single byte of the email is sent. The old
+# handler paid that for every message. `SMTPPool` keeps up to SMTP_POOL_SIZE logged-in
+# connections open and hands them out one at a time:
+#
+#   - a connection is checked with `NOOP` before reuse and replaced if the server
+#     dropped it (Gmail closes idle sessions after a few minutes);
+#   - transient server replies (421 / 450 / 554) are retried with exponential backoff
+#     on a fresh connection;
+#   - all connections are closed cleanly at interpreter exit.
+# ======================================================================================
+
+import atexit
+import queue
+import smtplib
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from config import settings
+
+# Server replies that mean "try again later / on another connection".
+TRANSIENT_SMTP_CODES = {421, 450, 554}
+
+
+class SMTPPool:
+    """A bounded, thread-safe pool of authenticated `SMTP_SSL` connections."""
+
+    def __init__(self, host: str, port: int, username: str, password: str, size: int = 5):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self._idle: "queue.Queue[smtplib.SMTP_SSL]" = queue.Queue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_conn(self) -> smtplib.SMTP_SSL:
+        """Opens and logs in a new connection."""
+        conn = smtplib.SMTP_SSL(self.host, self.port)
+        conn.login(self.username, self.password)
+        return conn
+
+    def _acquire(self) -> smtplib.SMTP_SSL:
+        """Returns an idle connection, opening a new one while the pool is not full."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._new_conn()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def _release(self, conn: Optional[smtplib.SMTP_SSL]):
+        """Returns a connection to the pool, or frees its slot if it is broken (None)."""
+        if conn is None:
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @staticmethod
+    def _is_alive(conn: smtplib.SMTP_SSL) -> bool:
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(conn: smtplib.SMTP_SSL):
+        try:
+            conn.quit()
+        except Exception:
+            pass
+
+    def send(self, sender: str, recipient: str, message: Union[str, bytes]) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Sends one message over a pooled connection.
+
+        Args:
+            sender (str): The envelope sender address.
+            recipient (str): The envelope recipient address.
+            message (str | bytes): The fully serialized message.
+
+        Returns:
+            dict: The per-recipient refusals reported by `sendmail` (empty on success).
+        """
+        delay = 1.0
+        for attempt in range(settings.SMTP_MAX_RETRIES + 1):
+            conn = self._acquire()
+            try:
+                if not self._is_alive(conn):
+                    self._close(conn)
+                    conn = self._new_conn()
+                refused = conn.sendmail(sender, recipient, message)
+                self._release(conn)
+                return refused
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as e:
+                # The connection is in an unknown state after a failure; never reuse it.
+                self._close(conn)
+                self._release(None)
+                code = getattr(e, "smtp_code", None)
+                transient = code is None or code in TRANSIENT_SMTP_CODES
+                if not transient or attempt == settings.SMTP_MAX_RETRIES:
+                    raise
+                print(f"SMTP: transient error ({code}), retrying in {delay:.0f}s...")
+                time.sleep(delay)
+                delay *= 2
+            except Exception:
+                self._close(conn)
+                self._release(None)
+                raise
+
+    def close_all(self):
+        """Closes every idle connection (called automatically at exit)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+            with self._lock:
+                self._created -= 1
+
+
+_POOLS: Dict[Tuple[str, str], SMTPPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_smtp_pool(username: str, password: str) -> SMTPPool:
+    """
+    Returns the process-wide pool for a sender account, creating it on first use.
+
+    Args:
+        username (str): The SMTP login (the sender address).
+        password (str): The SMTP password / app password.
+
+    Returns:
+        SMTPPool: The shared pool for this account.
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get((username, password))
+        if pool is None:
+            pool = SMTPPool(settings.SMTP_HOST, settings.SMTP_PORT, username, password, size=settings.SMTP_POOL_SIZE)
+            _POOLS[(username, password)] = pool
+            atexit.register(pool.close_all)
+        return pool
@@ -1,5 +1,11 @@
 # config/prompts.py - Professional, Detailed Prompts for High-Quality Output
 
+# Every prompt keeps its static instructions first and the dynamic parts (retrieved
+# context, the user's request) last, so the provider's prompt-prefix cache can reuse
+# the unchanging head. The compiled template objects are built once at the bottom.
+
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+
 # --- AGENT ROUTING ---
 # This prompt is the brain of the operation. It decides which specialist to call.
 # Note: This prompt is for the AUTOMATIC chat-based routing. The UI buttons will bypass this.
@@ -35,13 +41,13 @@ Here are the available agents and their specializations:
         - "What are the key differences in the legal clauses of both contracts?"
         - "Contrast the marketing strategies outlined in the two business plans."
 
+Based on the detailed analysis of the user's query and keywords, which agent is the most suitable?
+**Your response must be ONLY the agent's name**: `QNA_AGENT`, `REPORT_AGENT`, or `COMPARISON_AGENT`.
+
 **User's Query:**
 ---
 {query}
 ---
-
-Based on the detailed analysis of the user's query and keywords, which agent is the most suitable?
-**Your response must be ONLY the agent's name**: `QNA_AGENT`, `REPORT_AGENT`, or `COMPARISON_AGENT`.
 """
 
 # --- SPECIALIZED AGENT PROMPTS ---
@@ -67,7 +73,10 @@ QNA_PROMPT_TEMPLATE = """
 """
 
 # This prompt guides the Report Agent to act like a professional analyst.
-REPORT_PROMPT_TEMPLATE = """
+# It is split in two: the static instructions (sent as the system message, always
+# byte-identical so the provider's prompt-prefix cache can reuse them) and the dynamic
+# part with the retrieved context and the request, which comes last.
+REPORT_SYSTEM_PROMPT = """
 **Your Persona**: You are "Cogni-Synth," a world-class AI Business Analyst and Report Generator.
 **Your Mission**: To transform the raw information from the provided document context into a polished, insightful, and professionally formatted report based on the user's request.
 
@@ -81,7 +90,9 @@ REPORT_PROMPT_TEMPLATE = """
 2.  **Synthesize, Don't Just List**: Do not simply copy-paste text. Synthesize the information to provide a coherent narrative or analysis. Extract the essence of the information.
 3.  **Maintain Neutrality**: Your report should be objective and based strictly on the facts presented in the context.
 4.  **Completeness**: Ensure your report comprehensively addresses all aspects of the user's request, drawing from all relevant parts of the provided context.
+"""
 
+REPORT_HUMAN_TEMPLATE = """
 **Context from Uploaded Documents**:
 ---
 {context}
@@ -93,7 +104,8 @@ REPORT_PROMPT_TEMPLATE = """
 """
 
 # This prompt makes the Comparison Agent a specialist in comparative analysis.
-COMPARISON_PROMPT_TEMPLATE = """
+# Like the report prompt, it is split into static system instructions and a dynamic tail.
+COMPARISON_SYSTEM_PROMPT = """
 **Your Persona**: You are "Analytica-Compare," an AI specialist in detailed comparative analysis.
 **Your Objective**: To meticulously compare and contrast the provided information based on the user's specific request. Your analysis must be clear, structured, and easy to understand.
 
@@ -115,7 +127,9 @@ COMPARISON_PROMPT_TEMPLATE = """
 | Timeline | [Value] | [Value] |
 3.  **Evidence-Based**: Every point you make must be directly supported by the text in the 'Context' section. Quote or reference key phrases where appropriate to add weight to your analysis.
 4.  **Clarity and Precision**: Use precise language. Avoid vague statements. Clearly state what is different and what is similar.
+"""
 
+COMPARISON_HUMAN_TEMPLATE = """
 **Context from Documents for Comparison**:
 ---
 {context}
@@ -124,4 +138,19 @@ COMPARISON_PROMPT_TEMPLATE = """
 **User's Comparison Request**: {input}
 
 **Structured Comparative Analysis**:
-"""
\ No newline at end of file
+"""
+
+# --- COMPILED TEMPLATES ---
+# Parsing a template (variable extraction, message building) is done once at import;
+# the agents share these objects instead of re-compiling the strings per request.
+ROUTER_PROMPT = PromptTemplate.from_template(ROUTER_PROMPT_TEMPLATE)
+
+REPORT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", REPORT_SYSTEM_PROMPT),
+    ("human", REPORT_HUMAN_TEMPLATE),
+])
+
+COMPARISON_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", COMPARISON_SYSTEM_PROMPT),
+    ("human", COMPARISON_HUMAN_TEMPLATE),
+])
@@ -12,7 +12,10 @@ GOOGLE_API_KEY = st.secrets.get("GOOGLE_API_KEY")
 # --- Model Names ---
 ROUTER_MODEL = "gpt-3.5-turbo"
 REPORT_MODEL = "gpt-3.5-turbo"
-QNA_MODEL = "gemini-1.5-flash"
+# Pinned to a versioned model so summaries and their Gemini context caches use the same one.
+QNA_MODEL = "gemini-1.5-flash-001"
+# Extraction is a structured, low-creativity task, so it always runs on the fast Flash tier.
+EXTRACTION_MODEL = "gemini-1.5-flash"
 
 # --- Vector Store Settings ---
 FAISS_PERSIST_DIRECTORY = "faiss_index_store"
@@ -20,6 +23,93 @@ FAISS_PERSIST_DIRECTORY = "faiss_index_store"
 # --- Document Processing ---
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 150
+# Uploaded files are parsed in parallel by up to this many worker threads.
+DOC_LOADER_MAX_WORKERS = 8
+
+# --- Entity Extraction ---
+# Maximum number of extraction calls allowed in flight at the same time.
+EXTRACTION_CONCURRENCY = 8
+
+# --- Summarization ---
+# Maximum number of map-step summarization calls allowed in flight at the same time.
+SUMMARY_MAP_CONCURRENCY = 16
+# Gemini context caching: documents at least this large are uploaded once as cached content,
+# so summarizing them again (e.g. "brief" after "detailed") does not resend every token.
+# The API only accepts explicitly versioned models and has a minimum cacheable size.
+GEMINI_CONTEXT_CACHE_MODEL = f"models/{QNA_MODEL}"
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = 32_768
+# Larger corpora exceed the model's context window and are summarized with map-reduce instead.
+GEMINI_CONTEXT_CACHE_MAX_TOKENS = 900_000
+GEMINI_CONTEXT_CACHE_TTL_MINUTES = 60
+
+# --- API Rate Limits ---
+# Requests-per-minute and tokens-per-minute budgets used by utils/rate_limiter.py.
+GEMINI_RPM = 60
+GEMINI_TPM = 1_000_000
+OPENAI_RPM = 500
+OPENAI_TPM = 200_000
+
+# --- Response Cache ---
+RESPONSE_CACHE_PATH = ".cache/responses.jsonl"
+RESPONSE_CACHE_SIZE = 1024
+# Finished summaries are reused for a week; bump PROMPT_VERSION in the summarizer to invalidate them early.
+SUMMARY_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# --- Embedding Cache ---
+EMBEDDING_CACHE_DIR = ".cache/embeddings"
+# The local sentence-transformers model (indexing and the router's semantic cache).
+LOCAL_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Texts encoded per forward pass by the local embedding model.
+EMBEDDING_BATCH_SIZE = 64
+# Texts per forward pass when the embedding model runs on a CUDA GPU (in FP16).
+EMBEDDING_GPU_BATCH_SIZE = 256
+# Chunks per embedding API request, and how many requests run concurrently.
+EMBED_API_BATCH_SIZE = 100
+EMBED_API_MAX_WORKERS = 8
+
+# --- Parsed Document Cache ---
+# Loader output per uploaded file, keyed by the SHA-256 of the file's bytes.
+PARSED_DOCS_CACHE_DIR = ".cache/parsed_docs"
+# Extracted text per uploaded file (main app parser), keyed by a BLAKE2b hash of its bytes.
+PARSED_TEXT_CACHE_DIR = ".cache/parsed_text"
+
+# --- Full Document Store ---
+# Full text of processed documents; the session state only keeps keys into it.
+FULL_DOCS_DIR = ".cache/full_docs"
+
+# --- LLM Caches ---
+# Exact-prompt cache shared by every LangChain model call (see utils/llm_clients.py).
+LLM_CACHE_PATH = ".cache/llm_cache.db"
+# Minimum cosine similarity for two routing queries to share a cached decision.
+ROUTER_SEMANTIC_CACHE_THRESHOLD = 0.98
+
+# --- Timeouts & Concurrency ---
+# Per-request timeout of every LLM client call (milliseconds).
+RAG_CLIENT_TIMEOUT_MS = 60_000
+# Overall timeout of a whole non-streaming agent chain call (milliseconds).
+RAG_CHAIN_TIMEOUT_MS = 120_000
+# Retries per LLM call. Kept at 0 to bound tail latency; the rate limiter already
+# prevents most 429s, and the agents have their own fallbacks.
+LLM_MAX_RETRIES = 0
+# Maximum parallel branches / batch items inside one chain call.
+RAG_MAX_CONCURRENCY = 8
+
+# --- LLM Connection Pooling ---
+# Sizes of the keep-alive HTTP connection pool shared by all OpenAI clients.
+LLM_HTTP_MAX_CONNECTIONS = 64
+LLM_HTTP_MAX_KEEPALIVE = 32
+# Open the pooled connections with a 1-token request when the app starts.
+WARM_UP_LLM_CLIENTS = True
+
+# --- Email (SMTP) ---
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 465
+# Logged-in SMTP connections kept open and reused across verification emails.
+SMTP_POOL_SIZE = 5
+# Retries (with exponential backoff) when the server answers with a transient error.
+SMTP_MAX_RETRIES = 3
+# Concurrent SMTP sessions used for bulk sends (Gmail allows at most 15 per account).
+EMAIL_BULK_WORKERS = 15
 
 def are_keys_configured():
     """Checks if keys are available via Streamlit secrets."""
@@ -36,8 +126,40 @@ def are_keys_configured():
 # We no longer need the FAISS directory, as it's handled internally.
 # Instead, we define the paths for the complete retriever state.
 VECTOR_STORE_PATH = "storage/vector_store"
-DOC_STORE_PATH = "storage/doc_store"
+# SQLite database holding the parent documents (see utils/sqlite_docstore.py).
+DOC_STORE_PATH = "storage/doc_store.sqlite3"
 
 # --- Retriever Configuration ---
 CHILD_CHUNK_SIZE = 400
-CHILD_CHUNK_OVERLAP = 50
\ No newline at end of file
+CHILD_CHUNK_OVERLAP = 50
+# Split uploads with the NumPy splitter (utils/fast_splitter.py); False = LangChain's recursive splitter.
+USE_FAST_SPLITTER = True
+# Parent documents split, embedded and stored per micro-batch in `build_index`.
+INDEX_PARENT_BATCH_SIZE = 32
+# Embedded batches that may wait for the FAISS/docstore writer thread.
+INDEX_PIPELINE_DEPTH = 4
+# Child chunks per embedding call when indexing (chunks are grouped by length first).
+INDEX_EMBED_BATCH_SIZE = 128
+# Child splitting runs in a process pool once a batch has at least this many parent
+# documents and characters; smaller batches split faster in-process.
+SPLIT_PARALLEL_MIN_DOCS = 4
+SPLIT_PARALLEL_MIN_CHARS = 1_000_000
+# Worker processes for child splitting (None = os.cpu_count()).
+SPLIT_MAX_WORKERS = None
+
+# --- FAISS Index ---
+# Below this many child vectors an exact flat index is used; above it, an HNSW graph.
+FLAT_INDEX_MAX_VECTORS = 5_000
+# HNSW graph degree and build/search breadth (higher = better recall, slower).
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 40
+HNSW_EF_SEARCH = 16
+# Storage for child vectors in HNSW indexes: "8bit" (1 byte/dim), "fp16" (2 bytes/dim)
+# or None (FP32). Flat indexes below FLAT_INDEX_MAX_VECTORS are never quantized.
+FAISS_SCALAR_QUANTIZER = "8bit"
+# Vectors collected (across batches) before a quantized index is trained; it learns its
+# per-dimension value ranges from them, so values outside the sample are clipped.
+FAISS_SQ_TRAIN_SAMPLE = 20_000
+# Move the flat index to a GPU when one is present. Only worth it for batched search;
+# this app searches one query vector at a time, so it is off by default.
+FAISS_USE_GPU = False
@@ -16,7 +16,10 @@
 #     entire batch processing operation.
 # 3.  **Informative Feedback:** The function provides real-time feedback to both the
 #     developer (via `print` statements) and the end-user (via `st.write` and `st.error`).
-# 4.  **Decoupling:** This module is solely responsible for loading and preparing documents.
+# 4.  **Content-Addressed Parse Cache:** Parsing (especially PDFs) is the expensive
+#     step, so the loader output for every file is pickled to disk under the SHA-256
+#     of its bytes. Re-uploading the same file - in any session - skips parsing.
+# 5.  **Decoupling:** This module is solely responsible for loading and preparing documents.
 #     It does NOT perform text splitting; that responsibility is delegated to the
 #     `VectorStoreHandler` (specifically the `ParentDocumentRetriever`), adhering to the
 #     Single Responsibility Principle.
@@ -24,71 +27,135 @@
 
 
 # --- Core Streamlit and Python Imports ---
+import hashlib
+import io
 import os
+import pickle
+import threading
+from functools import lru_cache
 import streamlit as st
-from typing import List, Dict, Any, Callable
-
-# --- LangChain Document Loader Imports ---
-# We import all the necessary loaders for handling different file formats.
-from langchain_community.document_loaders import (
-    PyPDFLoader,          # For PDF files
-    TextLoader,           # For .txt files
-    Docx2txtLoader,       # For Microsoft Word .docx files
-    UnstructuredFileLoader # A powerful fallback for various other types
-)
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+# --- Document Parsing Imports ---
+# PDFs and Word files are parsed straight from the uploaded bytes; only the generic
+# fallback loader still needs a copy of the file on disk.
+import docx2txt
+from pypdf import PdfReader
+try:
+    # PDFium (C++) extracts text several times faster than pure-Python pypdf.
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+from langchain_community.document_loaders import UnstructuredFileLoader # A powerful fallback for various other types
 from langchain_core.documents import Document
 
+from config import settings
+
 # ======================================================================================
 # SECTION 1: LOADER CONFIGURATION
 # ======================================================================================
 
+# Part of every parse-cache key. Bump it whenever a loader's output changes, so
+# documents parsed by the old loaders are not served from the cache.
+LOADER_VERSION = "3"
+
+# PDFium is not thread-safe, so calls into it from the loader threads are serialized.
+# Even so, it is much faster than pypdf, which it replaces whenever it is installed.
+_PDFIUM_LOCK = threading.Lock()
+
+def load_pdf_bytes(file_bytes: bytes, file_name: str) -> List[Document]:
+    """Extracts the text of each PDF page (one Document per page) from in-memory bytes."""
+    if pypdfium2 is not None:
+        with _PDFIUM_LOCK:
+            pdf = pypdfium2.PdfDocument(file_bytes)
+            try:
+                page_texts = []
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    page_texts.append(textpage.get_text_range())
+                    textpage.close()
+                    page.close()
+            finally:
+                pdf.close()
+        return [
+            Document(page_content=text, metadata={"source": file_name, "page": i})
+            for i, text in enumerate(page_texts)
+        ]
+
+    reader = PdfReader(io.BytesIO(file_bytes))
+    return [
+        Document(page_content=page.extract_text() or "", metadata={"source": file_name, "page": i})
+        for i, page in enumerate(reader.pages)
+    ]
+
+def load_text_bytes(file_bytes: bytes, file_name: str) -> List[Document]:
+    """Decodes a UTF-8 text file into a single Document."""
+    return [Document(page_content=file_bytes.decode("utf-8"), metadata={"source": file_name})]
+
+def load_docx_bytes(file_bytes: bytes, file_name: str) -> List[Document]:
+    """Extracts the text of a Word .docx file into a single Document."""
+    return [Document(page_content=docx2txt.process(io.BytesIO(file_bytes)), metadata={"source": file_name})]
+
+def load_with_unstructured(file_bytes: bytes, file_name: str) -> List[Document]:
+    """
+    General-purpose fallback for file types without a dedicated loader. The
+    `UnstructuredFileLoader` can only read from disk, so the file is written to the
+    temporary directory first.
+    """
+    temp_file_path = os.path.join(create_and_log_temp_dir(), file_name)
+    with open(temp_file_path, "wb") as f:
+        f.write(file_bytes)
+    return UnstructuredFileLoader(temp_file_path, mode="single").load()
+
 # This mapping is the key to making our document processor extensible.
 # To add a new file type, you simply add a new entry to this dictionary.
-# The key is the file extension, and the value is a lambda function that
-# returns an instance of the appropriate loader.
-LOADER_MAPPING: Dict[str, Callable[[str], Any]] = {
-    ".pdf": lambda path: PyPDFLoader(path, extract_images=False),
-    ".txt": lambda path: TextLoader(path, encoding='utf-8'),
-    ".docx": lambda path: Docx2txtLoader(path),
+# The key is the file extension, and the value is a (display name, loader function)
+# pair; the function turns the uploaded file's bytes into a list of Documents. The
+# display name is static, so reporting which loader ran never has to build anything.
+LoaderEntry = Tuple[str, Callable[[bytes, str], List[Document]]]
+
+LOADER_MAPPING: Dict[str, LoaderEntry] = {
+    ".pdf": ("PDFium" if pypdfium2 is not None else "pypdf", load_pdf_bytes),
+    ".txt": ("TextLoader", load_text_bytes),
+    ".docx": ("docx2txt", load_docx_bytes),
     # Add other file types here if needed in the future, e.g.:
-    # ".csv": lambda path: CSVLoader(path),
-    # ".html": lambda path: UnstructuredHTMLLoader(path),
+    # ".csv": ("CSVLoader", load_csv_bytes),
 }
+FALLBACK_LOADER: LoaderEntry = ("UnstructuredFileLoader", load_with_unstructured)
 
 # ======================================================================================
 # SECTION 2: HELPER FUNCTIONS
 # ======================================================================================
 
-def get_loader_for_file(file_path: str, file_name: str) -> Any:
+@lru_cache(maxsize=None)
+def _loader_for_extension(file_extension: str) -> LoaderEntry:
+    """Resolves (and logs) the loader for an extension once; later files reuse the result."""
+    entry = LOADER_MAPPING.get(file_extension)
+    if entry:
+        print(f"Found specific loader for '{file_extension}' files.")
+        return entry
+    # If no specific loader is found, use the robust UnstructuredFileLoader.
+    # This loader can handle a wide variety of file types, making our system flexible.
+    print(f"No specific loader for '{file_extension}'. Defaulting to UnstructuredFileLoader.")
+    return FALLBACK_LOADER
+
+def get_loader_for_file(file_name: str) -> LoaderEntry:
     """
     Selects the most appropriate document loader for a given file based on its extension.
     If a specific loader is not found for the extension, it defaults to the powerful
     `UnstructuredFileLoader` as a general-purpose fallback.
 
     Args:
-        file_path (str): The full path to the temporary file on disk.
         file_name (str): The original name of the uploaded file.
 
     Returns:
-        An instance of a LangChain DocumentLoader ready to be used.
+        A (display name, loader function) pair; the function loads the file's bytes
+        into a list of Documents.
     """
     # Extract the file extension and convert it to lowercase for case-insensitive matching.
     file_extension = os.path.splitext(file_name)[1].lower()
-    
-    # Look up the loader in our mapping.
-    loader_callable = LOADER_MAPPING.get(file_extension)
-    
-    if loader_callable:
-        # If a specific loader is found, instantiate it with the file path.
-        print(f"Found specific loader for '{file_extension}' files.")
-        st.write(f"-> Using `{loader_callable(file_path).__class__.__name__}` for `{file_name}`")
-        return loader_callable(file_path)
-    else:
-        # If no specific loader is found, use the robust UnstructuredFileLoader.
-        # This loader can handle a wide variety of file types, making our system flexible.
-        print(f"No specific loader for '{file_extension}'. Defaulting to UnstructuredFileLoader.")
-        st.write(f"-> Using `UnstructuredFileLoader` for unsupported type: `{file_name}`")
-        return UnstructuredFileLoader(file_path, mode="single")
+    return _loader_for_extension(file_extension)
 
 def create_and_log_temp_dir() -> str:
     """
@@ -102,31 +169,120 @@ def create_and_log_temp_dir() -> str:
     temp_dir = "temp_uploaded_files"
     if not os.path.exists(temp_dir):
         print(f"Creating temporary directory for file processing at: '{temp_dir}'")
-        os.makedirs(temp_dir)
+        os.makedirs(temp_dir, exist_ok=True)
     return temp_dir
 
+def _parsed_cache_path(file_bytes: bytes, file_name: str) -> str:
+    """Returns the parse-cache path for a file's content (the extension picks the loader)."""
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    file_extension = os.path.splitext(file_name)[1].lower()
+    return os.path.join(settings.PARSED_DOCS_CACHE_DIR, f"{digest}{file_extension}.v{LOADER_VERSION}.pkl")
+
+def load_parsed_from_cache(cache_path: str) -> Optional[List[Document]]:
+    """Loads previously parsed documents, treating unreadable entries as a cache miss."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"WARNING: Ignoring unreadable parse cache entry '{cache_path}': {e}")
+        return None
+
+def save_parsed_to_cache(cache_path: str, docs: List[Document]):
+    """Writes parsed documents atomically so a crash never leaves a half-written entry."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(docs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"WARNING: Could not write parse cache entry '{cache_path}': {e}")
+
+def _load_one(file_name: str, file_bytes: bytes) -> Tuple[List[Document], str]:
+    """
+    Loads a single uploaded file into LangChain documents. Runs in a worker thread,
+    so it must not call Streamlit; UI feedback is given by the caller.
+
+    Args:
+        file_name (str): The original name of the uploaded file.
+        file_bytes (bytes): The file's content.
+
+    Returns:
+        A tuple of the loaded documents and the name of the loader that produced them.
+    """
+    cache_path = _parsed_cache_path(file_bytes, file_name)
+    docs_from_file = load_parsed_from_cache(cache_path)
+    if docs_from_file is not None:
+        print(f"Parse cache hit for '{file_name}'.")
+        loader_name = "parse cache"
+    else:
+        # Get the correct loader for the current file type and parse the bytes directly.
+        # A single file (like a PDF) can result in multiple Document objects (one per page).
+        loader_name, loader_fn = get_loader_for_file(file_name)
+        docs_from_file = loader_fn(file_bytes, file_name)
+        save_parsed_to_cache(cache_path, docs_from_file)
+
+    # --- Metadata Enrichment ---
+    # This is a critical step. We iterate through each document part (e.g., each page)
+    # and set its source to the original filename. This allows us to trace any piece
+    # of information back to its source file. It is always overwritten: the parse cache
+    # is keyed by content, so a cache hit still carries the name of the earlier upload.
+    for doc in docs_from_file:
+        doc.metadata['source'] = file_name
+        # We could add more metadata here, like the upload timestamp.
+        # doc.metadata['upload_time'] = time.time()
+    return docs_from_file, loader_name
+
+def dedupe_documents(docs: List[Document]) -> List[Document]:
+    """
+    Drops pages whose text (ignoring surrounding whitespace) already appeared earlier
+    in the SAME source file, e.g. repeated cover pages, tables of contents or legal
+    boilerplate. Every duplicate would otherwise be embedded and sent to the summarizer
+    again. Pages are never dropped across files, so every upload keeps its own pages
+    for per-source comparison and previews.
+
+    Args:
+        docs (List[Document]): The loaded pages, in order.
+
+    Returns:
+        List[Document]: The first occurrence of every distinct page per source, in order.
+    """
+    seen = set()
+    unique_docs = []
+    for doc in docs:
+        # BLAKE2b is faster than SHA-256 and more than collision-resistant enough here.
+        digest = hashlib.blake2b(doc.page_content.strip().encode("utf-8"), digest_size=16).digest()
+        key = (doc.metadata.get("source"), digest)
+        if key not in seen:
+            seen.add(key)
+            unique_docs.append(doc)
+    if len(unique_docs) < len(docs):
+        print(f"Removed {len(docs) - len(unique_docs)} duplicate page(s).")
+    return unique_docs
+
 # ======================================================================================
 # SECTION 3: MAIN DOCUMENT PROCESSING FUNCTION
 # ======================================================================================
 
-@st.cache_data(show_spinner="Reading and preparing documents...")
 def process_documents(uploaded_files: List[Any]) -> List[Document]:
     """
     The core function that orchestrates the entire document ingestion process.
 
-    This function is cached using `@st.cache_data` to improve performance. If the same
-    set of files is uploaded again, Streamlit will return the cached result instead of
-    re-processing everything from scratch.
+    Parsing is cached per file on disk, keyed by the SHA-256 of the file's content.
+    If a file was processed before (in any session), its documents are loaded from the
+    cache instead of being parsed again.
 
     The process involves:
-    1.  Creating a temporary directory to store files.
-    2.  Iterating through each uploaded file.
-    3.  Saving the file to the temporary directory.
-    4.  Selecting the appropriate loader for the file type.
-    5.  Loading the document's content into memory.
-    6.  Crucially, tagging each loaded document with its source filename in the metadata.
+    1.  Loading the uploaded files in parallel worker threads. For each file:
+    2.  Reading its bytes from the uploader (no temporary copy on disk).
+    3.  Selecting the appropriate loader for the file type.
+    4.  Parsing the document's content straight from memory.
+    5.  Crucially, tagging each loaded document with its source filename in the metadata.
         This is essential for source-specific Q&A and for providing references.
-    7.  Aggregating all loaded documents into a single list.
+    6.  Aggregating all loaded documents into a single list, in upload order, and
+        dropping pages whose content is an exact duplicate of an earlier page.
 
     Args:
         uploaded_files (list): A list of file-like objects from Streamlit's uploader.
@@ -139,58 +295,39 @@ def process_documents(uploaded_files: List[Any]) -> List[Document]:
         st.warning("No files were provided to the document processor.")
         return []
 
-    # Get the path to the temporary directory.
-    temp_dir = create_and_log_temp_dir()
-    
-    all_loaded_docs: List[Document] = []
-
     # Create a progress bar in the UI for a better user experience.
     progress_bar = st.progress(0, text="Starting document processing...")
-    
-    # Iterate through each uploaded file with an index for the progress bar.
-    for i, file in enumerate(uploaded_files):
-        # Update the progress bar and status text.
-        progress_text = f"Processing file {i + 1}/{len(uploaded_files)}: {file.name}"
-        progress_bar.progress((i + 1) / len(uploaded_files), text=progress_text)
-        
-        # Construct a temporary path and write the file's content to it.
-        # This is necessary because LangChain loaders typically operate on file paths.
-        temp_file_path = os.path.join(temp_dir, file.name)
-        with open(temp_file_path, "wb") as f:
-            f.write(file.getvalue())
-        
-        try:
-            # Get the correct loader for the current file type.
-            loader = get_loader_for_file(temp_file_path, file.name)
-            
-            # Load the document(s) from the file. A single file (like a PDF) can
-            # result in multiple Document objects (one per page).
-            docs_from_file = loader.load()
-            
-            # --- Metadata Enrichment ---
-            # This is a critical step. We iterate through each document part (e.g., each page)
-            # and add the original filename to its metadata. This allows us to trace
-            # any piece of information back to its source file.
-            for doc in docs_from_file:
-                if 'source' not in doc.metadata:
-                    doc.metadata['source'] = file.name
-                # We could add more metadata here, like the upload timestamp.
-                # doc.metadata['upload_time'] = time.time()
-            
-            # Add the processed documents from this file to our main list.
-            all_loaded_docs.extend(docs_from_file)
-            
-            print(f"SUCCESS: Successfully loaded '{file.name}', found {len(docs_from_file)} document parts.")
-            
-        except Exception as e:
-            # If any error occurs during the loading of a single file, we catch it,
-            # display an error message in the UI, log it to the console, and
-            # continue to the next file. This makes the process robust.
-            error_msg = f"Error processing file '{file.name}': {e}"
-            st.error(error_msg)
-            print(f"ERROR: {error_msg}")
-            # Continue to the next iteration of the loop.
-            continue
+
+    # Files are independent, so they are loaded in parallel. Results are kept per file
+    # index, so the final list stays in upload order no matter which file finishes first.
+    docs_per_file: List[List[Document]] = [[] for _ in uploaded_files]
+    max_workers = min(settings.DOC_LOADER_MAX_WORKERS, len(uploaded_files))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="doc-loader") as executor:
+        futures = {
+            executor.submit(_load_one, file.name, file.getvalue()): i
+            for i, file in enumerate(uploaded_files)
+        }
+        for completed, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            file_name = uploaded_files[i].name
+            # Update the progress bar and status text.
+            progress_text = f"Processed file {completed}/{len(uploaded_files)}: {file_name}"
+            progress_bar.progress(completed / len(uploaded_files), text=progress_text)
+
+            try:
+                docs_from_file, loader_name = future.result()
+                st.write(f"-> Using `{loader_name}` for `{file_name}`")
+                docs_per_file[i] = docs_from_file
+                print(f"SUCCESS: Successfully loaded '{file_name}', found {len(docs_from_file)} document parts.")
+            except Exception as e:
+                # If any error occurs during the loading of a single file, we catch it,
+                # display an error message in the UI, log it to the console, and
+                # continue with the other files. This makes the process robust.
+                error_msg = f"Error processing file '{file_name}': {e}"
+                st.error(error_msg)
+                print(f"ERROR: {error_msg}")
+
+    all_loaded_docs = dedupe_documents([doc for docs_from_file in docs_per_file for doc in docs_from_file])
     
     # Finalize the progress bar.
     progress_bar.progress(1.0, text="Document processing complete!")
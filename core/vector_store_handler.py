@@ -25,50 +25,362 @@
 #
 # 4.  **Professional Structure and Documentation:** The code is meticulously organized
 #     and documented to the highest professional standards.
+#
+# NOTE: The Streamlit UI does not use `VectorStoreHandler`. main.py indexes each upload
+# into an in-memory store built by `build_faiss_store`, and the pages read that store
+# from session state. The handler is the persistent, disk-backed indexer for callers
+# that construct it themselves.
 # ======================================================================================
 
 
 # --- Core & Third-Party Imports ---
 import streamlit as st
 import faiss
+import hashlib
+import itertools
+import json
 import os
-import pickle
-from typing import List
+import queue
+import threading
+import uuid
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 # --- LangChain Specific Imports ---
-from langchain.storage import InMemoryStore
 from langchain.retrievers import ParentDocumentRetriever
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS as LangChainFAISS
-from langchain_community.embeddings import SentenceTransformerEmbeddings
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_community.docstore import InMemoryDocstore
 from langchain_core.documents import Document # The corrected import
 # --- Project-Specific Imports ---
 from config import settings
+from utils.cached_embeddings import CachedEmbeddings
+from utils.fast_embeddings import get_shared_sentence_embeddings
+from utils.fast_splitter import FastCharSplitter
+from utils.response_cache import attach_corpus_fingerprint, corpus_fingerprint
+from utils.sqlite_docstore import SQLiteDocStore
 
 # ======================================================================================
 # SECTION 1: EMBEDDING MODEL INITIALIZATION (CACHED FOR PERFORMANCE)
 # ======================================================================================
 
+EMBEDDING_MODEL_NAME = settings.LOCAL_EMBEDDING_MODEL
+
+def load_embedding_function() -> CachedEmbeddings:
+    """
+    Loads the local SentenceTransformer embedding model (once per process). It makes
+    no Streamlit calls and raises on failure, so it can run on a worker thread; the
+    caller reports errors from the script thread.
+    """
+    print(f"Initializing LOCAL Sentence Transformer model: {EMBEDDING_MODEL_NAME}")
+    # Wrapped in a disk cache so re-indexing the same content skips the model entirely.
+    # A CUDA GPU is used when present, else int8 ONNX Runtime; see utils/fast_embeddings.py.
+    embeddings = CachedEmbeddings(
+        get_shared_sentence_embeddings(
+            EMBEDDING_MODEL_NAME,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            gpu_batch_size=settings.EMBEDDING_GPU_BATCH_SIZE,
+        ),
+        cache_dir=settings.EMBEDDING_CACHE_DIR,
+    )
+    print("Local embedding model loaded successfully.")
+    return embeddings
+
+def _stop_on_embedding_failure(e: Exception):
+    """Shows a model-load failure and halts the script run (script thread only)."""
+    st.error(f"Failed to load the embedding model '{EMBEDDING_MODEL_NAME}'. The application cannot function without it. Error: {e}")
+    print(f"CRITICAL ERROR: Could not load embedding model. {e}")
+    st.stop()
+
 @st.cache_resource(show_spinner="Loading embedding model into memory...")
 def get_embedding_function():
     """
     Initializes and returns a SentenceTransformer embedding model.
     This is cached to ensure the model is loaded only ONCE per session.
+    Must be called from the Streamlit script thread.
     """
-    model_name = "all-MiniLM-L6-v2"
-    print(f"Initializing LOCAL Sentence Transformer model: {model_name}")
     try:
-        embeddings = SentenceTransformerEmbeddings(
-            model_name=model_name,
-            model_kwargs={'device': 'cpu'}
-        )
-        print("Local embedding model loaded successfully.")
-        return embeddings
+        return load_embedding_function()
     except Exception as e:
-        st.error(f"Failed to load the embedding model '{model_name}'. The application cannot function without it. Error: {e}")
-        print(f"CRITICAL ERROR: Could not load embedding model. {e}")
-        st.stop()
+        _stop_on_embedding_failure(e)
+
+# ======================================================================================
+# SECTION 1B: LENGTH-ADAPTIVE CHUNKING
+# ======================================================================================
+
+def chunk_params(total_chars: int) -> Tuple[int, int]:
+    """
+    Picks the text-splitter chunk size and overlap from the total length of the
+    documents being indexed. Short documents get small chunks (precise retrieval
+    without over-fragmenting); long ones get larger chunks, so the number of chunks -
+    and with it the number of embedding calls - grows more slowly than the text.
+
+    Args:
+        total_chars (int): The combined length of the documents, in characters.
+
+    Returns:
+        Tuple[int, int]: (chunk_size, chunk_overlap), in characters.
+    """
+    if total_chars < 8_000:
+        return 800, 100
+    if total_chars < 80_000:
+        return 1500, 200
+    return 2500, 250
+
+# GPU memory/streams for FAISS, allocated once and shared by every GPU index.
+_GPU_RESOURCES = None
+
+# all-MiniLM-L6-v2 produces 384-dimensional vectors.
+EMBEDDING_DIMENSION = 384
+
+# Values of `settings.FAISS_SCALAR_QUANTIZER` -> FAISS scalar quantizer types.
+SCALAR_QUANTIZER_TYPES = {
+    "8bit": faiss.ScalarQuantizer.QT_8bit,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+}
+
+def create_faiss_index(expected_vectors: int, dimension: int = EMBEDDING_DIMENSION):
+    """
+    Creates the FAISS index for the child-chunk vectors. Small corpora use exact
+    brute-force search (fastest below a few thousand vectors); larger ones use an
+    HNSW graph, whose approximate search grows roughly with log(N) instead of N.
+
+    Vectors are L2-normalized on insert and at query time (see `faiss_store_kwargs`),
+    so inner product ranks exactly like L2 distance, and flat search becomes a
+    single matrix product with no per-vector norm terms.
+
+    With `settings.FAISS_SCALAR_QUANTIZER` set, HNSW indexes store vectors as 8-bit
+    codes or FP16 instead of FP32, so every search scans 4x / 2x fewer bytes. Small
+    flat indexes are already cheap to scan and stay exact. Quantized indexes must be
+    trained before the first add (see `VectorStoreHandler._store_worker`).
+
+    Args:
+        expected_vectors (int): The estimated number of child chunks to be indexed.
+        dimension (int): The vector size (defaults to the local embedding model's).
+
+    Returns:
+        A FAISS index using inner-product similarity.
+    """
+    quantizer = SCALAR_QUANTIZER_TYPES.get(settings.FAISS_SCALAR_QUANTIZER)
+    if expected_vectors < settings.FLAT_INDEX_MAX_VECTORS:
+        print(f"Creating exact IndexFlatIP (~{expected_vectors} vectors expected).")
+        return faiss.IndexFlatIP(dimension)
+    if quantizer is None:
+        print(f"Creating IndexHNSWFlat (M={settings.HNSW_M}, ~{expected_vectors} vectors expected).")
+        index = faiss.IndexHNSWFlat(dimension, settings.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    else:
+        print(f"Creating IndexHNSWSQ (M={settings.HNSW_M}, {settings.FAISS_SCALAR_QUANTIZER}, ~{expected_vectors} vectors expected).")
+        index = faiss.IndexHNSWSQ(dimension, quantizer, settings.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = settings.HNSW_EF_SEARCH
+    return index
+
+def faiss_store_kwargs(index) -> dict:
+    """
+    Returns the LangChain FAISS options matching an index's metric. Inner-product
+    indexes hold unit vectors, so LangChain must normalize added and query vectors;
+    indexes built before the switch to inner product keep plain L2 search.
+    """
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return {"normalize_L2": True, "distance_strategy": DistanceStrategy.MAX_INNER_PRODUCT}
+    return {}
+
+def build_faiss_store(docs: List[Document], embeddings, batch_size: int, max_workers: int) -> LangChainFAISS:
+    """
+    Builds a cosine-similarity FAISS store over `docs` for API-backed embeddings.
+    Embedding is network-bound, so the chunks are sent in batches of `batch_size`
+    concurrently (up to `max_workers` requests in flight); the vectors are then
+    normalized and added in one bulk call to the index `create_faiss_index` picks
+    for their count (exact inner product for small corpora, HNSW above that).
+
+    Args:
+        docs (List[Document]): The chunks to index (text is kept for retrieval).
+        embeddings: The LangChain `Embeddings` object.
+        batch_size (int): Chunks per `embed_documents` request.
+        max_workers (int): Maximum concurrent embedding requests.
+
+    Returns:
+        LangChainFAISS: The populated vector store.
+    """
+    texts = [doc.page_content for doc in docs]
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        vectors = np.vstack([np.asarray(batch, dtype=np.float32) for batch in executor.map(embeddings.embed_documents, batches)])
+    faiss.normalize_L2(vectors)
+
+    index = create_faiss_index(len(vectors), vectors.shape[1])
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    ids = [str(uuid.uuid4()) for _ in docs]
+    store = LangChainFAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids)),
+        **faiss_store_kwargs(index),
+    )
+    # Hashed once here, so cached agent answers are keyed by content without a per-query scan.
+    attach_corpus_fingerprint(store, corpus_fingerprint(docs))
+    return store
+
+def move_index_to_gpu(index):
+    """
+    Moves a FAISS index to the first GPU when GPU search is enabled and available.
+    Returns the index unchanged otherwise (and on any failure, e.g. index types such
+    as HNSW that have no GPU implementation).
+    """
+    if not settings.FAISS_USE_GPU:
+        return index
+    try:
+        if faiss.get_num_gpus() == 0:
+            return index
+        global _GPU_RESOURCES
+        if _GPU_RESOURCES is None:
+            _GPU_RESOURCES = faiss.StandardGpuResources()
+        gpu_index = faiss.index_cpu_to_gpu(_GPU_RESOURCES, 0, index)
+        print("FAISS index moved to GPU 0.")
+        return gpu_index
+    except Exception as e:
+        print(f"WARNING: Could not move the FAISS index to the GPU, staying on CPU: {e}")
+        return index
+
+def read_faiss_index(folder_path: str, mmap: bool):
+    """
+    Reads the `index.faiss` file written by `_save_retriever_to_disk`.
+
+    With `mmap`, FAISS builds versions that support it (`IO_FLAG_MMAP_IFC`) use the
+    mapped file directly as the storage of flat / scalar-quantized codes: loading
+    is just page-table setup, and a Streamlit rerun or restart re-reads nothing the
+    OS page cache still holds. Older builds fall back to `IO_FLAG_MMAP`.
+
+    Args:
+        folder_path (str): The vector store directory.
+        mmap (bool): Memory-map the index read-only instead of reading it into RAM.
+            Index types FAISS cannot map are read normally.
+
+    Returns:
+        The FAISS index.
+    """
+    index_path = os.path.join(folder_path, "index.faiss")
+    if mmap:
+        flag_sets = []
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            flag_sets.append(faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        flag_sets.append(faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        for flags in flag_sets:
+            try:
+                return faiss.read_index(index_path, flags)
+            except Exception as e:
+                print(f"WARNING: Could not memory-map '{index_path}' (flags={flags}): {e}")
+        print(f"Reading '{index_path}' fully into memory.")
+    return faiss.read_index(index_path)
+
+class MetadataOnlyDocstore(InMemoryDocstore):
+    """
+    The FAISS wrapper's docstore for child chunks, keeping only their metadata.
+    `ParentDocumentRetriever` reads nothing from a matched child except
+    `metadata[id_key]`, which it uses to fetch the parent, so storing each child's
+    text again next to its parent only doubled the retriever's memory and save size.
+    Searching the vector store directly therefore returns children with empty text.
+    """
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        super().add({doc_id: Document(page_content="", metadata=doc.metadata) for doc_id, doc in texts.items()})
+
+def write_chunk_store(folder_path: str, docstore: InMemoryDocstore, index_to_docstore_id: dict):
+    """
+    Writes the child chunks behind the FAISS index to `chunks.jsonl`, one
+    `{"id", "page_content", "metadata"}` object per line in FAISS row order. Plain
+    JSON replaces LangChain's pickled `index.pkl`: it is faster to write and read,
+    and loading it can never execute code.
+    """
+    path = os.path.join(folder_path, "chunks.jsonl")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row in range(len(index_to_docstore_id)):
+            doc_id = index_to_docstore_id[row]
+            doc = docstore.search(doc_id)
+            f.write(json.dumps({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}, default=str) + "\n")
+    os.replace(tmp_path, path)
+
+def read_chunk_store(folder_path: str) -> Tuple[MetadataOnlyDocstore, dict]:
+    """
+    Reads `chunks.jsonl` line by line (see `write_chunk_store`).
+
+    Returns:
+        Tuple[MetadataOnlyDocstore, dict]: The chunk docstore and the FAISS row -> id map.
+    """
+    chunks, index_to_docstore_id = {}, {}
+    with open(os.path.join(folder_path, "chunks.jsonl"), "r", encoding="utf-8") as f:
+        for row, line in enumerate(f):
+            entry = json.loads(line)
+            chunks[entry["id"]] = Document(page_content=entry["page_content"], metadata=entry["metadata"])
+            index_to_docstore_id[row] = entry["id"]
+    return MetadataOnlyDocstore(chunks), index_to_docstore_id
+
+def batched_documents(docs: Iterable[Document], batch_size: int) -> Iterator[List[Document]]:
+    """Yields consecutive lists of at most `batch_size` documents from any iterable."""
+    iterator = iter(docs)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def split_parent_documents(child_splitter, docs: List[Document]) -> List[List[Document]]:
+    """
+    Splits each parent document into its child chunks. Splitting is pure-Python regex
+    work held by the GIL, so large batches are spread over a process pool (one task
+    per parent); small batches are split in-process, where pool start-up would cost
+    more than it saves.
+
+    Args:
+        child_splitter: The (picklable) text splitter to apply.
+        docs (List[Document]): The parent documents.
+
+    Returns:
+        List[List[Document]]: The child chunks of each parent, aligned with `docs`.
+    """
+    total_chars = sum(len(doc.page_content) for doc in docs)
+    if len(docs) < settings.SPLIT_PARALLEL_MIN_DOCS or total_chars < settings.SPLIT_PARALLEL_MIN_CHARS:
+        return [child_splitter.split_documents([doc]) for doc in docs]
+
+    max_workers = min(settings.SPLIT_MAX_WORKERS or os.cpu_count() or 1, len(docs))
+    print(f"Splitting {len(docs)} parent document(s) across {max_workers} process(es).")
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(child_splitter.split_documents, [[doc] for doc in docs]))
+    except Exception as e:
+        print(f"WARNING: Parallel splitting failed, splitting in-process instead: {e}")
+        return [child_splitter.split_documents([doc]) for doc in docs]
+
+def embed_length_sorted(embedding_function, texts: List[str], batch_size: int) -> np.ndarray:
+    """
+    Embeds texts in batches of similar length, so short chunks are never padded up to
+    the longest chunk of a mixed batch. The vectors are written straight into one
+    preallocated, contiguous float32 matrix, in the original order, ready for a
+    single FAISS `add`.
+
+    Args:
+        embedding_function: The LangChain `Embeddings` object.
+        texts (List[str]): The texts to embed.
+        batch_size (int): The number of texts per `embed_documents` call.
+
+    Returns:
+        np.ndarray: A (len(texts), dim) float32 matrix, row i being the vector of text i.
+    """
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    vectors = None
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        batch_vectors = np.asarray(embedding_function.embed_documents([texts[i] for i in batch]), dtype=np.float32)
+        if vectors is None:
+            vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+        vectors[batch] = batch_vectors
+    return vectors if vectors is not None else np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
 
 # ======================================================================================
 # SECTION 2: THE MAIN VECTOR STORE HANDLER CLASS
@@ -81,79 +393,124 @@ class VectorStoreHandler:
     
     def __init__(self):
         """
-        Initializes the VectorStoreHandler. It attempts to load an existing index
-        from disk. If one is not found, it prepares for a new index to be built.
+        Initializes the VectorStoreHandler. Loading the embedding model and reading an
+        existing index from disk both start in background threads, so they overlap
+        with each other and with the first page render; `_wait_until_loaded` joins
+        them the first time the retriever is actually needed.
         """
         print("Initializing VectorStoreHandler...")
-        self.embedding_function = get_embedding_function()
+        self.embedding_function = None
         self.vectorstore = None
-        self.docstore = None
+        # Parent documents live in SQLite and are written as they are added.
+        self.docstore = SQLiteDocStore(settings.DOC_STORE_PATH)
         self.retriever = None
+        # True while the FAISS index is the read-only, memory-mapped copy from disk.
+        self._index_is_read_only = False
 
-        # Attempt to load the retriever from disk upon initialization.
-        self._load_retriever_from_disk()
+        # Start loading the model and the saved index concurrently.
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vector-store-load")
+        # The worker runs the Streamlit-free loader; failures are reported in `_wait_until_loaded`.
+        self._embedding_future = executor.submit(load_embedding_function)
+        self._index_future = executor.submit(self._read_index_from_disk)
+        executor.shutdown(wait=False)
 
-    def _load_retriever_from_disk(self):
+    def _wait_until_loaded(self):
         """
-        Attempts to load the entire retriever state (vector store and docstore)
-        from predefined paths in the settings.
+        Joins the background loads started in `__init__` and assembles the retriever.
+        Streamlit messages are only issued from here, on the calling script thread.
         """
-        vector_store_path = settings.VECTOR_STORE_PATH
-        doc_store_path = settings.DOC_STORE_PATH
-
-        if os.path.exists(vector_store_path) and os.path.exists(doc_store_path):
-            print(f"Found existing index files. Attempting to load from '{vector_store_path}' and '{doc_store_path}'.")
+        with self._load_lock:
+            if self._loaded:
+                return
             try:
-                # Load the FAISS index
-                self.vectorstore = LangChainFAISS.load_local(
-                    folder_path=vector_store_path,
-                    embeddings=self.embedding_function,
-                    allow_dangerous_deserialization=True
-                )
-                # Load the parent document store
-                with open(doc_store_path, "rb") as f:
-                    self.docstore = pickle.load(f)
-
-                # Recreate the retriever with the loaded components
-                child_splitter = RecursiveCharacterTextSplitter(chunk_size=settings.CHILD_CHUNK_SIZE)
-                self.retriever = ParentDocumentRetriever(
-                    vectorstore=self.vectorstore,
-                    docstore=self.docstore,
-                    child_splitter=child_splitter,
-                )
-                st.success("Knowledge base loaded from disk!")
-                print("Successfully loaded existing retriever from disk.")
+                self.embedding_function = self._embedding_future.result()
             except Exception as e:
-                st.error("Failed to load existing knowledge base. It might be corrupted. Please re-process documents.")
-                print(f"ERROR loading from disk: {e}")
-                self.retriever = None # Ensure retriever is None if loading fails
-        else:
-            print("No existing index found. Ready to build a new one.")
+                _stop_on_embedding_failure(e)
+            self._load_retriever_from_disk()
+            self._loaded = True
+
+    def _read_index_from_disk(self) -> Optional[tuple]:
+        """
+        Reads the saved FAISS index and its chunk store (runs in a background thread).
+
+        Returns:
+            Optional[tuple]: (faiss_index, chunk_docstore, index_to_docstore_id), or
+            None when no index has been saved yet.
+        """
+        vector_store_path = settings.VECTOR_STORE_PATH
+        if not os.path.exists(os.path.join(vector_store_path, "chunks.jsonl")):
+            return None
+        print(f"Found existing index files. Attempting to load from '{vector_store_path}'.")
+        # Load the FAISS index memory-mapped, so only the pages touched by searches
+        # are read, plus the chunk store saved next to it.
+        faiss_index = read_faiss_index(vector_store_path, mmap=True)
+        chunk_docstore, index_to_docstore_id = read_chunk_store(vector_store_path)
+        return faiss_index, chunk_docstore, index_to_docstore_id
+
+    def _load_retriever_from_disk(self):
+        """
+        Builds the retriever around the index read by `_read_index_from_disk`. The
+        parent docstore is already open (it is a SQLite file).
+        """
+        try:
+            loaded = self._index_future.result()
+            if loaded is None:
+                print("No existing index found. Ready to build a new one.")
+                return
+            faiss_index, chunk_docstore, index_to_docstore_id = loaded
+            self.vectorstore = LangChainFAISS(
+                embedding_function=self.embedding_function,
+                index=move_index_to_gpu(faiss_index),
+                docstore=chunk_docstore,
+                index_to_docstore_id=index_to_docstore_id,
+                **faiss_store_kwargs(faiss_index),
+            )
+            # Recreate the retriever with the loaded components
+            child_splitter = FastCharSplitter(chunk_size=settings.CHILD_CHUNK_SIZE, chunk_overlap=settings.CHILD_CHUNK_OVERLAP)
+            self.retriever = ParentDocumentRetriever(
+                vectorstore=self.vectorstore,
+                docstore=self.docstore,
+                child_splitter=child_splitter,
+            )
+            self._index_is_read_only = True
+            self._attach_corpus_fingerprint()
+            st.success("Knowledge base loaded from disk!")
+            print("Successfully loaded existing retriever from disk.")
+        except Exception as e:
+            st.error("Failed to load existing knowledge base. It might be corrupted. Please re-process documents.")
+            print(f"ERROR loading from disk: {e}")
+            self.retriever = None # Ensure retriever is None if loading fails
 
 
     def _save_retriever_to_disk(self):
         """
-        Saves the current state of the retriever (vector store and docstore) to disk.
+        Saves the FAISS vector store to disk. The parent docstore needs no save step:
+        `SQLiteDocStore.mset` commits each batch as it is added.
         """
         if not self.retriever:
             print("WARNING: Save attempted, but no retriever is available to save.")
             return
 
         vector_store_path = settings.VECTOR_STORE_PATH
-        doc_store_path = settings.DOC_STORE_PATH
-        
-        print(f"Saving index to disk at '{vector_store_path}' and '{doc_store_path}'...")
+
+        print(f"Saving index to disk at '{vector_store_path}'...")
         try:
-            # Create directories if they don't exist
+            # Create the directory if it doesn't exist
             os.makedirs(vector_store_path, exist_ok=True)
-            os.makedirs(os.path.dirname(doc_store_path), exist_ok=True)
             
-            # Save the FAISS vector store
-            self.vectorstore.save_local(vector_store_path)
-            
-            # Save the parent document store using pickle
-            with open(doc_store_path, "wb") as f:
-                pickle.dump(self.docstore, f)
+            # Save the FAISS index. A GPU index cannot be serialized, so a CPU copy
+            # is written instead.
+            index = self.vectorstore.index
+            if hasattr(faiss, "index_gpu_to_cpu") and isinstance(index, getattr(faiss, "GpuIndex", ())):
+                index = faiss.index_gpu_to_cpu(index)
+            index_path = os.path.join(vector_store_path, "index.faiss")
+            faiss.write_index(index, f"{index_path}.tmp")
+            os.replace(f"{index_path}.tmp", index_path)
+
+            # Save the child chunks last: their presence marks a complete index on disk.
+            write_chunk_store(vector_store_path, self.vectorstore.docstore, self.vectorstore.index_to_docstore_id)
             
             print("Successfully saved retriever state to disk.")
         except Exception as e:
@@ -161,32 +518,175 @@ class VectorStoreHandler:
             print(f"ERROR saving to disk: {e}")
 
 
-    def build_index(self, docs: List[Document]):
+    def _attach_corpus_fingerprint(self):
+        """
+        Attaches the response-cache fingerprint of the indexed corpus to the vector
+        store. The children in `MetadataOnlyDocstore` carry no text, so the parent
+        docstore is hashed instead: its keys are the SHA-256 digests of the parent
+        texts (see `_filter_new_documents`), so the sorted keys cover all indexed
+        content without reading a document back.
+        """
+        parent_ids = sorted(self.docstore.yield_keys())
+        attach_corpus_fingerprint(self.vectorstore, hashlib.sha256("\n".join(parent_ids).encode()).hexdigest())
+
+    def _filter_new_documents(self, docs: List[Document], pending_ids: set) -> Tuple[List[str], List[Document]]:
+        """
+        Gives every parent document a content-derived id (SHA-256 of its text) and
+        drops the ones already in the docstore, already queued for storing in this
+        build (`pending_ids`, updated in place) or repeated within `docs`, so
+        re-uploaded content is never split or embedded again.
+
+        Returns:
+            Tuple[List[str], List[Document]]: The ids and documents still to be indexed.
+        """
+        unique = {}
+        for doc in docs:
+            unique.setdefault(hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest(), doc)
+        ids = [doc_id for doc_id in unique if doc_id not in pending_ids]
+        stored = self.docstore.mget(ids)
+        new_ids = [doc_id for doc_id, existing in zip(ids, stored) if existing is None]
+        pending_ids.update(new_ids)
+        skipped = len(docs) - len(new_ids)
+        if skipped:
+            print(f"Skipping {skipped} document(s) whose content is already indexed.")
+        return new_ids, [unique[doc_id] for doc_id in new_ids]
+
+    def _embed_batch(self, parent_ids: List[str], docs: List[Document]) -> Tuple[List[Document], np.ndarray]:
+        """
+        First half of adding parent documents (what `ParentDocumentRetriever.add_documents`
+        does, with explicit length-sorted embedding): splits them into children linked
+        to their parent id and embeds the children.
+
+        Returns:
+            Tuple[List[Document], np.ndarray]: The child chunks and their vectors.
+        """
+        id_key = self.retriever.id_key
+
+        children: List[Document] = []
+        child_lists = split_parent_documents(self.retriever.child_splitter, docs)
+        for parent_id, doc_children in zip(parent_ids, child_lists):
+            for child in doc_children:
+                child.metadata[id_key] = parent_id
+                children.append(child)
+        print(f"Split {len(docs)} parent document(s) into {len(children)} child chunk(s).")
+
+        vectors = embed_length_sorted(self.embedding_function, [child.page_content for child in children], settings.INDEX_EMBED_BATCH_SIZE)
+        if len(vectors) and getattr(self.vectorstore, "_normalize_L2", False):
+            faiss.normalize_L2(vectors)
+        return children, vectors
+
+    def _store_batch(self, parent_ids: List[str], docs: List[Document], children: List[Document], vectors: np.ndarray):
+        """
+        Second half of adding parent documents: adds the child vectors to FAISS and
+        writes the parents to the docstore.
+        """
+        if children:
+            index = self.vectorstore.index
+            # One bulk add of the whole matrix, then the row -> chunk id mapping that
+            # `FAISS.add_embeddings` would otherwise maintain vector by vector.
+            first_row = index.ntotal
+            index.add(vectors)
+            child_ids = [str(uuid.uuid4()) for _ in children]
+            self.vectorstore.docstore.add(dict(zip(child_ids, children)))
+            self.vectorstore.index_to_docstore_id.update({first_row + i: child_id for i, child_id in enumerate(child_ids)})
+
+        self.docstore.mset(list(zip(parent_ids, docs)))
+
+    def _train_and_store(self, batches: list):
+        """
+        Trains the (quantized) index on the vectors of all held-back batches together,
+        then stores the batches in order.
+        """
+        sample = [vectors for *_, vectors in batches if len(vectors)]
+        if sample:
+            sample = np.vstack(sample)
+            print(f"Training the FAISS scalar quantizer on {len(sample)} vector(s).")
+            self.vectorstore.index.train(sample)
+        for batch in batches:
+            self._store_batch(*batch)
+
+    def _store_worker(self, store_queue: queue.Queue, errors: list):
+        """
+        Consumer thread of the indexing pipeline: stores embedded batches until it
+        receives None. After a failure it keeps draining the queue (so the producer
+        never blocks on a full queue) and leaves the error in `errors`.
+
+        An untrained (quantized) index learns its value ranges from the data, so
+        batches are held back until `settings.FAISS_SQ_TRAIN_SAMPLE` vectors (or the
+        whole corpus, if smaller) have arrived, and the index is trained on all of them.
+        """
+        held_back, held_vectors = [], 0
+        while (item := store_queue.get()) is not None:
+            if errors:
+                continue
+            try:
+                if held_back or not self.vectorstore.index.is_trained:
+                    held_back.append(item)
+                    held_vectors += len(item[3])
+                    if held_vectors >= settings.FAISS_SQ_TRAIN_SAMPLE:
+                        self._train_and_store(held_back)
+                        held_back, held_vectors = [], 0
+                else:
+                    self._store_batch(*item)
+            except Exception as e:
+                errors.append(e)
+        if held_back and not errors:
+            try:
+                self._train_and_store(held_back)
+            except Exception as e:
+                errors.append(e)
+
+    def build_index(self, docs: Iterable[Document], batch_size: int = settings.INDEX_PARENT_BATCH_SIZE):
         """
         Builds a new ParentDocumentRetriever index or adds to an existing one.
+
+        Documents are consumed in micro-batches of `batch_size` parents, so peak memory
+        follows the batch rather than the corpus; `docs` may be a generator. Batches
+        flow through a two-stage pipeline: this thread splits and embeds them while a
+        worker thread adds the previous ones to FAISS and the docstore (`index.add`
+        and SQLite release the GIL). The index is saved once, at the end.
+
+        Args:
+            docs (Iterable[Document]): The parent documents to index.
+            batch_size (int): Parent documents processed per batch.
         """
-        if not docs:
+        self._wait_until_loaded()
+        batches = batched_documents(docs, batch_size)
+        first_batch = next(batches, None)
+        if not first_batch:
             st.warning("No documents provided to build the index.")
             return
 
-        st.info(f"Indexing {len(docs)} new document(s)... This may take a few moments.")
         print("Starting the index building process.")
 
+        # The index type follows the total corpus size when it is known up front, and
+        # the first batch otherwise (a generator can only be read once).
+        sizing_docs = docs if isinstance(docs, Sequence) else first_batch
+        total_chars = sum(len(doc.page_content) for doc in sizing_docs)
+        # A rough child-chunk count, used to pick the FAISS index type.
+        expected_vectors = total_chars // max(1, settings.CHILD_CHUNK_SIZE - settings.CHILD_CHUNK_OVERLAP) + len(sizing_docs)
+
         # If no retriever exists yet, create a new one.
         if self.retriever is None:
             print("No existing index found. Creating a new ParentDocumentRetriever.")
             try:
+                # Parents left over from an index that no longer exists can never be
+                # retrieved again, so the docstore starts empty along with the index.
+                stale_keys = list(self.docstore.yield_keys())
+                if stale_keys:
+                    print(f"Removing {len(stale_keys)} orphaned parent document(s) from the docstore.")
+                    self.docstore.mdelete(stale_keys)
+
                 # Initialize the components for a new retriever
-                self.docstore = InMemoryStore()
-                embedding_dimension = 384
-                faiss_index = faiss.IndexFlatL2(embedding_dimension)
+                faiss_index = create_faiss_index(expected_vectors)
                 self.vectorstore = LangChainFAISS(
                     embedding_function=self.embedding_function,
-                    index=faiss_index,
-                    docstore=InMemoryDocstore(),
-                    index_to_docstore_id={}
+                    index=move_index_to_gpu(faiss_index),
+                    docstore=MetadataOnlyDocstore(),
+                    index_to_docstore_id={},
+                    **faiss_store_kwargs(faiss_index),
                 )
-                child_splitter = RecursiveCharacterTextSplitter(chunk_size=settings.CHILD_CHUNK_SIZE, chunk_overlap=settings.CHILD_CHUNK_OVERLAP)
+                child_splitter = FastCharSplitter(chunk_size=settings.CHILD_CHUNK_SIZE, chunk_overlap=settings.CHILD_CHUNK_OVERLAP)
                 
                 self.retriever = ParentDocumentRetriever(
                     vectorstore=self.vectorstore,
@@ -199,12 +699,44 @@ class VectorStoreHandler:
                 print(f"ERROR: Could not instantiate ParentDocumentRetriever. {e}")
                 return
 
-        # Add the new documents to the existing or new retriever.
+        # A memory-mapped index cannot be added to; swap in a fully loaded copy first.
+        if self._index_is_read_only:
+            print("Loading a writable copy of the FAISS index before adding documents.")
+            self.vectorstore.index = move_index_to_gpu(read_faiss_index(settings.VECTOR_STORE_PATH, mmap=False))
+            self._index_is_read_only = False
+
+        # Add the new documents to the existing or new retriever, batch by batch.
+        st.info("Indexing new documents... This may take a few moments.")
         try:
-            with st.spinner("Embedding and indexing content..."):
-                self.retriever.add_documents(docs, ids=None)
-            
+            indexed = 0
+            pending_ids = set()
+            store_queue = queue.Queue(maxsize=settings.INDEX_PIPELINE_DEPTH)
+            store_errors = []
+            store_thread = threading.Thread(target=self._store_worker, args=(store_queue, store_errors), name="index-store", daemon=True)
+            store_thread.start()
+            try:
+                with st.spinner("Embedding and indexing content..."):
+                    for batch in itertools.chain([first_batch], batches):
+                        if store_errors:
+                            break
+                        # Content that is already indexed is skipped entirely.
+                        parent_ids, new_docs = self._filter_new_documents(batch, pending_ids)
+                        if new_docs:
+                            store_queue.put((parent_ids, new_docs, *self._embed_batch(parent_ids, new_docs)))
+                            indexed += len(new_docs)
+                            print(f"Embedded {indexed} new parent document(s) so far.")
+            finally:
+                store_queue.put(None)
+                store_thread.join()
+            if store_errors:
+                raise store_errors[0]
+
+            if not indexed:
+                st.info("These documents are already in the knowledge base. Nothing new to index.")
+                return
+
             # After adding documents, persist the new state to disk.
+            self._attach_corpus_fingerprint()
             self._save_retriever_to_disk()
             
             st.success("Advanced context-aware index has been successfully built and saved!")
@@ -219,9 +751,10 @@ class VectorStoreHandler:
         """
         Provides access to the fully configured retriever object.
         """
+        self._wait_until_loaded()
         if self.retriever is None:
             st.error("The knowledge base is empty. Please process documents first.")
             return None
         
         print("Returning the configured Parent Document Retriever to an agent.")
-        return self.retriever
\ No newline at end of file
+        return self.retriever
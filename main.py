@@ -45,25 +45,38 @@ import streamlit as st
 import time
 import pandas as pd
 import plotly.graph_objects as go
-from typing import Dict, List, Callable, Tuple, Any
+from typing import Dict, List, Callable, Tuple, Any, Optional
 import re
 import io
 import os
 import json
 import csv
 import platform
+import functools
+from collections import Counter
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Dynamic Library Imports with User Guidance ---
 try: from pypdf import PdfReader
 except ImportError: st.error("pypdf not found. Run: pip install pypdf"); st.stop()
+try: import fitz  # PyMuPDF: native-code PDF text extraction, preferred over pypdf when installed.
+except ImportError: fitz = None
 try: import docx
 except ImportError: st.error("python-docx not found. Run: pip install python-docx"); st.stop()
 try: import openpyxl
 except ImportError: st.error("openpyxl not found. Run: pip install openpyxl"); st.stop()
+try: import python_calamine; XLSX_ENGINE = "calamine"  # Rust xlsx reader, much faster than openpyxl when installed.
+except ImportError: XLSX_ENGINE = "openpyxl"
 try: from pptx import Presentation
 except ImportError: st.error("python-pptx not found. Run: pip install python-pptx"); st.stop()
 try: from bs4 import BeautifulSoup
 except ImportError: st.error("BeautifulSoup4 not found. Run: pip install beautifulsoup4"); st.stop()
+try: import lxml; HTML_PARSER = "lxml"  # libxml2-backed tree builder, much faster than the pure-Python html.parser.
+except ImportError: HTML_PARSER = "html.parser"
+try: import orjson  # Rust JSON parser/serializer, used for JSON uploads when installed.
+except ImportError: orjson = None
 try: import psutil
 except ImportError: st.error("psutil not found. Run: pip install psutil"); st.stop()
 
@@ -71,9 +84,15 @@ except ImportError: st.error("psutil not found. Run: pip install psutil"); st.st
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
 # Assuming analyzer_page is also designed with Streamlit columns, it will benefit from these changes.
 from ui.analyzer_page import display_analyzer_page
+from app.session_manager import initialize_session_state
+from core.vector_store_handler import build_faiss_store, chunk_params
+from utils.cached_embeddings import CachedEmbeddings
+from utils.fast_splitter import FastCharSplitter
+from utils.full_docs_store import FULL_DOCS
+from utils.llm_clients import warm_up_clients
+from config import settings
 
 # --- Secure API Key Handling (Plan Point #6) ---
 # It's better to manage settings via a class and pull from secrets.
@@ -91,73 +110,72 @@ class AppConfig:
 class FileParser:
     MAX_FILE_SIZE_MB = 200
     MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+    # Bump when a parser's output changes, so cached texts from the old parser are not reused.
+    CACHE_VERSION = "5"
+    # MuPDF is not thread-safe; PDFs are extracted one at a time while other formats still parse in parallel.
+    _MUPDF_LOCK = threading.Lock()
+    _EXT_RE = re.compile(r"\.([A-Za-z0-9]+)$")
     def __init__(self):
         self.parsers: Dict[str, Callable[[io.BytesIO], str]] = { ".pdf": self._parse_pdf, ".docx": self._parse_docx, ".txt": self._parse_txt, ".md": self._parse_txt, ".pptx": self._parse_pptx, ".xlsx": self._parse_xlsx, ".csv": self._parse_csv, ".json": self._parse_json, ".html": self._parse_html, ".xml": self._parse_html, }
-    def _parse_pdf(self, b: io.BytesIO) -> str: return "\n".join(p.extract_text() for p in PdfReader(b).pages if p.extract_text())
+    def _parse_pdf(self, b: io.BytesIO) -> str:
+        if fitz is None: return "\n".join(t for p in PdfReader(b).pages if (t := p.extract_text()))
+        with self._MUPDF_LOCK, fitz.open(stream=b.getvalue(), filetype="pdf") as doc:
+            return "\n".join(t for page in doc if (t := page.get_text("text")))
     def _parse_docx(self, b: io.BytesIO) -> str: return "\n".join(p.text for p in docx.Document(b).paragraphs if p.text)
     def _parse_txt(self, b: io.BytesIO) -> str: return b.read().decode("utf-8", errors="ignore")
     def _parse_pptx(self, b: io.BytesIO) -> str: return "\n".join(s.text for slide in Presentation(b).slides for s in slide.shapes if hasattr(s, "text"))
     def _parse_xlsx(self, b: io.BytesIO) -> str:
-        wb, tc = openpyxl.load_workbook(b), []
-        for s in wb: tc.extend([f"--- Sheet: {s.title} ---"] + [", ".join(map(str, filter(None, r))) for r in s.iter_rows(values_only=True) if any(r)])
-        return "\n".join(tc)
+        # Whole sheets are read into DataFrames and serialized by pandas' C CSV writer instead of a per-cell Python loop.
+        sheets = pd.read_excel(b, sheet_name=None, header=None, dtype=str, na_filter=False, engine=XLSX_ENGINE)
+        return "\n\n".join(f"--- Sheet: {n} ---\n{df[df.ne('').any(axis=1)].to_csv(index=False, header=False)}" for n, df in sheets.items())
     def _parse_csv(self, b: io.BytesIO) -> str: return "\n".join([", ".join(r) for r in csv.reader(io.StringIO(self._parse_txt(b)))])
-    def _parse_json(self, b: io.BytesIO) -> str: return json.dumps(json.loads(self._parse_txt(b)), indent=2)
-    def _parse_html(self, b: io.BytesIO) -> str: return BeautifulSoup(b, "html.parser").get_text(separator="\n", strip=True)
-    def parse(self, f: Any) -> Tuple[str, str]:
-        if f.size > self.MAX_FILE_SIZE_BYTES:
-            st.warning(f"File '{f.name}' ({f.size/1e6:.2f}MB) > {self.MAX_FILE_SIZE_MB}MB. Skipped.", icon="⚠️")
-            return f.name, ""
-        _, ext = os.path.splitext(f.name.lower())
+    def _parse_json(self, b: io.BytesIO) -> str:
+        raw = b.getvalue()
+        try: return orjson.dumps(orjson.loads(raw), option=orjson.OPT_INDENT_2).decode() if orjson else json.dumps(json.loads(raw), indent=2, ensure_ascii=False)
+        except ValueError: return raw.decode("utf-8", errors="ignore")  # Not valid JSON: index the text as-is rather than skip the file.
+    def _parse_html(self, b: io.BytesIO) -> str: return BeautifulSoup(b, HTML_PARSER).get_text(separator="\n", strip=True)
+    def parse(self, name: str, size: int, data: bytes) -> Tuple[str, str, Optional[Tuple[str, str, str]]]:
+        """Parses one file's bytes. Makes no Streamlit calls, so it is safe in worker threads.
+        Returns (name, text, message); message is None or (st function name, text, icon) for the caller to show."""
+        if size > self.MAX_FILE_SIZE_BYTES:
+            return name, "", ("warning", f"File '{name}' ({size/1e6:.2f}MB) > {self.MAX_FILE_SIZE_MB}MB. Skipped.", "⚠️")
+        ext = f".{m.group(1).lower()}" if (m := self._EXT_RE.search(name)) else ""
         if not (p_func := self.parsers.get(ext)):
-            st.warning(f"Unsupported format: '{f.name}'. Skipped.", icon="🚫")
-            return f.name, ""
+            return name, "", ("warning", f"Unsupported format: '{name}'. Skipped.", "🚫")
+        # Identical bytes always parse to the same text, so re-uploads are served from the disk cache.
+        cache_path = os.path.join(settings.PARSED_TEXT_CACHE_DIR, f"{hashlib.blake2b(data, digest_size=16).hexdigest()}{ext}.v{self.CACHE_VERSION}.txt")
         try:
-            with st.spinner(f"Parsing {f.name}..."): return f.name, p_func(io.BytesIO(f.getvalue()))
-        except Exception as e:
-            st.error(f"Could not parse '{f.name}': {e}", icon="❌"); return f.name, ""
+            with open(cache_path, "r", encoding="utf-8") as f: return name, f.read(), None
+        except OSError: pass
+        try: text = p_func(io.BytesIO(data))
+        except Exception as e: return name, "", ("error", f"Could not parse '{name}': {e}", "❌")
+        self._write_cache(cache_path, text)
+        return name, text, None
+    @staticmethod
+    def _write_cache(path: str, text: str):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f: f.write(text)
+            os.replace(tmp_path, path)
+        except Exception as e: print(f"WARNING: Could not cache parsed text at '{path}': {e}")
 file_parser = FileParser()
 
 # ======================================================================================
 # SECTION 2: ROBUST SESSION STATE & DESIGN SYSTEM (UX Flow - Plan Point #2)
 # ======================================================================================
-def initialize_session_state(force_reset=False):
-    if 'app_initialized' in st.session_state and not force_reset: return
-    st.session_state.clear()
-    st.session_state.app_initialized = True
-    st.session_state.page = "Home"
-    st.session_state.processed_files = []
-    st.session_state.full_docs = {}
-    st.session_state.vector_store_handler = None
-    st.session_state.qa_messages = [{"role": "assistant", "content": "Welcome! Process documents to begin."}]
-    for k in ["summary_output", "entity_output", "comparison_output", "report_output", "debug_output"]: st.session_state[k] = None
-    st.session_state.settings = {"theme": "Quantum Dark", "model": "GPT-4 Turbo", "temperature": 0.5}
-    st.session_state.api_keys = {"openai": "", "anthropic": ""}
-    st.session_state.usage_stats = {"documents_processed": 0, "queries_executed": 0, "total_words": 0}
-    st.session_state.insights_data = {"sentiment": {}, "topics": {}}
-    st.session_state.performance_log = []
-    print("SESSION STATE INITIALIZED: PHOENIX Core is stable.")
+# The session schema lives in app/session_manager.py (imported above).
 
-class DesignSystem:
-    THEMES={"Quantum Dark":{"primary":"#22d3ee","secondary":"#a78bfa","background":"#020412","surface":"rgba(23, 27, 47, 0.8)","text_primary":"#f9fafb","text_secondary":"#9ca3af","border":"rgba(55, 65, 81, 0.5)","success":"#10b981","warning":"#f59e0b","danger":"#ef4444"},"Photon Light":{"primary":"#0d6efd","secondary":"#6c757d","background":"#f8f9fa","surface":"#ffffff","text_primary":"#111827","text_secondary":"#4B5563","border":"#dee2e6","success":"#198754","warning":"#ffc107","danger":"#dc3545",},}
-    @staticmethod
-    def get_active_theme(): return DesignSystem.THEMES.get(st.session_state.settings.get("theme","Quantum Dark"))
-    
-    # ============================================================================
-    # >>>>>>>>>>>> SECTION UPDATED FOR RESPONSIVENESS <<<<<<<<<<<<<<<
-    # ============================================================================
-    @staticmethod
-    def load_master_css():
-        theme = DesignSystem.get_active_theme()
-        st.markdown(f"""
+# The master stylesheet, filled in per theme by `_render_css` (defined after DesignSystem).
+_CSS_TEMPLATE = """
         <style>
             @import url('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.1/css/all.min.css');
             :root {{
-                --c-primary: {theme['primary']}; --c-secondary: {theme['secondary']};
-                --c-background: {theme['background']}; --c-surface: {theme['surface']};
-                --c-text-primary: {theme['text_primary']}; --c-text-secondary: {theme['text_secondary']};
-                --c-border: {theme['border']}; --c-success: {theme['success']};
-                --c-warning: {theme['warning']}; --c-danger: {theme['danger']};
+                --c-primary: {primary}; --c-secondary: {secondary};
+                --c-background: {background}; --c-surface: {surface};
+                --c-text-primary: {text_primary}; --c-text-secondary: {text_secondary};
+                --c-border: {border}; --c-success: {success};
+                --c-warning: {warning}; --c-danger: {danger};
             }}
             .stApp, .stApp > div:first-child {{ background: var(--c-background); }}
             h1, h2, h3, h4, h5, h6, p, body {{ color: var(--c-text-primary); }}
@@ -200,22 +218,54 @@ class DesignSystem:
                 .feature-card-icon {{ font-size: 2rem; }}
             }}
         </style>
-        """, unsafe_allow_html=True)
+        """
+
+_MOBILE_SIDEBAR_JS = """<script>const handler=()=>{if(window.innerWidth<=768){const sb=window.parent.document.querySelector('[data-testid="stSidebar"]');if(sb){const cb=sb.querySelector('button[aria-label="Close"]');if(cb){sb.querySelectorAll('button').forEach(b=>{if(b!==cb)b.addEventListener('click',()=>{setTimeout(()=>cb.click(),150)})})}}}};setTimeout(handler,250);</script>"""
+
+class DesignSystem:
+    THEMES={"Quantum Dark":{"primary":"#22d3ee","secondary":"#a78bfa","background":"#020412","surface":"rgba(23, 27, 47, 0.8)","text_primary":"#f9fafb","text_secondary":"#9ca3af","border":"rgba(55, 65, 81, 0.5)","success":"#10b981","warning":"#f59e0b","danger":"#ef4444"},"Photon Light":{"primary":"#0d6efd","secondary":"#6c757d","background":"#f8f9fa","surface":"#ffffff","text_primary":"#111827","text_secondary":"#4B5563","border":"#dee2e6","success":"#198754","warning":"#ffc107","danger":"#dc3545",},}
+    @staticmethod
+    def get_active_theme(): return DesignSystem.THEMES.get(st.session_state.settings.get("theme","Quantum Dark"))
+    
+    # ============================================================================
+    # >>>>>>>>>>>> SECTION UPDATED FOR RESPONSIVENESS <<<<<<<<<<<<<<<
+    # ============================================================================
+    @staticmethod
+    def load_master_css():
+        st.markdown(_render_css(st.session_state.settings.get("theme", "Quantum Dark")), unsafe_allow_html=True)
     # ============================================================================
     # >>>>>>>>>>>> END OF UPDATED SECTION <<<<<<<<<<<<<<<
     # ============================================================================
 
     @staticmethod
-    def mobile_sidebar_auto_close(): st.components.v1.html("""<script>const handler=()=>{if(window.innerWidth<=768){const sb=window.parent.document.querySelector('[data-testid="stSidebar"]');if(sb){const cb=sb.querySelector('button[aria-label="Close"]');if(cb){sb.querySelectorAll('button').forEach(b=>{if(b!==cb)b.addEventListener('click',()=>{setTimeout(()=>cb.click(),150)})})}}}};setTimeout(handler,250);</script>""", height=0)
+    def mobile_sidebar_auto_close(): st.components.v1.html(_MOBILE_SIDEBAR_JS, height=0)
+
+@functools.lru_cache(maxsize=4)
+def _render_css(theme_name: str) -> str:
+    """Formats the stylesheet once per theme; every later rerun reuses the string."""
+    return _CSS_TEMPLATE.format(**DesignSystem.THEMES.get(theme_name, DesignSystem.THEMES["Quantum Dark"]))
 
 
 # ======================================================================================
 # SECTION 3: THE MAIN APPLICATION CLASS (CORE LOGIC)
 # ======================================================================================
 class CognitiveQueryApp:
+    # Insight keywords -> (insight, label). All of them are matched by ONE compiled alternation,
+    # so the corpus is scanned once instead of once per keyword.
+    INSIGHT_LABELS = {"sentiment": ["Positive", "Negative"], "topics": ["Financials", "Strategy", "Operations"]}
+    INSIGHT_KEYWORDS = {
+        "success": ("sentiment", "Positive"), "profit": ("sentiment", "Positive"), "growth": ("sentiment", "Positive"),
+        "loss": ("sentiment", "Negative"), "fail": ("sentiment", "Negative"), "risk": ("sentiment", "Negative"),
+        "revenue": ("topics", "Financials"), "cost": ("topics", "Financials"),
+        "plan": ("topics", "Strategy"), "goal": ("topics", "Strategy"),
+        "process": ("topics", "Operations"), "supply": ("topics", "Operations"),
+    }
+    INSIGHT_PATTERN = re.compile(r'\b(' + '|'.join(map(re.escape, INSIGHT_KEYWORDS)) + r')\b', re.IGNORECASE)
+
     def __init__(self):
         st.set_page_config(layout="wide", page_icon="🦚", page_title="CognitiveQuery PHOENIX")
         initialize_session_state()
+        warm_up_clients()  # Once per process; pre-opens the LLM connection pool in the background.
         self.ss = st.session_state
         self.PAGES = {"Home": self.display_home_page, "Analyzer": self.display_analyzer_page_wrapper, "Insights": self.display_insights_page, "Settings": self.display_settings_page}
 
@@ -232,17 +282,24 @@ class CognitiveQueryApp:
         
         if not all_docs: raise ValueError("No processable content found in uploaded files.")
         
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200)
+        # Chunk size adapts to the total text length (fewer, larger chunks for big uploads).
+        chunk_size, chunk_overlap = chunk_params(sum(len(d.page_content) for d in all_docs))
+        # The NumPy splitter is the default; the LangChain one stays available for parity checks.
+        splitter_cls = FastCharSplitter if settings.USE_FAST_SPLITTER else RecursiveCharacterTextSplitter
+        text_splitter = splitter_cls(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         doc_chunks = text_splitter.split_documents(all_docs)
 
         api_key = st.secrets.get("GOOGLE_API_KEY")
         if not api_key:
             st.error("Google API Key not found in Streamlit Secrets.", icon="🔥")
             st.stop()
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=api_key)
-        vector_store = FAISS.from_documents(doc_chunks, embeddings)
+        # Embeddings are cached on disk by content hash, so re-uploads skip the embedding API.
+        embeddings = CachedEmbeddings(GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=api_key), cache_dir=settings.EMBEDDING_CACHE_DIR)
+        # Batches are embedded concurrently (the API round-trips dominate), then bulk-added to a cosine-similarity index.
+        vector_store = build_faiss_store(doc_chunks, embeddings, settings.EMBED_API_BATCH_SIZE, settings.EMBED_API_MAX_WORKERS)
         
-        full_docs_dict = {d.metadata["source"]: d for d in all_docs}
+        # Full texts go to the disk-backed store; sessions only keep source name -> key.
+        full_docs_dict = {d.metadata["source"]: FULL_DOCS.put(d.page_content) for d in all_docs}
         return full_docs_dict, vector_store, total_words
 
     def _handle_document_upload(self, uploaded_files):
@@ -250,9 +307,14 @@ class CognitiveQueryApp:
         if not uploaded_files: return
         
         try:
+            # Files are parsed concurrently (the parsers are mostly native code that releases the GIL).
+            # Bytes are read here, and parser messages shown here, because Streamlit objects are main-thread only.
+            jobs = [(f.name, f.size, f.getvalue() if f.size <= FileParser.MAX_FILE_SIZE_BYTES else b"") for f in uploaded_files]
+            with st.spinner(f"Parsing {len(jobs)} file(s)..."), ThreadPoolExecutor(max_workers=min(settings.DOC_LOADER_MAX_WORKERS, len(jobs))) as executor:
+                results = list(executor.map(lambda job: file_parser.parse(*job), jobs))
             files_with_content = []
-            for f in uploaded_files:
-                filename, text = file_parser.parse(f)
+            for filename, text, message in results:
+                if message: kind, msg, icon = message; getattr(st, kind)(msg, icon=icon)
                 if text: files_with_content.append((filename, text))
             
             if not files_with_content:
@@ -273,12 +335,18 @@ class CognitiveQueryApp:
             st.error(f"A critical error occurred during processing: {e}", icon="🔥")
 
     def _calculate_real_insights(self):
-        full_text = " ".join([doc.page_content for doc in self.ss.full_docs.values()]).lower()
-        if not full_text: return
-        pos_words, neg_words = ['success','profit','growth'], ['loss','fail','risk']
-        self.ss.insights_data['sentiment']={"Positive":sum(len(re.findall(f'\\b{w}\\b',full_text)) for w in pos_words),"Negative":sum(len(re.findall(f'\\b{w}\\b',full_text)) for w in neg_words),}
-        topics = {"Financials":['revenue','cost'],"Strategy":['plan','goal'],"Operations":['process','supply']}
-        self.ss.insights_data['topics']={"labels":list(topics.keys()),"values":[sum(len(re.findall(f'\\b{kw}\\b',full_text)) for kw in kws) for kws in topics.values()]}
+        if not self.ss.full_docs: return
+        # Each document is scanned on its own: the corpus is never joined into one string.
+        # findall returns plain strings (no Match object per hit) and Counter tallies them in C;
+        # only the few distinct keywords are then mapped to their insight labels in Python.
+        hits = Counter()
+        for key in self.ss.full_docs.values():
+            hits.update(self.INSIGHT_PATTERN.findall(FULL_DOCS.get_text(key) or ""))
+        counts = {insight: dict.fromkeys(labels, 0) for insight, labels in self.INSIGHT_LABELS.items()}
+        for word, n in hits.items():
+            insight, label = self.INSIGHT_KEYWORDS[word.lower()]; counts[insight][label] += n
+        self.ss.insights_data['sentiment'] = counts["sentiment"]
+        self.ss.insights_data['topics'] = {"labels": list(counts["topics"].keys()), "values": list(counts["topics"].values())}
 
     def render_sidebar(self):
         with st.sidebar:
@@ -35,11 +35,13 @@ from typing import Dict, List, Any
 # --- LangChain & Project Imports (ASSUMED TO EXIST BY USER) ---
 from langchain_core.documents import Document
 from agents.qa_agent import execute_qa_chain
-from agents.report_agent import execute_report_chain
+from agents.report_agent import astream_report_chain
 from agents.comparison_agent import execute_comparison_chain
 from agents.summarizer_agent import execute_summarization_chain
 from agents.entity_extraction_agent import execute_entity_extraction_chain
 from agents.debug_agent import execute_debug_chain
+from utils.async_utils import iterate_in_loop, run_async
+from utils.full_docs_store import FULL_DOCS
 
 # ======================================================================================
 # SECTION 1: CRITICAL HELPER FUNCTIONS (The Core of Stability)
@@ -50,6 +52,11 @@ def get_retriever_from_state(ss: Dict):
     vector_store = ss.get("vector_store_handler")
     return vector_store.as_retriever() if vector_store else None
 
+def get_full_doc_from_state(ss: Dict, file_name: str):
+    """Loads the full document for a processed file from the disk-backed store."""
+    key = ss.get("full_docs", {}).get(file_name)
+    return FULL_DOCS.get_document(key, file_name) if key else None
+
 def track_performance(operation: str, start_time: float, ss: Dict):
     """Logs the performance of an agent call to the session state."""
     duration_ms = (time.perf_counter() - start_time) * 1000
@@ -100,7 +107,7 @@ def render_document_previewer(selected_file: str, ss: Dict, key_prefix: str):
     """
     if not selected_file: return
     with st.expander(f"Preview Content of: `{selected_file}`"):
-        doc = ss.full_docs.get(selected_file)
+        doc = get_full_doc_from_state(ss, selected_file)
         if doc:
             content = doc.page_content
             # <<< THE FIX IS HERE: A unique key is passed to each text_area >>>
@@ -130,24 +137,20 @@ def handle_qa_submission(prompt: str, ss: Dict):
         st.rerun(); return
 
     start_time = time.perf_counter()
-    with st.spinner("Q&A Agent is thinking..."):
-        # --- REAL AGENT CALL RESTORED ---
-        response_obj = execute_qa_chain(retriever, prompt, ss.qa_messages[:-1])
-        track_performance("Q&A", start_time, ss)
+    # --- REAL AGENT CALL RESTORED (now streamed token-by-token) ---
+    response_obj = {}
+    with st.chat_message("assistant"):
+        st.write_stream(iterate_in_loop(execute_qa_chain(retriever, prompt, ss.qa_messages[:-1], response_obj)))
+    track_performance("Q&A", start_time, ss)
 
-        # Resilient handling of the agent's output
-        if isinstance(response_obj, dict):
-            assistant_message = {"role": "assistant", "content": response_obj.get("answer", "Sorry, I could not generate an answer."), "sources": response_obj.get("source_documents", [])}
-        else:  # Handle case where agent returns a simple string
-            assistant_message = {"role": "assistant", "content": str(response_obj), "sources": []}
-        
-        ss.qa_messages.append(assistant_message)
+    assistant_message = {"role": "assistant", "content": response_obj.get("answer") or "Sorry, I could not generate an answer.", "sources": response_obj.get("source_documents", [])}
+    ss.qa_messages.append(assistant_message)
     st.rerun()
 
 def handle_summarization_submission(selected_file: str, summary_length: str, ss: Dict):
     """Handles summarization by calling the REAL agent."""
     if not selected_file: st.warning("Please select a document."); return
-    if doc := ss.full_docs.get(selected_file):
+    if doc := get_full_doc_from_state(ss, selected_file):
         ss.usage_stats['queries_executed'] += 1 # <<< QUERY COUNTER FIX
         start_time = time.perf_counter()
         with st.spinner(f"Generating {summary_length} summary..."):
@@ -158,7 +161,7 @@ def handle_summarization_submission(selected_file: str, summary_length: str, ss:
 def handle_entity_extraction_submission(selected_file: str, ss: Dict):
     """Handles entity extraction by calling the REAL agent."""
     if not selected_file: st.warning("Please select a document."); return
-    if doc := ss.full_docs.get(selected_file):
+    if doc := get_full_doc_from_state(ss, selected_file):
         ss.usage_stats['queries_executed'] += 1 # <<< QUERY COUNTER FIX
         start_time = time.perf_counter()
         with st.spinner(f"Extracting entities..."):
@@ -183,9 +186,13 @@ def handle_report_submission(report_query: str, ss: Dict):
     if not (retriever := get_retriever_from_state(ss)): st.error("CRITICAL ERROR: Vector Store not initialized."); return
     ss.usage_stats['queries_executed'] += 1 # <<< QUERY COUNTER FIX
     start_time = time.perf_counter()
-    with st.spinner("Report Agent is writing..."):
-        ss.report_output = execute_report_chain(retriever, report_query)
-        track_performance("Report Generation", start_time, ss)
+    # The report is streamed into a temporary placeholder while it is being written,
+    # then stored and rendered by the results container like every other output.
+    live_report = st.empty()
+    with live_report.container():
+        ss.report_output = st.write_stream(iterate_in_loop(astream_report_chain(retriever, report_query)))
+    live_report.empty()
+    track_performance("Report Generation", start_time, ss)
 
 def handle_debug_submission(debug_query: str, ss: Dict):
     """Handles debugging by calling the REAL agent."""
@@ -194,7 +201,7 @@ def handle_debug_submission(debug_query: str, ss: Dict):
     ss.usage_stats['queries_executed'] += 1 # <<< QUERY COUNTER FIX
     start_time = time.perf_counter()
     with st.spinner("Debugging retriever..."):
-        ss.debug_output = execute_debug_chain(retriever, debug_query)
+        ss.debug_output = run_async(execute_debug_chain(retriever, debug_query))
         track_performance("Debug", start_time, ss)
 
 # ======================================================================================
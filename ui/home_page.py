@@ -165,10 +165,9 @@ def render_stats_dashboard(ss: Dict):
     try:
         # This safely checks for the handler and its attributes before accessing them.
         vector_store_handler = ss.get("vector_store_handler")
-        if vector_store_handler and hasattr(vector_store_handler, 'docstore') and vector_store_handler.docstore:
-             # The docstore in ParentDocumentRetriever is a key-value store. `get_all` is not a method.
-             # The correct way to get its size is by accessing its internal dictionary.
-            num_knowledge_units = len(vector_store_handler.docstore.store)
+        if vector_store_handler and hasattr(vector_store_handler, 'index'):
+            # This is the FAISS store built on upload; each indexed vector is one chunk.
+            num_knowledge_units = vector_store_handler.index.ntotal
         else:
             num_knowledge_units = 0
     except Exception:
@@ -0,0 +1,119 @@
+# utils/async_utils.py - Bridges Between Streamlit's Synchronous Script Model and Async Agents
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# The shared LLM clients keep async connection pools (httpx for OpenAI, gRPC channels
+# for Gemini) that are bound to the event loop they were first used on. Running each
+# coroutine with a throwaway `asyncio.run` loop means those pools can never be reused:
+# every call pays for new TCP/TLS handshakes, and a pooled connection from a closed
+# loop fails outright. Instead, all async agent work runs on ONE long-lived event loop
+# owned by a daemon thread, and the synchronous Streamlit script submits work to it.
+#
+# The loop thread is shared by every Streamlit session, so it never carries a session's
+# script context. Agent coroutines report status through `show_message` instead of
+# calling `st.error` / `st.info` directly: the message is queued on the submission and
+# rendered by `run_async` on the calling session's own script thread.
+# ======================================================================================
+
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Iterator, List, Optional, Tuple, TypeVar
+
+import streamlit as st
+
+T = TypeVar("T")
+
+# Messages raised by the coroutine currently running for a `run_async` submission.
+# Each submission runs in its own task context, so concurrent sessions never share a list.
+_pending_messages: ContextVar[Optional[List[Tuple[str, str]]]] = ContextVar("pending_messages", default=None)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Returns the shared background event loop, starting it on first use."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="agent-event-loop", daemon=True)
+            _loop_thread.start()
+    return _loop
+
+
+def show_message(kind: str, text: str):
+    """
+    Shows a Streamlit status message (`kind` is "error", "warning" or "info").
+    Inside a coroutine submitted through `run_async` the message is queued and shown
+    on the submitting session's script thread; elsewhere it is shown immediately.
+    """
+    pending = _pending_messages.get()
+    if pending is None:
+        getattr(st, kind)(text)
+    else:
+        pending.append((kind, text))
+
+
+def run_async(awaitable: Awaitable[T]) -> T:
+    """
+    Runs a coroutine on the shared event loop and blocks until it completes.
+    This is the drop-in replacement for `asyncio.run` in synchronous code.
+
+    Args:
+        awaitable: The coroutine to run.
+
+    Returns:
+        The coroutine's result (its exceptions are re-raised in the caller).
+    """
+    loop = get_event_loop()
+    messages: List[Tuple[str, str]] = []
+
+    async def _run() -> T:
+        _pending_messages.set(messages)
+        return await awaitable
+
+    try:
+        return asyncio.run_coroutine_threadsafe(_run(), loop).result()
+    finally:
+        # Rendered here, on the caller's thread, which holds the right session context.
+        for kind, text in messages:
+            getattr(st, kind)(text)
+
+
+_EXHAUSTED = object()
+
+
+def iterate_in_loop(async_iterator: AsyncIterator[T]) -> Iterator[T]:
+    """
+    Drives an async iterator from synchronous code, yielding each item as soon as
+    it is produced. This lets `st.write_stream` render tokens from an async agent
+    while the rest of the Streamlit script stays synchronous.
+
+    Args:
+        async_iterator: The async generator to consume (e.g. a token stream).
+
+    Yields:
+        Each item produced by the async iterator, in order.
+    """
+    async def _next():
+        try:
+            return await async_iterator.__anext__()
+        except StopAsyncIteration:
+            return _EXHAUSTED
+
+    finished = False
+    try:
+        while True:
+            item = run_async(_next())
+            if item is _EXHAUSTED:
+                finished = True
+                break
+            yield item
+    finally:
+        # If the consumer stopped early, let the async generator clean up.
+        if not finished and hasattr(async_iterator, "aclose"):
+            run_async(async_iterator.aclose())
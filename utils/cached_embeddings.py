@@ -0,0 +1,127 @@
+# utils/cached_embeddings.py - Persistent, Content-Addressed Embedding Cache
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# Re-uploading the same documents used to re-embed every chunk from scratch, paying
+# the full embedding cost (API calls or local model inference) each time. This wrapper
+# stores every document embedding on disk under SHA-256(model | text), so repeated
+# content is served from the cache and only genuinely new text reaches the model.
+#
+# Storage is one SQLite table, `<cache_dir>/embeddings.sqlite3`, mapping the 32-byte
+# digest to the vector as an FP16 blob. A whole batch of chunks is looked up with a
+# few keyed queries instead of one file open per chunk, and FP16 halves the size of
+# the cache at a precision far below what affects retrieval ranking.
+#
+# In front of SQLite sits a process-wide in-memory LRU shared by every wrapper
+# instance, and duplicate texts within one call are embedded only once.
+# ======================================================================================
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from cachetools import LRUCache
+from langchain_core.embeddings import Embeddings
+
+# Keys per SELECT, below SQLite's limit on bound parameters.
+_LOOKUP_CHUNK = 500
+
+# Recently used vectors, shared across instances (the app builds a new wrapper per upload).
+MEMORY_CACHE_SIZE = 20_000
+_MEMORY_CACHE: "LRUCache[bytes, List[float]]" = LRUCache(maxsize=MEMORY_CACHE_SIZE)
+_MEMORY_LOCK = threading.Lock()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps any LangChain `Embeddings` object with a disk-backed cache."""
+
+    def __init__(self, inner: Embeddings, cache_dir: Path):
+        self.inner = inner
+        self.cache_dir = Path(cache_dir)
+        # Different models produce incompatible vectors, so the model is part of the key.
+        self.model_name = getattr(inner, "model", None) or getattr(inner, "model_name", None) or type(inner).__name__
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Opens the cache database on first use; None if it cannot be opened."""
+        if self._conn is None:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(self.cache_dir / "embeddings.sqlite3", check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                print(f"WARNING: Embedding cache unavailable, embedding without it: {e}")
+        return self._conn
+
+    def _key_for(self, text: str) -> bytes:
+        """Returns the cache key for a piece of text."""
+        return hashlib.sha256(f"{self.model_name}|{text}".encode()).digest()
+
+    def _load_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Loads every cached vector among `keys`; read errors count as misses."""
+        found: Dict[bytes, List[float]] = {}
+        try:
+            with self._lock:
+                conn = self._connection()
+                if conn is None:
+                    return found
+                for start in range(0, len(keys), _LOOKUP_CHUNK):
+                    chunk = keys[start:start + _LOOKUP_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    for key, blob in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk):
+                        found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32).tolist()
+        except Exception as e:
+            print(f"WARNING: Could not read the embedding cache: {e}")
+        return found
+
+    def _save_many(self, entries: Dict[bytes, List[float]]):
+        """Writes new vectors in a single transaction."""
+        try:
+            rows = [(key, np.asarray(vector, dtype=np.float16).tobytes()) for key, vector in entries.items()]
+            with self._lock:
+                conn = self._connection()
+                if conn is None:
+                    return
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        except Exception as e:
+            print(f"WARNING: Could not write embedding cache entries: {e}")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds documents, serving cached vectors from disk and sending only the
+        uncached texts to the wrapped model in a single batch.
+        """
+        keys = [self._key_for(text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        with _MEMORY_LOCK:
+            cached = {key: _MEMORY_CACHE[key] for key in unique_keys if key in _MEMORY_CACHE}
+        cached.update(self._load_many([key for key in unique_keys if key not in cached]))
+
+        # Each distinct uncached text is sent to the model once, however often it repeats.
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            print(f"Embedding cache: {len(unique_keys) - len(missing)} hit(s), {len(missing)} miss(es).")
+            new_vectors = self.inner.embed_documents(list(missing.values()))
+            new_entries: Dict[bytes, List[float]] = {key: list(vector) for key, vector in zip(missing, new_vectors)}
+            self._save_many(new_entries)
+            cached.update(new_entries)
+        else:
+            print(f"Embedding cache: all {len(texts)} embedding(s) served from cache.")
+
+        with _MEMORY_LOCK:
+            for key in unique_keys:
+                _MEMORY_CACHE[key] = cached[key]
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Queries are rarely repeated verbatim, so they go straight to the model."""
+        return self.inner.embed_query(text)
@@ -0,0 +1,49 @@
+# utils/chain_cache.py - Reuse of Compiled LCEL Chains Across Requests
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# Building an LCEL chain (prompts, history-aware retriever, stuff-documents chain...)
+# is pure object construction, yet the agents used to redo it on every single request.
+# A chain only depends on the retriever and the LLM it wraps, so this module keeps the
+# compiled chain per (retriever, LLM) pair and hands back the same object next time.
+#
+# Retrievers are not hashable, so entries are keyed by object identity. The objects
+# themselves are stored alongside the chain, which both keeps them alive (so an id is
+# never reused while its entry exists) and lets us double-check identity on lookup.
+# ======================================================================================
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+# Only a handful of retrievers are alive at once (one per processed document set).
+MAX_CACHED_CHAINS = 16
+
+_CHAINS: "OrderedDict[Tuple[Hashable, int, int], Tuple[Any, Any, Any]]" = OrderedDict()
+
+
+def get_or_build_chain(name: str, retriever: Any, llm: Any, builder: Callable[[Any, Any], Any]) -> Any:
+    """
+    Returns the cached chain for `name` over (retriever, llm), building it on first use.
+
+    Args:
+        name (str): A label distinguishing different chain types over the same objects.
+        retriever: The retriever the chain is built around (may be None).
+        llm: The language model the chain is built around.
+        builder: Called as `builder(retriever, llm)` to build the chain on a cache miss.
+
+    Returns:
+        The compiled chain.
+    """
+    key = (name, id(retriever), id(llm))
+    entry = _CHAINS.get(key)
+    if entry is not None and entry[0] is retriever and entry[1] is llm:
+        _CHAINS.move_to_end(key)
+        return entry[2]
+
+    print(f"Building '{name}' chain (not cached yet).")
+    chain = builder(retriever, llm)
+    _CHAINS[key] = (retriever, llm, chain)
+    if len(_CHAINS) > MAX_CACHED_CHAINS:
+        _CHAINS.popitem(last=False)
+    return chain
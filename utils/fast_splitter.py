@@ -0,0 +1,88 @@
+# utils/fast_splitter.py - NumPy-Vectorized Character Text Splitter
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# `RecursiveCharacterTextSplitter` splits text by recursing through its separators and
+# re-merging the pieces in Python, touching every paragraph, line and word. On
+# megabyte-sized documents the child-splitting stage is dominated by that interpreter
+# overhead.
+#
+# `FastCharSplitter` finds every candidate break (paragraph end, line end, space) in a
+# single vectorized pass over the text, then picks each chunk's end with one
+# `searchsorted` per separator level - a handful of NumPy calls per chunk instead of
+# Python work per word. Break preference matches the default recursive splitter:
+# paragraph, then line, then word, then a hard cut at `chunk_size`.
+# ======================================================================================
+
+from typing import List
+
+import numpy as np
+from langchain.text_splitter import TextSplitter
+
+_NEWLINE = ord("\n")
+_SPACE = ord(" ")
+
+
+class FastCharSplitter(TextSplitter):
+    """A drop-in `TextSplitter` for the default separators ("\\n\\n", "\\n", " ")."""
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        Splits text into chunks of at most `chunk_size` characters, overlapping by
+        about `chunk_overlap` characters (rounded to a word boundary).
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            List[str]: The chunks, stripped of surrounding whitespace.
+        """
+        n = len(text)
+        if n <= self._chunk_size:
+            return [text.strip()] if text.strip() else []
+
+        # UTF-32 gives exactly one array element per character, so array offsets are
+        # string offsets. Each array below holds the offsets just after a separator.
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        is_newline = codes == _NEWLINE
+        line_breaks = np.flatnonzero(is_newline) + 1
+        paragraph_breaks = np.flatnonzero(is_newline[:-1] & is_newline[1:]) + 2
+        word_breaks = np.flatnonzero(codes == _SPACE) + 1
+        levels = (paragraph_breaks, line_breaks, word_breaks)
+
+        chunks: List[str] = []
+        start = 0
+        while start < n:
+            limit = start + self._chunk_size
+            end = n if limit >= n else self._best_break(levels, start, limit)
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= n:
+                break
+            start = self._next_start(word_breaks, start, end)
+        return chunks
+
+    def _best_break(self, levels, start: int, limit: int) -> int:
+        """
+        Returns the chunk end: the last break of the coarsest separator that still
+        yields at least half a chunk, else the last word break, else `limit`.
+        """
+        min_end = start + self._chunk_size // 2
+        for i, breaks in enumerate(levels):
+            j = int(np.searchsorted(breaks, limit, side="right")) - 1
+            if j >= 0:
+                candidate = int(breaks[j])
+                is_last_level = i == len(levels) - 1
+                if candidate > min_end or (is_last_level and candidate > start):
+                    return candidate
+        return limit
+
+    def _next_start(self, word_breaks: np.ndarray, start: int, end: int) -> int:
+        """Starts the next chunk `chunk_overlap` characters back, at a word boundary."""
+        target = max(end - self._chunk_overlap, start + 1)
+        j = int(np.searchsorted(word_breaks, target, side="left"))
+        if j < len(word_breaks) and word_breaks[j] < end:
+            return int(word_breaks[j])
+        return target if target < end else end
@@ -0,0 +1,74 @@
+# utils/full_docs_store.py - Disk-Backed Store for Full Document Text
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# The per-document tools (summarizer, entity extraction, previewer) need the full,
+# un-chunked text of every uploaded file. Keeping that text in `st.session_state`
+# means every user session holds its own in-memory copy of every document, and
+# Streamlit copies session state around on reruns.
+#
+# Instead, each document's text is written once to `<FULL_DOCS_DIR>/<digest>.txt`,
+# keyed by a BLAKE2b hash of its content, and the session only keeps the small keys.
+# Reads come straight from the OS page cache, and identical uploads from different
+# sessions share a single file.
+# ======================================================================================
+
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from config import settings
+
+
+class FullDocsStore:
+    """A content-addressed, write-once store of document texts on disk."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path_for(self, key: str) -> Path:
+        return self.root / f"{key}.txt"
+
+    def put(self, text: str) -> str:
+        """
+        Stores a document's text (if not stored already) and returns its key.
+
+        Args:
+            text (str): The full document text.
+
+        Returns:
+            str: The key to pass to `get_text` / `get_document`.
+        """
+        data = text.encode("utf-8")
+        key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = self._path_for(key)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Unique per writer, so threads storing the same text never share a temp file.
+            tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def get_text(self, key: str) -> Optional[str]:
+        """Returns the stored text for `key`, or None if it is missing."""
+        try:
+            # Decoded from raw bytes (no newline translation), mirroring the binary write.
+            return self._path_for(key).read_bytes().decode("utf-8")
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"WARNING: Full document '{key}' could not be read: {e}")
+            return None
+
+    def get_document(self, key: str, source: str) -> Optional[Document]:
+        """Rebuilds the full LangChain `Document` for `key`, tagged with its source name."""
+        text = self.get_text(key)
+        return Document(page_content=text, metadata={"source": source}) if text is not None else None
+
+
+FULL_DOCS = FullDocsStore(settings.FULL_DOCS_DIR)
@@ -0,0 +1,119 @@
+# utils/llm_clients.py - Shared, Lazily-Created LLM Clients
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# Constructing a `ChatGoogleGenerativeAI` or `ChatOpenAI` object re-creates its HTTP
+# client, re-reads configuration and throws away any open keep-alive connections. The
+# agents used to do this on every single call. These factories cache one client per
+# configuration at module scope, so repeated calls reuse the same warm client.
+#
+# All OpenAI clients additionally share one pair of pooled `httpx` clients (HTTP/2,
+# keep-alive), so even differently-configured models (router vs. report) reuse the
+# same TCP/TLS connections. `warm_up_clients` opens those connections at app start,
+# before the first user query has to pay for the handshakes.
+#
+# Importing this module also installs a global, SQLite-backed LLM cache, so any model
+# call whose exact prompt has been seen before is answered locally.
+# ======================================================================================
+
+import os
+import threading
+from functools import lru_cache
+from typing import Optional
+
+import httpx
+from langchain_community.cache import SQLiteCache
+from langchain_core.globals import set_llm_cache
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import ChatOpenAI
+
+from config import settings
+from utils.async_utils import run_async
+
+try:
+    os.makedirs(os.path.dirname(settings.LLM_CACHE_PATH) or ".", exist_ok=True)
+    set_llm_cache(SQLiteCache(database_path=settings.LLM_CACHE_PATH))
+except Exception as e:
+    print(f"WARNING: Could not enable the LLM cache at '{settings.LLM_CACHE_PATH}': {e}")
+
+# --- Shared HTTP Connection Pools (OpenAI) ---
+# The async client is only ever used on the shared agent event loop (see
+# utils/async_utils.py), which is what makes it safe to keep across requests.
+_HTTP_LIMITS = httpx.Limits(
+    max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+)
+_HTTP_CLIENT = httpx.Client(limits=_HTTP_LIMITS, http2=True)
+_ASYNC_HTTP_CLIENT = httpx.AsyncClient(limits=_HTTP_LIMITS, http2=True)
+
+
+@lru_cache(maxsize=8)
+def get_gemini(model: str, temperature: float) -> ChatGoogleGenerativeAI:
+    """Returns the shared Gemini client for the given model and temperature."""
+    print(f"Creating shared Gemini client: {model} (temperature={temperature})")
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=settings.GOOGLE_API_KEY,
+        temperature=temperature,
+        timeout=settings.RAG_CLIENT_TIMEOUT_MS / 1000,
+        max_retries=settings.LLM_MAX_RETRIES,
+    )
+
+
+@lru_cache(maxsize=8)
+def get_openai(model: str, temperature: float, max_tokens: Optional[int] = None) -> ChatOpenAI:
+    """Returns the shared OpenAI client for the given model, temperature and token limit."""
+    print(f"Creating shared OpenAI client: {model} (temperature={temperature}, max_tokens={max_tokens})")
+    return ChatOpenAI(
+        model=model,
+        openai_api_key=settings.OPENAI_API_KEY,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=settings.RAG_CLIENT_TIMEOUT_MS / 1000,
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=_HTTP_CLIENT,
+        http_async_client=_ASYNC_HTTP_CLIENT,
+    )
+
+
+# ======================================================================================
+# --- Startup Warm-Up ---
+# ======================================================================================
+
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+async def _awarm_up():
+    """Sends one uncached 1-token completion through the shared OpenAI connection pool."""
+    try:
+        # `cache=False` makes sure the request really reaches the network instead of
+        # being answered by the global LLM cache.
+        ping = ChatOpenAI(
+            model=settings.ROUTER_MODEL,
+            openai_api_key=settings.OPENAI_API_KEY,
+            max_tokens=1,
+            cache=False,
+            http_client=_HTTP_CLIENT,
+            http_async_client=_ASYNC_HTTP_CLIENT,
+        )
+        await ping.ainvoke("ping")
+        print("OpenAI connection pool warmed up.")
+    except Exception as e:
+        print(f"WARNING: OpenAI warm-up failed: {e}")
+
+
+def warm_up_clients():
+    """
+    Warms up the shared connection pool once per process, in the background, so the
+    app start-up is not delayed. Safe to call on every Streamlit rerun.
+    """
+    global _warm_up_started
+    if not (settings.WARM_UP_LLM_CLIENTS and settings.OPENAI_API_KEY):
+        return
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=run_async, args=(_awarm_up(),), name="llm-warm-up", daemon=True).start()
@@ -0,0 +1,106 @@
+# utils/rate_limiter.py - Proactive Token-Bucket Throttling for LLM API Calls
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# Gemini and OpenAI both enforce requests-per-minute (RPM) and tokens-per-minute (TPM)
+# limits. Rather than firing requests blindly and backing off on HTTP 429 errors, the
+# agents acquire capacity from a token bucket *before* each call. Each bucket tracks two
+# budgets (requests and tokens) that refill continuously at `rpm/60` and `tpm/60` per
+# second, so bursts are smoothed out instead of triggering retry storms.
+# ======================================================================================
+
+import asyncio
+import threading
+import time
+from functools import lru_cache
+
+import tiktoken
+
+from config import settings
+
+# Rough allowance added to every request for the prompt template and the model's reply.
+RESPONSE_TOKEN_ALLOWANCE = 500
+
+
+@lru_cache(maxsize=1024)
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the token count of a piece of text. Results are cached, so a chunk
+    that is sent more than once is only tokenized the first time.
+
+    Args:
+        text (str): The text that will be sent to the model.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    try:
+        return len(tiktoken.encoding_for_model("gpt-4").encode(text))
+    except Exception:
+        # Fallback to the usual ~4 characters per token heuristic.
+        return len(text) // 4
+
+
+class AsyncTokenBucket:
+    """
+    A dual token bucket (requests + tokens) that can be awaited from coroutines or
+    blocked on from synchronous code.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._available_requests = float(rpm)
+        self._available_tokens = float(tpm)
+        self._last_refill = time.monotonic()
+        # A thread lock (not an asyncio.Lock) so the bucket can be shared between the
+        # agent event loop and synchronous callers on Streamlit's script threads.
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Tops up both budgets according to the time elapsed since the last refill."""
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._available_requests = min(self.rpm, self._available_requests + elapsed * self.rpm / 60.0)
+        self._available_tokens = min(self.tpm, self._available_tokens + elapsed * self.tpm / 60.0)
+
+    def _try_consume(self, estimated_tokens: int) -> float:
+        """
+        Consumes capacity if enough is available.
+
+        Returns:
+            float: 0.0 if the capacity was consumed, otherwise the number of seconds
+            to wait before trying again.
+        """
+        # A single request can never need more than the whole bucket.
+        tokens = min(float(estimated_tokens), float(self.tpm))
+        with self._lock:
+            self._refill()
+            if self._available_requests >= 1 and self._available_tokens >= tokens:
+                self._available_requests -= 1
+                self._available_tokens -= tokens
+                return 0.0
+            request_wait = max(0.0, (1 - self._available_requests) * 60.0 / self.rpm)
+            token_wait = max(0.0, (tokens - self._available_tokens) * 60.0 / self.tpm)
+            return max(request_wait, token_wait)
+
+    async def acquire(self, estimated_tokens: int = 1):
+        """Waits (without blocking the event loop) until the request can be sent."""
+        while (wait := self._try_consume(estimated_tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, estimated_tokens: int = 1):
+        """Blocking variant of `acquire` for synchronous call sites."""
+        while (wait := self._try_consume(estimated_tokens)) > 0:
+            time.sleep(wait)
+
+
+# ======================================================================================
+# SHARED BUCKETS
+# One bucket per provider, shared by every agent in the process.
+# ======================================================================================
+
+gemini_bucket = AsyncTokenBucket(rpm=settings.GEMINI_RPM, tpm=settings.GEMINI_TPM)
+openai_bucket = AsyncTokenBucket(rpm=settings.OPENAI_RPM, tpm=settings.OPENAI_TPM)
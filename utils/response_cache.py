@@ -0,0 +1,204 @@
+# utils/response_cache.py - Persistent, Content-Addressed Cache for Agent Responses
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# Agents re-run the retriever and the LLM on every invocation, even when the exact same
+# question is asked against the exact same documents (very common on reruns and demos).
+# This module caches finished responses keyed by SHA-256(query | corpus fingerprint |
+# model name), so a repeated request is answered instantly and at zero API cost.
+#
+# The cache is an in-memory LRU that is mirrored to an append-only JSONL file, so it
+# survives application restarts. Entries may carry an expiry time (`expires_at`, a Unix
+# timestamp); expired entries are treated as misses and dropped on the next load.
+# ======================================================================================
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+from cachetools import LRUCache
+from langchain_core.documents import Document
+
+from config import settings
+
+
+def _encode(value: Any) -> Any:
+    """Recursively converts a response into JSON-serializable data."""
+    if isinstance(value, Document):
+        return {"__document__": True, "page_content": value.page_content, "metadata": value.metadata}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value: Any) -> Any:
+    """Reverses `_encode`, rebuilding LangChain `Document` objects."""
+    if isinstance(value, dict):
+        if value.get("__document__"):
+            return Document(page_content=value["page_content"], metadata=value["metadata"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def corpus_fingerprint(docs: Iterable[Document]) -> str:
+    """
+    Hashes the content of an indexed corpus. Each chunk contributes a digest of its
+    source name and text; the digests are sorted, so upload order does not matter.
+
+    Args:
+        docs (Iterable[Document]): The indexed chunks.
+
+    Returns:
+        str: A hex SHA-256 digest of the corpus.
+    """
+    chunk_digests = sorted(
+        hashlib.sha256(f"{doc.metadata.get('source', '')}\0{doc.page_content}".encode()).digest() for doc in docs
+    )
+    return hashlib.sha256(b"".join(chunk_digests)).hexdigest()
+
+
+def attach_corpus_fingerprint(vectorstore, fingerprint: str):
+    """
+    Stores a corpus fingerprint on a vector store when its index is built or loaded,
+    together with the index size it was computed for, so queries can read it without
+    rehashing.
+
+    Args:
+        vectorstore: The LangChain vector store.
+        fingerprint (str): The corpus digest, e.g. from `corpus_fingerprint`.
+    """
+    vectorstore.corpus_fingerprint = fingerprint
+    vectorstore.corpus_fingerprint_size = getattr(getattr(vectorstore, "index", None), "ntotal", 0)
+
+
+def retriever_corpus_fingerprint(retriever) -> str:
+    """
+    Returns the fingerprint of the corpus behind a retriever, so cached answers are
+    invalidated automatically when the indexed documents change.
+
+    The fingerprint is normally attached when the index is built or loaded (see
+    `attach_corpus_fingerprint`). Stores without one, or whose index has grown since,
+    fall back to hashing the ids of their chunks: every added chunk gets a new id, so
+    changed content never reuses a cached answer, at the cost of misses across rebuilds.
+
+    Args:
+        retriever: A LangChain retriever exposing a `vectorstore` attribute.
+
+    Returns:
+        str: A hex SHA-256 digest identifying the indexed chunks.
+    """
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None:
+        return corpus_fingerprint([])
+    index_size = getattr(getattr(vectorstore, "index", None), "ntotal", 0)
+    if getattr(vectorstore, "corpus_fingerprint_size", None) != index_size:
+        chunk_ids = sorted(map(str, getattr(vectorstore, "index_to_docstore_id", {}).values()))
+        attach_corpus_fingerprint(vectorstore, hashlib.sha256("\n".join(chunk_ids).encode()).hexdigest())
+    return vectorstore.corpus_fingerprint
+
+
+class ResponseCache:
+    """An LRU cache of agent responses, persisted to a JSONL file."""
+
+    def __init__(self, path: str, maxsize: int = 1024):
+        self.path = path
+        self.cache = LRUCache(maxsize=maxsize)
+        self.expiry = {}
+        # Shared by every session's script thread and the agent loop thread; the LRU,
+        # the expiry map and the JSONL file are only touched under this lock.
+        self._lock = threading.Lock()
+        self._load_from_disk()
+
+    @staticmethod
+    def make_key(query: str, corpus_fingerprint: str, model_name: str) -> str:
+        """Builds the content-addressed cache key for a request."""
+        return hashlib.sha256(f"{query}|{corpus_fingerprint}|{model_name}".encode()).hexdigest()
+
+    def _load_from_disk(self):
+        """Replays the JSONL file into memory, compacting it if it has grown too large."""
+        if not os.path.exists(self.path):
+            return
+        line_count = 0
+        now = time.time()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line_count += 1
+                    entry = json.loads(line)
+                    expires_at = entry.get("expires_at")
+                    if expires_at is not None and expires_at <= now:
+                        continue
+                    self.cache[entry["key"]] = entry["value"]
+                    if expires_at is not None:
+                        self.expiry[entry["key"]] = expires_at
+            print(f"Response cache loaded {len(self.cache)} entries from '{self.path}'.")
+        except Exception as e:
+            print(f"WARNING: Could not load response cache from '{self.path}': {e}")
+            return
+        if line_count > 2 * self.cache.maxsize:
+            self._rewrite_file()
+
+    def _rewrite_file(self):
+        """Rewrites the JSONL file so it only contains the entries still in the LRU."""
+        try:
+            with self._lock, open(self.path, "w", encoding="utf-8") as f:
+                for key, value in self.cache.items():
+                    f.write(json.dumps(self._entry(key, value), default=str) + "\n")
+        except Exception as e:
+            print(f"WARNING: Could not compact response cache: {e}")
+
+    def _entry(self, key: str, value: Any) -> dict:
+        """Builds the JSONL record for an entry, including its expiry if it has one."""
+        entry = {"key": key, "value": value}
+        if key in self.expiry:
+            entry["expires_at"] = self.expiry[key]
+        return entry
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached response for `key`, or None on a miss (or if it expired)."""
+        with self._lock:
+            expires_at = self.expiry.get(key)
+            if expires_at is not None and expires_at <= time.time():
+                self.cache.pop(key, None)
+                self.expiry.pop(key, None)
+                return None
+            value = self.cache.get(key)
+        return _decode(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """
+        Stores a response in memory and appends it to the JSONL file.
+
+        Args:
+            key (str): The cache key (see `make_key`).
+            value: The response to store.
+            ttl_seconds (float, optional): How long the entry stays valid. None means forever.
+        """
+        encoded = _encode(value)
+        with self._lock:
+            self.cache[key] = encoded
+            if ttl_seconds is not None:
+                self.expiry[key] = time.time() + ttl_seconds
+            else:
+                self.expiry.pop(key, None)
+            if len(self.expiry) > self.cache.maxsize:
+                # Forget expiry times of entries the LRU has already evicted.
+                self.expiry = {k: t for k, t in self.expiry.items() if k in self.cache}
+            line = json.dumps(self._entry(key, encoded), default=str) + "\n"
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except Exception as e:
+                print(f"WARNING: Could not persist response cache entry: {e}")
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_PATH, maxsize=settings.RESPONSE_CACHE_SIZE)
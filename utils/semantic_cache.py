@@ -0,0 +1,66 @@
+# utils/semantic_cache.py - Embedding-Similarity Cache for Short, Repetitive LLM Calls
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# An exact-match cache only helps when a query is repeated byte for byte. Users tend to
+# rephrase ("summarize this doc" / "give me a summary of this document"), and for
+# classification-style calls such as routing, a paraphrase deserves the same answer.
+#
+# `SemanticCache` keeps the normalized embeddings of past queries in a matrix. A lookup
+# is one matrix-vector product; if the best cosine similarity clears the threshold, the
+# stored value is returned and the LLM call is skipped entirely.
+# ======================================================================================
+
+import threading
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """A small in-memory cache that matches queries by embedding similarity."""
+
+    def __init__(self, embed_fn: Callable[[], Any], threshold: float = 0.98, maxsize: int = 512):
+        """
+        Args:
+            embed_fn: Returns the LangChain `Embeddings` object to use. It is called
+                lazily, so the embedding model is only loaded on first use.
+            threshold (float): Minimum cosine similarity for a hit.
+            maxsize (int): Maximum number of entries; the oldest are evicted first.
+        """
+        self._embed_fn = embed_fn
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._vectors: Optional[np.ndarray] = None
+        self._values: List[Any] = []
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> np.ndarray:
+        """Embeds and L2-normalizes a query, so a dot product is a cosine similarity."""
+        vector = np.asarray(self._embed_fn().embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, text: str) -> Optional[Any]:
+        """Returns the value stored for the most similar past query, or None on a miss."""
+        if self._vectors is None:
+            return None
+        vector = self._embed(text)
+        with self._lock:
+            similarities = self._vectors @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                print(f"Semantic cache hit (similarity={similarities[best]:.3f}).")
+                return self._values[best]
+        return None
+
+    def add(self, text: str, value: Any):
+        """Stores a value for a query, evicting the oldest entry when full."""
+        vector = self._embed(text)[np.newaxis, :]
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = vector
+            else:
+                self._vectors = np.vstack([self._vectors, vector])[-self.maxsize:]
+            self._values = (self._values + [value])[-self.maxsize:]
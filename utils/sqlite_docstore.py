@@ -0,0 +1,113 @@
+# utils/sqlite_docstore.py - SQLite-Backed Parent Document Store
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# The Parent Document Retriever keeps every full parent document in its docstore.
+# With an `InMemoryStore` that whole corpus stayed on the Python heap for the life of
+# the process, and every `build_index` call re-pickled the entire mapping to disk.
+#
+# `SQLiteDocStore` implements the same `BaseStore[str, Document]` interface over a
+# single SQLite table. Lookups are keyed reads from disk, RAM use stays flat as the
+# corpus grows, and each `mset` commits only the new documents in one transaction -
+# there is no separate save step.
+#
+# Documents are stored as JSON (`page_content` + `metadata`), never pickled, and
+# compressed with zstd (level 3, the fast tier) - prose shrinks several-fold, and
+# only the parents a query actually returns are ever decompressed. Without the
+# optional `zstandard` package the stdlib `zlib` is used instead. Each value starts
+# with a one-byte codec tag, so either kind of row (and legacy plain-text JSON rows)
+# can always be read back.
+# ======================================================================================
+
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_core.stores import BaseStore
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_CODEC_ZSTD = b"\x01"
+_CODEC_ZLIB = b"\x02"
+
+
+class SQLiteDocStore(BaseStore[str, Document]):
+    """A persistent key-value store of LangChain `Document`s in one SQLite file."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The SQLite database file (created if it does not exist).
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The store is shared by every Streamlit session thread; a lock serializes access.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    @staticmethod
+    def _dumps(doc: Document) -> bytes:
+        # The one-shot module functions are used because compressor objects are not thread-safe.
+        data = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, default=str).encode("utf-8")
+        if zstandard is not None:
+            return _CODEC_ZSTD + zstandard.compress(data, 3)
+        return _CODEC_ZLIB + zlib.compress(data, 3)
+
+    @staticmethod
+    def _loads(value: Union[bytes, str]) -> Document:
+        if isinstance(value, str):
+            data = value
+        elif value[:1] == _CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("This document was compressed with zstd; install the 'zstandard' package.")
+            data = zstandard.decompress(value[1:])
+        else:
+            data = zlib.decompress(value[1:])
+        data = json.loads(data)
+        return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Document]]:
+        """Returns the documents for `keys`, with None for keys that are not stored."""
+        if not keys:
+            return []
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key, value FROM documents WHERE key IN ({placeholders})", list(keys)).fetchall()
+        found = {key: value for key, value in rows}
+        return [self._loads(found[key]) if key in found else None for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, Document]]) -> None:
+        """Stores (or replaces) documents in a single transaction."""
+        rows = [(key, self._dumps(doc)) for key, doc in key_value_pairs]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO documents (key, value) VALUES (?, ?)", rows)
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        """Deletes the given keys (missing keys are ignored)."""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM documents WHERE key = ?", [(key,) for key in keys])
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        """Yields every stored key, optionally only those starting with `prefix`."""
+        with self._lock:
+            keys = [row[0] for row in self._conn.execute("SELECT key FROM documents")]
+        for key in keys:
+            if prefix is None or key.startswith(prefix):
+                yield key
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
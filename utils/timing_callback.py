@@ -0,0 +1,121 @@
+# utils/timing_callback.py - Per-Stage Latency Logging for LCEL Chains
+
+# ======================================================================================
+#  FILE OVERVIEW
+# ======================================================================================
+# A slow answer can come from the retriever (embedding + FAISS search), the question
+# rephrasing call or the answer LLM, and without a profiler there was no way to tell
+# which. `TimingCallbackHandler` is passed in a chain's `RunnableConfig`; it measures
+# every retriever and LLM run inside the chain and prints one summary line per request:
+#
+#     [timing] qa_chain: t_search_ms=42 t_rephrase_ms=0 t_llm_ms=1830 total_ms=1901
+#
+# Stages that run in parallel are each counted in full, so they can add up to more
+# than `total_ms`.
+# ======================================================================================
+
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableConfig
+
+from config import settings
+
+
+class TimingCallbackHandler(BaseCallbackHandler):
+    """Accumulates retriever / LLM timings for one chain invocation and logs them."""
+
+    # Runs on the event loop thread instead of an executor, so timings are not skewed.
+    run_inline = True
+
+    def __init__(self, run_name: str, answer_tag: Optional[str] = None):
+        """
+        Args:
+            run_name (str): The label printed with the summary line.
+            answer_tag (str, optional): LLM runs carrying this tag are counted as the
+                answer step (`t_llm_ms`); all other LLM runs count as `t_rephrase_ms`.
+                When None, every LLM run counts as `t_llm_ms`.
+        """
+        self.run_name = run_name
+        self.answer_tag = answer_tag
+        self.totals_ms: Dict[str, float] = defaultdict(float)
+        self._starts: Dict[UUID, tuple] = {}
+
+    def _start(self, run_id: UUID, stage: str):
+        self._starts[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID):
+        if run_id in self._starts:
+            stage, started = self._starts.pop(run_id)
+            self.totals_ms[stage] += (time.perf_counter() - started) * 1000
+
+    def _llm_stage(self, tags: Optional[List[str]]) -> str:
+        if self.answer_tag is None or self.answer_tag in (tags or []):
+            return "t_llm_ms"
+        return "t_rephrase_ms"
+
+    # --- Chain (root run = whole request) ---
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if parent_run_id is None:
+            self._start(run_id, "total_ms")
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if parent_run_id is None:
+            self._end(run_id)
+            self.log()
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if parent_run_id is None:
+            self._end(run_id)
+            self.log()
+
+    # --- Retriever (query embedding + vector search) ---
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "t_search_ms")
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    # --- LLM calls ---
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs: Any):
+        self._start(run_id, self._llm_stage(tags))
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs: Any):
+        self._start(run_id, self._llm_stage(tags))
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def log(self):
+        """Prints the accumulated timings as a single line."""
+        stages = ("t_search_ms", "t_rephrase_ms", "t_llm_ms", "total_ms")
+        summary = " ".join(f"{stage}={self.totals_ms.get(stage, 0.0):.0f}" for stage in stages)
+        print(f"[timing] {self.run_name}: {summary}")
+
+
+def make_run_config(run_name: str, answer_tag: Optional[str] = None) -> RunnableConfig:
+    """
+    Builds the `RunnableConfig` used for every agent chain call: a named run, bounded
+    parallelism for internal `RunnableParallel` / batch steps, and a fresh timing handler.
+
+    Args:
+        run_name (str): The name of the run (shown in traces and timing logs).
+        answer_tag (str, optional): See `TimingCallbackHandler`.
+
+    Returns:
+        RunnableConfig: The config to pass to `invoke` / `ainvoke` / `astream`.
+    """
+    return {
+        "run_name": run_name,
+        "max_concurrency": settings.RAG_MAX_CONCURRENCY,
+        "callbacks": [TimingCallbackHandler(run_name, answer_tag)],
+    }